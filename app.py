@@ -2,18 +2,33 @@
 import os
 import mimetypes
 import json
-import zipfile
-import io
+import base64
 import threading
+import time
+import unicodedata
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from flask import Flask, render_template, send_file, jsonify, request
+from urllib.parse import quote
+from datetime import datetime, timedelta
+from flask import Flask, Response, render_template, send_file, jsonify, request
 from werkzeug.utils import safe_join
-from PIL import Image
-from PIL.PngImagePlugin import PngInfo
-
-# Import database module
+# Import database, thumbnail store and metadata modules
 import database
+import thumbnails
+import image_metadata
+import backfill
+import watcher
+import scanner
+import similarity
+import zip_stream
+import compression
+import leader
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 app = Flask(__name__)
 
@@ -22,368 +37,600 @@ app = Flask(__name__)
 default_output_dir = os.path.join(os.path.dirname(__file__), 'preview') if os.path.exists(os.path.join(os.path.dirname(__file__), 'preview')) else '/ComfyUI/output'
 OUTPUT_DIR = os.environ.get('COMFYUI_OUTPUT_DIR', default_output_dir)
 GALLERY_PORT = int(os.environ.get('GALLERY_PORT', 3002))
-THUMBNAIL_DIR = os.path.join(os.path.dirname(__file__), 'thumbnails')
-THUMBNAIL_SIZE = (300, 300)
+THUMBNAIL_DIR = os.environ.get('GALLERY_THUMBNAIL_DIR', os.path.join(os.path.dirname(__file__), 'thumbnails'))
+THUMBNAIL_WORKERS = int(os.environ.get('GALLERY_THUMBNAIL_WORKERS', thumbnails.THUMBNAIL_WORKERS))
+THUMBNAIL_QUEUE_DEPTH = int(os.environ.get('GALLERY_THUMBNAIL_QUEUE_DEPTH', thumbnails.THUMBNAIL_QUEUE_DEPTH))
+THUMBNAIL_FORMATS = os.environ.get('GALLERY_THUMBNAIL_FORMATS', ','.join(thumbnails.FORMAT_PREFERENCE))
+THUMBNAIL_TIMEOUT = 30  # Seconds a /thumbnail request waits for generation
+BACKFILL_WORKERS = int(os.environ.get('GALLERY_BACKFILL_WORKERS', 0)) or None
+BACKFILL_REQUEST_POLL = 2  # Seconds between leader checks for backfill requests from other workers
+EVENT_KEEPALIVE = 15  # Seconds between keep-alive comments on event streams
+PAGE_SIZE = 200  # Default page size when a cursor is given without a limit
+MAX_PAGE_SIZE = 1000
+METADATA_BATCH_SIZE = 500
+SEARCH_PAGE_SIZE = 50
+SIMILAR_RADIUS = 10  # Hamming distance (of 64 bits) for /api/similar
+DUPLICATE_RADIUS = 6  # Tighter radius for clustering a folder
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # For ?v= URLs, which change with the file
+COMPRESS_MIN_SIZE = int(os.environ.get('GALLERY_COMPRESS_MIN_SIZE', compression.MIN_SIZE))
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+# nginx internal locations aliasing the output and thumbnail directories; when
+# set, file bodies are handed to nginx with X-Accel-Redirect instead of sent here
+ACCEL_OUTPUT = os.environ.get('GALLERY_ACCEL_OUTPUT', '')
+ACCEL_THUMBNAILS = os.environ.get('GALLERY_ACCEL_THUMBNAILS', '')
+# Default direction per sort: newest, largest and favorites first; names A-Z
+SORT_DESCENDING = {'mtime': True, 'name': False, 'size': True, 'favorite': True}
+WATCH_MODE = os.environ.get('GALLERY_WATCH', 'auto')  # auto, inotify, poll or off
+WATCH_INTERVAL = float(os.environ.get('GALLERY_WATCH_INTERVAL', watcher.POLL_INTERVAL))
 
 # Supported image formats
-IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
-
-# Cache for directory tree
-directory_tree_cache = None
-directory_tree_cache_time = None
-CACHE_DURATION = 300  # Cache for 5 minutes
+IMAGE_EXTENSIONS = scanner.IMAGE_EXTENSIONS
+
+# Per-folder tree cache: folder path -> (st_mtime_ns, subfolder names, image count)
+tree_cache = {}
+tree_cache_lock = threading.Lock()
+tree_pool = ThreadPoolExecutor(max_workers=scanner.SCAN_WORKERS, thread_name_prefix='tree')
+
+# Initial sync progress; the server answers requests from the existing index meanwhile
+SYNC_PENDING_STATES = ('starting', 'scanning', 'syncing')
+startup_status = {
+    'state': 'starting',
+    'files': 0,
+    'added': 0,
+    'updated': 0,
+    'deleted': 0,
+    'started_at': None,
+    'finished_at': None,
+    'error': None
+}
+startup_lock = threading.Lock()
+deferred_changes = []  # Watcher batches that arrive before the initial sync finishes
 
 # Create thumbnail directory if it doesn't exist
-os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+thumbnails.set_thumbnail_dir(THUMBNAIL_DIR)
+thumbnails.set_worker_limits(THUMBNAIL_WORKERS, THUMBNAIL_QUEUE_DEPTH)
+thumbnails.set_format_preference([fmt.strip() for fmt in THUMBNAIL_FORMATS.split(',')])
+compression.set_min_size(COMPRESS_MIN_SIZE)
 
-def get_images(directory):
-    """Recursively get all images from the output directory."""
-    images = []
+def get_images(directory, progress=None):
+    """Recursively get all images from the output directory.
 
+    progress, if given, is called with the running count as directories are scanned.
+    """
     if not os.path.exists(directory):
-        return images
-
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if Path(file).suffix.lower() in IMAGE_EXTENSIONS:
-                full_path = os.path.join(root, file)
-                rel_path = os.path.relpath(full_path, directory)
-
-                stat = os.stat(full_path)
-                images.append({
-                    'path': rel_path,
-                    'name': file,
-                    'size': stat.st_size,
-                    'modified': stat.st_mtime,
-                    'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-
-    # Sort by modification time (newest first)
-    images.sort(key=lambda x: x['modified'], reverse=True)
-    return images
-
-def get_items(directory, current_path=''):
-    """Get folders and images in the current directory (non-recursive)."""
-    items = {'folders': [], 'images': []}
-
-    full_path = safe_join(directory, current_path) if current_path else directory
-
-    if not full_path or not os.path.exists(full_path):
-        return items
-
-    # Get folders
-    try:
-        entries = os.listdir(full_path)
-        for entry in entries:
-            entry_path = os.path.join(full_path, entry)
-            rel_path = os.path.join(current_path, entry) if current_path else entry
-
-            if os.path.isdir(entry_path):
-                stat = os.stat(entry_path)
-                items['folders'].append({
-                    'path': rel_path,
-                    'name': entry,
-                    'modified': stat.st_mtime,
-                    'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-            elif os.path.isfile(entry_path) and Path(entry).suffix.lower() in IMAGE_EXTENSIONS:
-                stat = os.stat(entry_path)
-                items['images'].append({
-                    'path': rel_path,
-                    'name': entry,
-                    'size': stat.st_size,
-                    'modified': stat.st_mtime,
-                    'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-                })
-    except Exception as e:
-        print(f"Error reading directory: {e}")
-
-    # Sort folders and images by name
-    items['folders'].sort(key=lambda x: x['name'].lower())
-    items['images'].sort(key=lambda x: x['modified'], reverse=True)
-
-    return items
-
-def parse_workflow_summary(workflow):
-    """Parse ComfyUI workflow and extract ALL nodes with their information."""
-    summary = {
-        'nodes': []  # List of all nodes with their details
-    }
-
-    if not workflow or not isinstance(workflow, dict):
-        return summary
-
-    try:
-        # Detect format: API format (prompt) vs UI format (workflow)
-        # API format: top-level keys are node IDs, each has class_type
-        # UI format: has 'nodes' key with list of nodes
-
-        if 'nodes' in workflow and isinstance(workflow['nodes'], list):
-            # UI format - has 'nodes' array
-            for node in workflow['nodes']:
-                if isinstance(node, dict):
-                    node_type = node.get('type', 'Unknown')
-                    node_id = node.get('id', 'N/A')
-                    widgets_values = node.get('widgets_values', [])
-
-                    # Skip Note nodes
-                    if node_type in ['Note', 'NoteNode', 'MarkdownNote', 'PrimitiveNode']:
-                        continue
-
-                    # Create node entry
-                    node_entry = {
-                        'id': node_id,
-                        'type': node_type,
-                        'title': node.get('title', node_type),
-                        'params': {}
-                    }
-
-                    # Add widget values as parameters
-                    if widgets_values:
-                        for i, value in enumerate(widgets_values):
-                            node_entry['params'][f'param_{i}'] = value
-
-                    summary['nodes'].append(node_entry)
-        else:
-            # API format (prompt) - top-level dict where each key is a node ID
-            for node_id, node_data in workflow.items():
-                if isinstance(node_data, dict) and 'class_type' in node_data:
-                    node_type = node_data.get('class_type', 'Unknown')
-                    inputs = node_data.get('inputs', {})
-
-                    # Create node entry
-                    node_entry = {
-                        'id': node_id,
-                        'type': node_type,
-                        'title': node_type,
-                        'params': {}
-                    }
-
-                    # Add all inputs as parameters
-                    for key, value in inputs.items():
-                        # Skip connection arrays (they link to other nodes)
-                        if isinstance(value, list) and len(value) == 2:
-                            continue
-                        node_entry['params'][key] = value
-
-                    summary['nodes'].append(node_entry)
-
-    except Exception as e:
-        print(f"Error parsing workflow summary: {e}")
-
-    return summary
-
-def get_image_metadata(file_path):
-    """Extract metadata from an image file."""
-    metadata = {
-        'format': None,
-        'size': {'width': 0, 'height': 0},
-        'mode': None,
-        'file_size': 0,
-        'exif': {},
-        'prompt': None,
-        'workflow': None,
-        'workflow_summary': None,
-        'parameters': {}
-    }
-
-    try:
-        if not os.path.exists(file_path):
-            return metadata
-
-        # Get file size
-        metadata['file_size'] = os.path.getsize(file_path)
-
-        # Open image and get basic info
-        with Image.open(file_path) as img:
-            metadata['format'] = img.format
-            metadata['size'] = {'width': img.width, 'height': img.height}
-            metadata['mode'] = img.mode
-
-            # Get PNG metadata (ComfyUI stores workflow here)
-            if img.format == 'PNG':
-                png_info = img.info
-                if 'prompt' in png_info:
-                    try:
-                        # Handle NaN, Infinity, -Infinity which are invalid JSON but may appear in ComfyUI metadata
-                        prompt_str = png_info['prompt']
-                        prompt_str = prompt_str.replace('NaN', 'null').replace('Infinity', 'null').replace('-Infinity', 'null')
-                        metadata['prompt'] = json.loads(prompt_str)
-                    except:
-                        metadata['prompt'] = png_info['prompt']
-
-                if 'workflow' in png_info:
-                    try:
-                        # Handle NaN, Infinity, -Infinity which are invalid JSON but may appear in ComfyUI metadata
-                        workflow_str = png_info['workflow']
-                        workflow_str = workflow_str.replace('NaN', 'null').replace('Infinity', 'null').replace('-Infinity', 'null')
-                        metadata['workflow'] = json.loads(workflow_str)
-                    except:
-                        metadata['workflow'] = png_info['workflow']
-
-                # Parse workflow summary from either prompt (API format) or workflow (UI format)
-                # Try prompt first (API format - has more detailed structure)
-                if metadata.get('prompt'):
-                    metadata['workflow_summary'] = parse_workflow_summary(metadata['prompt'])
-                # If no summary from prompt, try workflow
-                if not metadata.get('workflow_summary') and metadata.get('workflow'):
-                    metadata['workflow_summary'] = parse_workflow_summary(metadata['workflow'])
-
-                # Store all PNG text chunks
-                for key, value in png_info.items():
-                    if key not in ['prompt', 'workflow']:
-                        metadata['parameters'][key] = value
-
-            # Get EXIF data
-            if hasattr(img, '_getexif') and img._getexif():
-                exif_data = img._getexif()
-                if exif_data:
-                    metadata['exif'] = {str(k): str(v) for k, v in exif_data.items()}
-
-    except Exception as e:
-        metadata['error'] = str(e)
-
-    return metadata
-
-def build_directory_tree(directory, current_path=''):
-    """Build a hierarchical directory tree structure recursively."""
-    tree = []
-
-    full_path = safe_join(directory, current_path) if current_path else directory
-    if not full_path or not os.path.exists(full_path):
-        return tree
-
+        return []
+
+    # Sorted by modification time (newest first)
+    return [record.to_dict() for record in scanner.walk_files(directory, IMAGE_EXTENSIONS, progress=progress)]
+
+def refresh_folder_index(folder_path, full_path):
+    """Re-list a folder into the database if it changed since it was last listed."""
+    listed_mtime = os.stat(full_path).st_mtime_ns
+    if database.get_folder_listed_mtime(folder_path) == listed_mtime:
+        return
+
+    # Stat before listing: a change during the listing shows up as a new mtime
+    listing = scanner.scan_directory(OUTPUT_DIR, folder_path, IMAGE_EXTENSIONS, dir_mtimes=True)
+    database.save_folder_listing(folder_path, listed_mtime,
+                                 [record.to_dict() for record in listing.dirs],
+                                 [record.to_dict() for record in listing.files])
+
+def get_indexed_metadata(image_path, full_path, fields=None):
+    """Get metadata from the index, re-parsing only if the file has changed."""
+    return get_indexed_metadata_batch([(image_path, full_path, os.stat(full_path))], fields)[image_path]
+
+def get_indexed_metadata_batch(entries, fields=None):
+    """Get metadata for (image path, full path, stat) entries in one index query.
+
+    Files that are not indexed or have changed are parsed and indexed
+    together; fields selects the response fields (None for all).
+    """
+    results = database.get_metadata_batch(
+        [(image_path, stat.st_mtime, stat.st_size) for image_path, _, stat in entries], fields)
+
+    parsed = []
+    for image_path, full_path, stat in entries:
+        if image_path in results:
+            continue
+        metadata = image_metadata.get_image_metadata(full_path)
+        # Errors are usually files still being written; don't cache them
+        if 'error' not in metadata:
+            parsed.append((image_path, stat.st_mtime, stat.st_size, metadata))
+        results[image_path] = database.select_metadata_fields(metadata, fields)
+    database.save_metadata_batch(parsed)
+    return results
+
+def get_tree_node(folder_path):
+    """Summarize one folder, cached until the directory's own mtime changes."""
+    full_path = os.path.join(OUTPUT_DIR, folder_path) if folder_path else OUTPUT_DIR
+    mtime = os.stat(full_path).st_mtime_ns
+
+    with tree_cache_lock:
+        node = tree_cache.get(folder_path)
+    if node is not None and node[0] == mtime:
+        return node
+
+    subfolders, image_count = scanner.summarize_directory(OUTPUT_DIR, folder_path, IMAGE_EXTENSIONS)
+    node = (mtime, subfolders, image_count)
+    with tree_cache_lock:
+        tree_cache[folder_path] = node
+    return node
+
+def get_tree_level(folder_path=''):
+    """List one level of the folder tree with child and image counts."""
+    _, subfolders, _ = get_tree_node(folder_path)
+    paths = [os.path.join(folder_path, name) if folder_path else name for name in subfolders]
+
+    def summarize(path):
+        try:
+            return get_tree_node(path)
+        except OSError:
+            return None  # Removed since the parent was listed
+
+    level = []
+    for name, path, node in zip(subfolders, paths, tree_pool.map(summarize, paths)):
+        if node is None:
+            continue
+        level.append({
+            'name': name,
+            'path': path,
+            'type': 'folder',
+            'has_children': bool(node[1]),
+            'child_count': len(node[1]),
+            'image_count': node[2]
+        })
+    return level
+
+def invalidate_directory_tree(paths=None):
+    """Drop cached tree nodes for the given folders and their parents (all if None)."""
+    with tree_cache_lock:
+        if paths is None:
+            tree_cache.clear()
+            return
+        for path in paths:
+            prefix = os.path.join(path, '')
+            for cached in [p for p in tree_cache if p.startswith(prefix)]:
+                del tree_cache[cached]
+            tree_cache.pop(path, None)
+            tree_cache.pop(os.path.dirname(path), None)
+
+def get_file_record(image_path):
+    """Build the file record get_images() would produce for one image, or None."""
+    full_path = os.path.join(OUTPUT_DIR, image_path)
     try:
-        entries = os.listdir(full_path)
-        folders = []
-
-        for entry in entries:
-            entry_path = os.path.join(full_path, entry)
-            if os.path.isdir(entry_path):
-                rel_path = os.path.join(current_path, entry) if current_path else entry
-                folder_node = {
-                    'name': entry,
-                    'path': rel_path,
-                    'type': 'folder',
-                    'children': []
-                }
-                # Recursively get subfolders
-                folder_node['children'] = build_directory_tree(directory, rel_path)
-                folders.append(folder_node)
-
-        folders.sort(key=lambda x: x['name'].lower())
-        tree.extend(folders)
-
-    except Exception as e:
-        print(f"Error building tree: {e}")
-
-    return tree
-
-def get_cached_directory_tree(directory):
-    """Get directory tree with caching."""
-    global directory_tree_cache, directory_tree_cache_time
-
-    current_time = datetime.now().timestamp()
-
-    # Check if cache is valid
-    if (directory_tree_cache is not None and
-        directory_tree_cache_time is not None and
-        (current_time - directory_tree_cache_time) < CACHE_DURATION):
-        return directory_tree_cache
-
-    # Build new tree and cache it
-    tree = build_directory_tree(directory)
-    directory_tree_cache = tree
-    directory_tree_cache_time = current_time
-
-    return tree
-
-def generate_thumbnail(image_path, thumbnail_path):
-    """Generate a thumbnail for an image."""
+        stat = os.stat(full_path)
+    except OSError:
+        return None
+    return scanner.FileRecord(image_path, os.path.basename(image_path), stat.st_size, stat.st_mtime).to_dict()
+
+def apply_file_changes(changes):
+    """Apply a batch of filesystem changes from the watcher."""
+    if changes.rescan:
+        print("WARNING: Filesystem events were lost, running a full sync")
+        added, updated, deleted = database.sync_files_to_database(get_images(OUTPUT_DIR))
+        print(f"INFO: Database sync complete - Added: {added}, Updated: {updated}, Deleted: {deleted}")
+        invalidate_directory_tree()
+        return
+
+    upserts = set(changes.upserts)
+
+    # Moves keep favorites and indexed metadata; thumbnails are keyed by path
+    for old_path, new_path in changes.moves:
+        renames = database.move_path(old_path, new_path)
+        for old_file, new_file in renames:
+            thumbnails.forget(old_file)
+            upserts.add(new_file)
+        if not renames and Path(new_path).suffix.lower() in IMAGE_EXTENSIONS:
+            upserts.add(new_path)
+
+    for dir_path in changes.dirs_removed:
+        for removed in database.delete_directory(dir_path):
+            thumbnails.forget(removed)
+
+    database.delete_files(list(changes.deletes))
+    for removed in changes.deletes:
+        thumbnails.forget(removed)
+
+    records = [r for r in (get_file_record(p) for p in upserts) if r is not None]
+    database.upsert_files(records)
+    for record in records:
+        full_path = os.path.join(OUTPUT_DIR, record['path'])
+        try:
+            get_indexed_metadata(record['path'], full_path)
+            _, key = get_thumbnail_key(record['path'])
+            if key and not thumbnail_exists(key):
+                thumbnails.submit(record['path'], full_path, key)
+        except OSError:
+            continue  # Removed again before we got to it
+
+    # Folder mtimes already catch most of this; coarse-mtime filesystems need the help
+    changed_dirs = {os.path.dirname(p) for p in changes.upserts | changes.deletes}
+    changed_dirs.update(changes.dirs_added, changes.dirs_removed)
+    for old_path, new_path in changes.moves:
+        changed_dirs.update((old_path, new_path))
+    invalidate_directory_tree(changed_dirs)
+
+    print(f"INFO: Applied filesystem changes - Updated: {len(records)}, "
+          f"Deleted: {len(changes.deletes)}, Moved: {len(changes.moves)}")
+
+def handle_file_changes(changes):
+    """Watcher callback: apply changes, holding them back until the initial sync is done."""
+    with startup_lock:
+        if startup_status['state'] in SYNC_PENDING_STATES:
+            deferred_changes.append(changes)
+            return
+    apply_file_changes(changes)
+
+def update_startup_status(**changes):
+    with startup_lock:
+        startup_status.update(changes)
+        if 'state' in changes:
+            leader.publish_status(startup_status)
+
+def get_startup_status():
+    """Initial sync progress, as published by the leader in a multi-process server."""
+    if not leader.is_leader():
+        published = leader.read_status()
+        if published:
+            return published
+    with startup_lock:
+        return dict(startup_status)
+
+def get_backfill_status():
+    """Metadata backfill progress, as published by the leader in a multi-process server."""
+    if not leader.is_leader():
+        published = leader.read_status(leader.BACKFILL_STATUS_FILENAME)
+        if published:
+            return published
+    return backfill.get_status()
+
+def publish_backfill_status(status):
+    leader.publish_status(status, leader.BACKFILL_STATUS_FILENAME)
+
+def serve_backfill_requests():
+    """Leader: start the backfills other workers ask for."""
+    while True:
+        if leader.take_backfill_request():
+            backfill.start_backfill(OUTPUT_DIR, BACKFILL_WORKERS)
+        time.sleep(BACKFILL_REQUEST_POLL)
+
+def run_initial_sync():
+    """Sync the database with disk, then hand over to the watcher and metadata backfill."""
+    update_startup_status(state='scanning', started_at=datetime.now().timestamp())
     try:
-        with Image.open(image_path) as img:
-            # Convert RGBA to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-
-            # Create thumbnail
-            img.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-            img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-            return True
+        # Watch first so nothing created during the scan is missed
+        watcher.start_watcher(OUTPUT_DIR, handle_file_changes, IMAGE_EXTENSIONS,
+                              ignore={database.DATABASE_FOLDER_NAME}, mode=WATCH_MODE,
+                              interval=WATCH_INTERVAL)
+
+        print("INFO: Syncing files to database...")
+        files = get_images(OUTPUT_DIR, progress=lambda count: update_startup_status(files=count))
+        update_startup_status(state='syncing', files=len(files))
+        added, updated, deleted = database.sync_files_to_database(files)
+        print(f"INFO: Database sync complete - Added: {added}, Updated: {updated}, Deleted: {deleted}")
+
+        # Replay held-back changes before the watcher may apply new ones
+        with startup_lock:
+            startup_status.update(state='ready', added=added, updated=updated, deleted=deleted,
+                                  finished_at=datetime.now().timestamp())
+            leader.publish_status(startup_status)
+            for changes in deferred_changes:
+                apply_file_changes(changes)
+            deferred_changes.clear()
     except Exception as e:
-        print(f"Error generating thumbnail: {e}")
-        return False
+        with startup_lock:
+            startup_status.update(state='error', error=str(e), finished_at=datetime.now().timestamp())
+            leader.publish_status(startup_status)
+            deferred_changes.clear()
+        print(f"Error during initial sync: {e}")
+        return
+
+    # Fill the metadata index without holding up the server
+    backfill.start_backfill(OUTPUT_DIR, BACKFILL_WORKERS)
+    # Only now, so a requested backfill never runs ahead of the initial sync
+    threading.Thread(target=serve_backfill_requests, name='BackfillRequests', daemon=True).start()
+    thumbnails.hash_backlog()
+
+def start_initial_sync():
+    """Run the initial sync in the background so the server can start listening."""
+    thread = threading.Thread(target=run_initial_sync, name='InitialSync', daemon=True)
+    thread.start()
+    return thread
+
+def start_services():
+    """Open the database and thumbnail manifest, then start the background work.
+
+    Every worker process calls this; only the one holding the leader lock
+    runs the initial sync, watcher and metadata backfill.
+    """
+    database.set_database_path(OUTPUT_DIR)
+    leader.set_state_dir(database.DATABASE_DIR)
+    with leader.migration_lock():
+        database.initialize_database()
+        thumbnails.initialize_manifest()
+
+    if leader.try_acquire():
+        # Sync files to database in the background; the watcher and metadata
+        # backfill take over once it's done
+        leader.publish_status(startup_status)
+        backfill.set_status_listener(publish_backfill_status)
+        publish_backfill_status(backfill.get_status())
+        start_initial_sync()
+    else:
+        print(f"INFO: Worker {os.getpid()} is serving from the shared index; another process runs the sync and watcher")
+
+def get_thumbnail_key(image_path):
+    """Get the full image path and thumbnail key for an image, or (None, None)."""
+    full_image_path = safe_join(OUTPUT_DIR, image_path)
+    if not full_image_path or not os.path.isfile(full_image_path):
+        return None, None
 
-def get_thumbnail_path(image_path):
-    """Get the path to a thumbnail, generating it if necessary."""
-    # Create a unique filename based on the image path
-    path_hash = str(abs(hash(image_path)))
-    thumbnail_filename = f"{path_hash}.jpg"
-    thumbnail_path = os.path.join(THUMBNAIL_DIR, thumbnail_filename)
+    # The key is derived from path, mtime and size, so an existing file is
+    # always up to date with the original
+    return full_image_path, thumbnails.thumbnail_key(image_path, os.stat(full_image_path))
 
-    # Check if thumbnail exists and is newer than the original
-    full_image_path = safe_join(OUTPUT_DIR, image_path)
-    if not full_image_path or not os.path.exists(full_image_path):
+def get_thumbnail_path(image_path, size=thumbnails.DEFAULT_SIZE, fmt=thumbnails.FALLBACK_FORMAT):
+    """Get the path to a thumbnail variant, generating it if necessary."""
+    full_image_path, key = get_thumbnail_key(image_path)
+    if not key:
         return None
 
-    image_mtime = os.path.getmtime(full_image_path)
-
+    thumbnail_path = thumbnails.shard_path(key, size, fmt)
     if os.path.exists(thumbnail_path):
-        thumb_mtime = os.path.getmtime(thumbnail_path)
-        if thumb_mtime >= image_mtime:
-            return thumbnail_path
-
-    # Generate thumbnail
-    if generate_thumbnail(full_image_path, thumbnail_path):
+        thumbnails.record(image_path, key)
         return thumbnail_path
 
+    # Generate on the shared pool, ahead of any background work
+    future = thumbnails.submit(image_path, full_image_path, key, fmt, thumbnails.PRIORITY_ON_DEMAND)
+    if future.result(timeout=THUMBNAIL_TIMEOUT):
+        return thumbnail_path
     return None
 
-def generate_thumbnails_background(image_paths):
-    """Background task to generate thumbnails."""
-    generated = 0
-    total = len(image_paths)
-
-    for i, image_path in enumerate(image_paths):
-        try:
-            thumbnail_path = get_thumbnail_path(image_path)
-            if thumbnail_path:
-                generated += 1
-            print(f"Generated thumbnail {i+1}/{total}: {image_path}")
-        except Exception as e:
-            print(f"Error generating thumbnail for {image_path}: {e}")
-
-    print(f"Thumbnail generation completed: {generated}/{total} successful")
+def thumbnail_exists(key):
+    """Check whether background pre-generation already produced a thumbnail."""
+    return os.path.exists(thumbnails.shard_path(key, thumbnails.DEFAULT_SIZE, thumbnails.preferred_format()))
 
 @app.route('/api/generate-thumbnails', methods=['POST'])
 def generate_thumbnails_batch():
-    """Pre-generate thumbnails for a list of images in background."""
-    from flask import request
+    """Queue thumbnails for a list of images on the background worker pool."""
     try:
         data = request.get_json()
         image_paths = data.get('images', [])
 
-        # Start background thread to generate thumbnails
-        thread = threading.Thread(
-            target=generate_thumbnails_background,
-            args=(image_paths,),
-            daemon=True
-        )
-        thread.start()
+        queued = 0
+        cached = 0
+        for image_path in image_paths:
+            full_image_path, key = get_thumbnail_key(image_path)
+            if not key:
+                continue
+            if thumbnail_exists(key):
+                cached += 1
+                continue
+            if thumbnails.submit(image_path, full_image_path, key) is None:
+                break
+            queued += 1
 
         # Return immediately
         return jsonify({
-            'status': 'started',
+            'status': 'queued',
             'total': len(image_paths),
-            'message': 'Thumbnail generation started in background'
+            'queued': queued,
+            'cached': cached,
+            'message': 'Thumbnail generation queued in background'
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def is_current_version(full_path, version):
+    """Check a ?v= URL version (the file's mtime, as listings report it) against disk."""
+    try:
+        return version is not None and float(version) == os.stat(full_path).st_mtime
+    except (ValueError, OSError):
+        return False
+
+def cache_if_versioned(response, full_path):
+    """Mark a file response immutable when the request names the file's current version.
+
+    Otherwise the browser revalidates with the ETag/Last-Modified send_file
+    sets; Range requests are honoured either way.
+    """
+    if is_current_version(full_path, request.args.get('v')):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+def accelerate(response, full_path):
+    """Let nginx send a file response's body (X-Accel-Redirect), if configured.
+
+    Flask still sets the type, validators, caching and disposition headers;
+    304 and Range (206) responses and files outside the mapped directories
+    are sent as they are.
+    """
+    if response.status_code != 200 or not response.direct_passthrough:
+        return response
+
+    for root, location in ((OUTPUT_DIR, ACCEL_OUTPUT), (THUMBNAIL_DIR, ACCEL_THUMBNAILS)):
+        if not location:
+            continue
+        relative = os.path.relpath(full_path, root)
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            continue
+        response.close()
+        response.direct_passthrough = False
+        response.set_data(b'')
+        del response.headers['Content-Length']
+        response.headers['X-Accel-Redirect'] = f"{location.rstrip('/')}/{quote(relative.replace(os.sep, '/'))}"
+        break
+    return response
+
+def wants_msgpack():
+    """Whether the client prefers MessagePack to JSON (and msgpack is installed)."""
+    if msgpack is None:
+        return False
+    return request.accept_mimetypes.best_match(('application/json',) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+def to_columns(records):
+    """One array per field instead of one object per record."""
+    fields = dict.fromkeys(field for record in records for field in record)
+    return {field: [record.get(field) for record in records] for field in fields}
+
+def api_response(payload, listings=('images', 'folders')):
+    """Encode an API response as JSON, or MessagePack when the Accept header asks for it.
+
+    With ?format=columns, record lists (a bare list, or those under the
+    listings keys) are sent as one array per field.
+    """
+    if request.args.get('format') == 'columns':
+        if isinstance(payload, list):
+            payload = to_columns(payload)
+        else:
+            payload = {key: to_columns(value) if key in listings and isinstance(value, list) else value
+                       for key, value in payload.items()}
+
+    if wants_msgpack():
+        response = Response(msgpack.packb(payload), mimetype=MSGPACK_MIMETYPES[0])
+    else:
+        response = jsonify(payload)
+    response.vary.add('Accept')
+    return response
+
+def representation_etag(etag):
+    """Give the JSON and MessagePack encodings of a response distinct ETags."""
+    return f"{etag}-msgpack" if wants_msgpack() else etag
+
+def validated(etag, last_modified=None):
+    """Return a 304 response if the request already holds this version, else None."""
+    if request.if_none_match.contains_weak(representation_etag(etag)):
+        return set_validators(Response(status=304), etag, last_modified)
+    return None
+
+def set_validators(response, etag, last_modified=None):
+    """Make the browser revalidate an API response against its ETag."""
+    response.set_etag(representation_etag(etag))
+    response.vary.add('Accept')
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+def format_sse(event, data):
+    """Format a Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/thumbnails/events')
+@app.route('/api/thumbnails/events/<path:folder_path>')
+def api_thumbnail_events(folder_path=''):
+    """Queue thumbnails for one page of a folder and stream their progress as Server-Sent Events.
+
+    The page is read from the index with the same sort/order/limit/after
+    arguments as /api/browse (the first page of MAX_PAGE_SIZE by default),
+    so the work per request doesn't grow with the folder.
+    """
+    try:
+        sort, descending, after, limit = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    folder_path = folder_path.strip('/')
+    full_path = safe_join(OUTPUT_DIR, folder_path) if folder_path else OUTPUT_DIR
+    if not full_path or not os.path.isdir(full_path):
+        return jsonify({'status': 'error', 'message': 'Folder not found'}), 404
+    folder_path = os.path.normpath(folder_path) if folder_path else ''
+    refresh_folder_index(folder_path, full_path)
+
+    try:
+        images, _ = database.get_files_page(sort, descending, after, limit or MAX_PAGE_SIZE, parent=folder_path)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    image_paths = [image['path'] for image in images]
+    completed = queue.Queue()
+
+    total = len(image_paths)
+    cached = 0
+    pending = 0
+    for image_path in image_paths:
+        full_image_path, key = get_thumbnail_key(image_path)
+        if not key:
+            total -= 1
+            continue
+        if thumbnail_exists(key):
+            cached += 1
+            continue
+
+        future = thumbnails.submit(image_path, full_image_path, key)
+        if future is None:
+            total -= 1
+            continue
+        future.add_done_callback(lambda f, path=image_path: completed.put((path, f.result())))
+        pending += 1
+
+    def stream():
+        done = cached
+        yield format_sse('progress', {'done': done, 'total': total})
+
+        remaining = pending
+        while remaining:
+            try:
+                image_path, thumbnail_path = completed.get(timeout=EVENT_KEEPALIVE)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+
+            remaining -= 1
+            done += 1
+            event = 'ready' if thumbnail_path else 'failed'
+            yield format_sse(event, {'path': image_path, 'done': done, 'total': total})
+
+        yield format_sse('complete', {'done': done, 'total': total})
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def encode_cursor(values):
+    """Encode the sort values of a page's last row as an opaque cursor token."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Decode a cursor token back into sort values."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+def get_page_args():
+    """Parse sort/order/limit/after query arguments; limit is None for an unpaginated request."""
+    sort = request.args.get('sort', 'mtime')
+    if sort not in SORT_DESCENDING:
+        raise ValueError(f"Unknown sort '{sort}', expected one of: {', '.join(SORT_DESCENDING)}")
+
+    order = request.args.get('order')
+    if order not in (None, 'asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+    descending = SORT_DESCENDING[sort] if order is None else order == 'desc'
+
+    after = request.args.get('after')
+    after = decode_cursor(after) if after else None
+
+    limit = request.args.get('limit', type=int)
+    if limit is None and after is not None:
+        limit = PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    return sort, descending, after, limit
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON, MessagePack and HTML responses the client can decode."""
+    return compression.compress_response(response, request.accept_encodings)
+
 @app.route('/')
 def index():
     """Main gallery page."""
@@ -391,51 +638,347 @@ def index():
 
 @app.route('/api/images')
 def api_images():
-    """API endpoint to get list of images."""
-    images = get_images(OUTPUT_DIR)
-    return jsonify(images)
+    """API endpoint to get list of images.
+
+    With limit/after, pages through the database index:
+    ?limit=200&sort=mtime|name|size|favorite&order=asc|desc&after=<cursor>
+    """
+    try:
+        sort, descending, after, limit = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    if limit is None:
+        images = get_images(OUTPUT_DIR)
+        return api_response(images)
+
+    try:
+        images, next_values = database.get_files_page(sort, descending, after, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    for image in images:
+        image['modified_str'] = scanner.format_mtime(image['modified'])
+
+    return api_response({
+        'images': images,
+        'next': encode_cursor(next_values) if next_values else None
+    })
+
+def parse_date_arg(value, end=False):
+    """Parse a date filter (epoch seconds or ISO date/datetime); a bare end date includes that whole day."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD, an ISO datetime or epoch seconds")
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.timestamp()
+
+@app.route('/api/search')
+def api_search():
+    """API endpoint for full-text search over prompts, node titles and model names.
+
+    ?q=<words>&field=positive|negative|titles|models&folder=<path>
+    &from=<date>&to=<date>&limit=50&after=<cursor>
+    Results are ranked best match first; every word must match, the last as a prefix.
+    """
+    try:
+        folder = request.args.get('folder', '').strip('/')
+        if folder and not safe_join(OUTPUT_DIR, folder):
+            raise ValueError('Invalid folder')
+        after = request.args.get('after')
+        limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        images, next_values = database.search_files(
+            request.args.get('q', ''),
+            field=request.args.get('field') or None,
+            folder=folder or None,
+            since=parse_date_arg(request.args.get('from')),
+            until=parse_date_arg(request.args.get('to'), end=True),
+            after=decode_cursor(after) if after else None,
+            limit=limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+
+    for image in images:
+        image['modified_str'] = scanner.format_mtime(image['modified'])
+
+    return api_response({
+        'images': images,
+        'next': encode_cursor(next_values) if next_values else None
+    })
+
+def get_generation_filters():
+    """Generation-parameter filters from the query string as (argument, value) pairs."""
+    return [(name, value) for name in database.GENERATION_FILTERS for value in request.args.getlist(name) if value != '']
+
+@app.route('/api/facets')
+def api_facets():
+    """API endpoint for image counts per checkpoint, LoRA, sampler, scheduler, steps, CFG and size.
+
+    Accepts the same filters as /api/facets/images; each facet is counted
+    with the filters on the other facets applied.
+    """
+    try:
+        return api_response(database.get_facets(get_generation_filters()))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.route('/api/facets/images')
+def api_facet_images():
+    """API endpoint for images filtered by generation parameters, newest first.
+
+    ?checkpoint=X&lora=Y&lora=Z&sampler=&scheduler=&steps=&steps_min=&steps_max=
+    &cfg=&cfg_min=&cfg_max=&seed=&width=&height=&limit=200&after=<cursor>
+    _min/_max bounds are inclusive; steps_gt/steps_lt/cfg_gt/cfg_lt are exclusive.
+    """
+    try:
+        after = request.args.get('after')
+        limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+        images, next_values = database.get_generation_page(
+            get_generation_filters(), decode_cursor(after) if after else None, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    for image in images:
+        image['modified_str'] = scanner.format_mtime(image['modified'])
+
+    return api_response({
+        'images': images,
+        'next': encode_cursor(next_values) if next_values else None
+    })
+
+def get_image_hash(image_path):
+    """Get the perceptual hash of an image, generating its thumbnails if necessary."""
+    dhash = thumbnails.lookup_hash(image_path)
+    if dhash is None and get_thumbnail_path(image_path):
+        dhash = thumbnails.lookup_hash(image_path)
+        if dhash is None:
+            # Thumbnails made before hashes were recorded
+            key = thumbnails.lookup(image_path)
+            dhash = thumbnails.hash_thumbnail(key) if key else None
+            if dhash is not None:
+                thumbnails.record(image_path, key, dhash)
+    return dhash
+
+@app.route('/api/similar/<path:image_path>')
+def api_similar(image_path):
+    """API endpoint for images that look like one image, closest first.
+
+    ?radius=10 is the maximum Hamming distance between perceptual hashes
+    (0-12); ?limit caps the number of results.
+    """
+    image_path = os.path.normpath(image_path.strip('/'))
+    radius = request.args.get('radius', SIMILAR_RADIUS, type=int)
+    limit = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    if not 0 <= radius <= similarity.MAX_RADIUS:
+        return jsonify({'status': 'error', 'message': f'radius must be between 0 and {similarity.MAX_RADIUS}'}), 400
+
+    dhash = get_image_hash(image_path)
+    if dhash is None:
+        return jsonify({'status': 'error', 'message': 'Image not found'}), 404
+
+    matches = [(path, distance) for path, distance in thumbnails.get_hash_index().query(dhash, radius)
+               if path != thumbnails.normalize_path(image_path)]
+    records = database.get_files([path for path, _ in matches[:limit]])
+
+    images = []
+    for path, distance in matches[:limit]:
+        record = records.get(path)
+        if record:
+            record['modified_str'] = scanner.format_mtime(record['modified'])
+            record['distance'] = distance
+            images.append(record)
+
+    return api_response({'path': image_path, 'radius': radius, 'images': images, 'total': len(matches)})
+
+@app.route('/api/duplicates')
+@app.route('/api/duplicates/<path:folder_path>')
+def api_duplicates(folder_path=''):
+    """API endpoint to cluster near-duplicate images in one folder, largest cluster first.
+
+    ?radius=6 is the maximum Hamming distance between neighbours in a
+    cluster. Images without a hash yet are queued for thumbnails and
+    reported as 'unhashed'; they join clusters on a later request.
+    """
+    folder_path = folder_path.strip('/')
+    folder_path = os.path.normpath(folder_path) if folder_path else ''
+    radius = request.args.get('radius', DUPLICATE_RADIUS, type=int)
+    if not 0 <= radius <= similarity.MAX_RADIUS:
+        return jsonify({'status': 'error', 'message': f'radius must be between 0 and {similarity.MAX_RADIUS}'}), 400
+
+    paths = database.get_folder_paths(folder_path)
+    index = thumbnails.get_hash_index()
+    unhashed = [path for path in paths if index.get(path) is None]
+    for image_path in unhashed:
+        full_image_path, key = get_thumbnail_key(image_path)
+        if key and thumbnails.submit(image_path, full_image_path, key) is None:
+            break
+
+    clusters = index.clusters(paths, radius)
+    records = database.get_files([path for cluster in clusters for path in cluster])
+    for record in records.values():
+        record['modified_str'] = scanner.format_mtime(record['modified'])
+
+    return api_response({
+        'current_path': folder_path,
+        'radius': radius,
+        'clusters': [[records[path] for path in cluster if path in records] for cluster in clusters],
+        'unhashed': len(unhashed)
+    })
 
 @app.route('/api/browse')
 @app.route('/api/browse/<path:folder_path>')
 def api_browse(folder_path=''):
-    """API endpoint to browse folders and images."""
-    items = get_items(OUTPUT_DIR, folder_path)
+    """API endpoint to browse folders and images.
 
-    # Add favorite status to images
-    if items['images']:
-        items['images'] = database.get_files_with_favorites(items['images'])
+    With limit/after, images are returned a page at a time (folders only on
+    the first page) with a cursor for the next: see api_images.
+    """
+    try:
+        sort, descending, after, limit = get_page_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    folder_path = folder_path.strip('/')
+    full_path = safe_join(OUTPUT_DIR, folder_path) if folder_path else OUTPUT_DIR
+    if not full_path or not os.path.isdir(full_path):
+        return api_response({'current_path': folder_path, 'folders': [], 'images': []})
+    folder_path = os.path.normpath(folder_path) if folder_path else ''
+
+    # The filesystem is only consulted to validate the indexed listing
+    refresh_folder_index(folder_path, full_path)
+
+    version = database.get_folder_version(folder_path)
+    etag = f"folder-{version[0]}-{version[1]}" if version else None
+    not_modified = validated(etag) if etag else None
+    if not_modified:
+        return not_modified
+
+    if limit is None:
+        folders, images = database.get_folder_contents(folder_path)
+    else:
+        folders = database.get_folder_contents(folder_path)[0] if after is None else []
+        try:
+            images, next_values = database.get_files_page(sort, descending, after, limit, parent=folder_path)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
 
-    return jsonify({
+    for record in folders + images:
+        record['modified_str'] = scanner.format_mtime(record['modified'])
+
+    response = {
         'current_path': folder_path,
-        'folders': items['folders'],
-        'images': items['images']
-    })
+        'folders': folders,
+        'images': images
+    }
+    if limit is not None:
+        response['total_images'] = database.count_files(folder_path)
+        response['next'] = encode_cursor(next_values) if next_values else None
+    response = api_response(response)
+    return set_validators(response, etag) if etag else response
 
 @app.route('/api/tree')
 @app.route('/api/tree/<path:folder_path>')
 def api_tree(folder_path=''):
-    """API endpoint to get directory tree with caching."""
-    tree = get_cached_directory_tree(OUTPUT_DIR)
-    return jsonify(tree)
+    """API endpoint to get one level of the directory tree."""
+    folder_path = folder_path.strip('/')
+    full_path = safe_join(OUTPUT_DIR, folder_path) if folder_path else OUTPUT_DIR
+    if not full_path or not os.path.isdir(full_path):
+        return jsonify({'status': 'error', 'message': 'Folder not found'}), 404
+
+    return jsonify(get_tree_level(os.path.normpath(folder_path) if folder_path else ''))
 
 @app.route('/api/tree/refresh')
 def api_tree_refresh():
     """Force refresh the directory tree cache."""
-    global directory_tree_cache, directory_tree_cache_time
-    directory_tree_cache = None
-    directory_tree_cache_time = None
-    tree = get_cached_directory_tree(OUTPUT_DIR)
-    return jsonify({'status': 'refreshed', 'tree': tree})
+    invalidate_directory_tree()
+    return jsonify({'status': 'refreshed', 'tree': get_tree_level()})
+
+@app.route('/api/metadata/batch', methods=['POST'])
+def api_metadata_batch():
+    """API endpoint to get metadata for many images in one request.
+
+    Body: {"paths": [...], "fields": "workflow_summary,size"} (fields may
+    also be a list). 'available' lists which of prompt, workflow and exif
+    are present without sending them. Paths that don't exist are listed
+    under 'missing'.
+    """
+    data = request.get_json(silent=True) or {}
+    paths = data.get('paths')
+    if not isinstance(paths, list) or not all(isinstance(path, str) for path in paths):
+        return jsonify({'status': 'error', 'message': 'paths must be a list of image paths'}), 400
+    if len(paths) > METADATA_BATCH_SIZE:
+        return jsonify({'status': 'error', 'message': f'At most {METADATA_BATCH_SIZE} paths per request'}), 400
+
+    fields = data.get('fields')
+    try:
+        fields = database.parse_metadata_fields(','.join(fields) if isinstance(fields, list) else fields)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    entries = []
+    missing = []
+    for image_path in dict.fromkeys(paths):
+        safe_path = safe_join(OUTPUT_DIR, image_path)
+        try:
+            entries.append((image_path, safe_path, os.stat(safe_path)))
+        except (TypeError, OSError):
+            missing.append(image_path)
+
+    return api_response({'metadata': get_indexed_metadata_batch(entries, fields), 'missing': missing})
 
 @app.route('/api/metadata/<path:image_path>')
 def api_metadata(image_path):
-    """API endpoint to get image metadata."""
+    """API endpoint to get image metadata; ?fields= selects fields as for /api/metadata/batch."""
     safe_path = safe_join(OUTPUT_DIR, image_path)
     if not safe_path or not os.path.exists(safe_path):
         return jsonify({'error': 'Image not found'}), 404
 
-    metadata = get_image_metadata(safe_path)
-    return jsonify(metadata)
+    try:
+        fields = database.parse_metadata_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    # The metadata index is keyed by mtime and size, as is this validator
+    stat = os.stat(safe_path)
+    etag = f"metadata-{database.DB_SCHEMA_VERSION}-{stat.st_mtime_ns}-{stat.st_size}"
+    not_modified = validated(etag, stat.st_mtime)
+    if not_modified:
+        return not_modified
+
+    metadata = get_indexed_metadata(image_path, safe_path, fields)
+    response = api_response(metadata)
+    # Parse errors are not cached in the index, so neither here
+    return set_validators(response, etag, stat.st_mtime) if 'error' not in metadata else response
+
+@app.route('/api/backfill', methods=['GET'])
+def api_backfill_status():
+    """Get metadata backfill progress."""
+    return jsonify(get_backfill_status())
+
+@app.route('/api/backfill', methods=['POST'])
+def api_backfill_start():
+    """Start a metadata backfill for files that are not indexed yet.
+
+    Only the leader runs backfills; other workers pass the request on to it.
+    """
+    if not leader.is_leader():
+        status = get_backfill_status()
+        if status['state'] == 'running':
+            return jsonify({'status': 'running', **status}), 409
+        leader.request_backfill()
+        return jsonify({'status': 'requested'}), 202
+    if not backfill.start_backfill(OUTPUT_DIR, BACKFILL_WORKERS):
+        return jsonify({'status': 'running', **backfill.get_status()}), 409
+    return jsonify({'status': 'started'}), 202
 
 @app.route('/image/<path:filename>')
 def serve_image(filename):
@@ -443,23 +986,51 @@ def serve_image(filename):
     try:
         safe_path = safe_join(OUTPUT_DIR, filename)
         if safe_path and os.path.exists(safe_path):
-            return send_file(safe_path)
+            return accelerate(cache_if_versioned(send_file(safe_path), safe_path), safe_path)
         return "Image not found", 404
     except Exception as e:
         return str(e), 404
 
 @app.route('/thumbnail/<path:filename>')
 def serve_thumbnail(filename):
-    """Serve a thumbnail image, generating it if necessary."""
+    """Serve a thumbnail image, generating it if necessary.
+
+    ?size= selects a named size; the format is negotiated from Accept.
+    With ?v=<source mtime> the thumbnail is cached as immutable; the
+    original served in its place when generation fails is not.
+    """
     try:
-        thumbnail_path = get_thumbnail_path(filename)
+        size = request.args.get('size', thumbnails.DEFAULT_SIZE)
+        if size not in thumbnails.THUMBNAIL_SIZES:
+            return "Unknown thumbnail size", 400
+
+        accepted = [mimetype for mimetype, quality in request.accept_mimetypes if quality > 0]
+        fmt = thumbnails.negotiate_format(accepted)
+
+        thumbnail_path = get_thumbnail_path(filename, size, fmt)
         if thumbnail_path and os.path.exists(thumbnail_path):
-            return send_file(thumbnail_path, mimetype='image/jpeg')
+            response = send_file(thumbnail_path, mimetype=thumbnails.mimetype_for(fmt))
+            cache_if_versioned(response, safe_join(OUTPUT_DIR, filename))
+            response.vary.add('Accept')
+            return accelerate(response, thumbnail_path)
         # Fallback to full image if thumbnail generation fails
-        return serve_image(filename)
+        return serve_thumbnail_fallback(filename)
     except Exception as e:
         print(f"Error serving thumbnail: {e}")
-        return serve_image(filename)
+        return serve_thumbnail_fallback(filename)
+
+def serve_thumbnail_fallback(filename):
+    """Serve the original under a thumbnail URL when no thumbnail could be made.
+
+    Never cached as immutable, whatever ?v= says: generation may only have
+    timed out, and the next request should get the real thumbnail.
+    """
+    safe_path = safe_join(OUTPUT_DIR, filename)
+    if not safe_path or not os.path.isfile(safe_path):
+        return "Image not found", 404
+    response = send_file(safe_path)
+    response.cache_control.no_cache = True
+    return accelerate(response, safe_path)
 
 @app.route('/api/download/<path:filename>')
 def download_image(filename):
@@ -467,11 +1038,28 @@ def download_image(filename):
     try:
         safe_path = safe_join(OUTPUT_DIR, filename)
         if safe_path and os.path.exists(safe_path):
-            return send_file(safe_path, as_attachment=True, download_name=os.path.basename(filename))
+            return accelerate(send_file(safe_path, as_attachment=True, download_name=os.path.basename(filename)), safe_path)
         return "Image not found", 404
     except Exception as e:
         return str(e), 404
 
+def zip_response(entries, zip_filename):
+    """Stream a ZIP archive of (file path, archive name) pairs as it is written."""
+    response = Response(
+        zip_stream.stream_zip(entries),
+        mimetype='application/zip',
+        headers={'X-Accel-Buffering': 'no'}
+    )
+    # As send_file(download_name=): an ASCII fallback plus RFC 5987 filename*
+    try:
+        zip_filename.encode('ascii')
+        names = {'filename': zip_filename}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', zip_filename).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(zip_filename, safe='!#$&+-.^_`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+    return response
+
 @app.route('/api/download-folder/<path:folder_path>')
 def download_folder(folder_path=''):
     """Download a folder as a ZIP file."""
@@ -480,28 +1068,17 @@ def download_folder(folder_path=''):
         if not safe_path or not os.path.exists(safe_path):
             return "Folder not found", 404
 
-        # Create ZIP file in memory
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # Walk through the folder and add all files
+        def entries():
+            # Walk through the folder and add all files, except the gallery's own cache
             for root, dirs, files in os.walk(safe_path):
+                dirs[:] = [d for d in dirs if d != database.DATABASE_FOLDER_NAME]
                 for file in files:
                     file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, safe_path)
-                    zf.write(file_path, arcname)
-
-        memory_file.seek(0)
+                    yield file_path, os.path.relpath(file_path, safe_path)
 
         # Generate a nice folder name for the ZIP
         folder_name = os.path.basename(folder_path) if folder_path else 'output'
-        zip_filename = f"{folder_name}.zip"
-
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
+        return zip_response(entries(), f"{folder_name}.zip")
     except Exception as e:
         return str(e), 500
 
@@ -518,37 +1095,16 @@ def download_multiple():
         if not paths or not isinstance(paths, list):
             return "Invalid paths", 400
 
-        # Create ZIP file in memory
-        memory_file = io.BytesIO()
-        added_files = 0
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for path in paths:
-                # Normalize path separators - convert all to forward slash first, then to os.sep
-                normalized_path = path.replace('\\', '/').replace('/', os.sep)
-
-                # Build the full path
-                full_path = os.path.join(OUTPUT_DIR, normalized_path)
-                full_path = os.path.normpath(full_path)
-
-                if os.path.exists(full_path):
-                    # Use just the filename in the ZIP
-                    arcname = os.path.basename(path)
-                    zf.write(full_path, arcname)
-                    added_files += 1
-
-        print(f"Downloaded {added_files} images as ZIP")
-
-        memory_file.seek(0)
-
-        # Generate filename
-        zip_filename = f"images_{len(paths)}.zip"
-
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=zip_filename
-        )
+        entries = []
+        for path in paths:
+            # Normalize path separators and keep the result inside the output folder
+            full_path = safe_join(OUTPUT_DIR, path.replace('\\', '/'))
+            if full_path and os.path.isfile(full_path):
+                # Use just the filename in the ZIP
+                entries.append((full_path, os.path.basename(full_path)))
+
+        print(f"Downloading {len(entries)} images as ZIP")
+        return zip_response(entries, f"images_{len(paths)}.zip")
     except Exception as e:
         print(f"Error downloading multiple images: {e}")
         return str(e), 500
@@ -556,7 +1112,24 @@ def download_multiple():
 @app.route('/health')
 def health():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy', 'output_dir': OUTPUT_DIR})
+    sync = get_startup_status()
+    return jsonify({'status': 'healthy', 'output_dir': OUTPUT_DIR, 'ready': sync['state'] == 'ready'})
+
+@app.route('/health/live')
+def health_live():
+    """Liveness: the server is up and answering requests."""
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready')
+def health_ready():
+    """Readiness: 200 once the initial sync has finished, 503 with progress until then."""
+    sync = get_startup_status()
+    ready = sync['state'] == 'ready'
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'sync': sync,
+        'metadata': get_backfill_status()
+    }), 200 if ready else 503
 
 @app.route('/api/favorite/<path:image_path>', methods=['POST'])
 def api_toggle_favorite(image_path):
@@ -598,25 +1171,17 @@ def api_get_favorites():
     """Get all favorited images."""
     try:
         favorites = database.get_favorites()
-        favorite_count = database.get_favorite_count()
-        return jsonify({
+        return api_response({
             'images': favorites,
-            'total': favorite_count
+            'total': len(favorites)
         })
     except Exception as e:
         print(f"Error getting favorites: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 if __name__ == '__main__':
-    # Initialize database
-    database.set_database_path(OUTPUT_DIR)
-    database.initialize_database()
-
-    # Sync files to database on startup
-    print("INFO: Syncing files to database...")
-    initial_files = get_images(OUTPUT_DIR)
-    added, updated, deleted = database.sync_files_to_database(initial_files)
-    print(f"INFO: Database sync complete - Added: {added}, Updated: {updated}, Deleted: {deleted}")
+    # Development server; serve.py runs the same app under gunicorn
+    start_services()
 
     print(f"Starting ComfyUI Gallery on port {GALLERY_PORT}")
     print(f"Serving images from: {OUTPUT_DIR}")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Metadata backfill for ComfyUI Gallery
+Builds the metadata index in parallel across processes
+
+Only files without an up-to-date metadata row are parsed, and results are
+committed in batches, so an interrupted backfill resumes where it stopped.
+
+Usage: python backfill.py [--output-dir DIR] [--workers N] [--batch-size N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import database
+import image_metadata
+import scanner
+
+BATCH_SIZE = 200
+CHUNK_SIZE = 64
+WINDOW_CHUNKS = 4  # Chunks per worker submitted to the pool at a time
+
+_status = {
+    'state': 'idle',
+    'total': 0,
+    'done': 0,
+    'failed': 0,
+    'started_at': None,
+    'finished_at': None,
+    'error': None
+}
+_status_lock = threading.Lock()
+_run_lock = threading.Lock()
+_status_listener: Optional[Callable[[Dict], None]] = None
+
+
+def set_status_listener(listener: Optional[Callable[[Dict], None]]):
+    """Call listener with a status snapshot on every change (e.g. to publish it)"""
+    global _status_listener
+    _status_listener = listener
+
+
+def _update_status(**changes):
+    with _status_lock:
+        _status.update(changes)
+        snapshot = dict(_status)
+    if _status_listener is not None:
+        _status_listener(snapshot)
+
+
+def get_status() -> Dict:
+    """Get a snapshot of backfill progress"""
+    with _status_lock:
+        return dict(_status)
+
+
+def _extract(task: Tuple[str, str, float, int]):
+    """Worker process: parse one file; returns None for files that failed"""
+    path, full_path, mtime, size = task
+    metadata = image_metadata.get_image_metadata(full_path)
+    if 'error' in metadata:
+        return None
+    return (path, mtime, size, metadata)
+
+
+def run_backfill(output_dir: str, workers: Optional[int] = None, batch_size: int = BATCH_SIZE) -> Dict:
+    """
+    Index metadata for every file that is missing or stale
+    Blocks until done; returns the final status.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return get_status()
+    return _run_and_release(output_dir, workers, batch_size)
+
+
+def _run_and_release(output_dir: str, workers: Optional[int], batch_size: int) -> Dict:
+    """Run a backfill while holding _run_lock, releasing it when done"""
+    try:
+        # Metadata stored before prompt search existed needs no re-parse
+        database.index_search_backlog()
+        database.index_generation_backlog()
+
+        pending = database.get_files_missing_metadata()
+        _update_status(state='running', total=len(pending), done=0, failed=0,
+                       started_at=time.time(), finished_at=None, error=None)
+        print(f"INFO: Backfilling metadata for {len(pending)} files...")
+
+        batch = []
+        done = 0
+        failed = 0
+
+        if pending:
+            workers = workers or os.cpu_count()
+            # Submit a window at a time so queued tasks and results stay bounded
+            window = workers * CHUNK_SIZE * WINDOW_CHUNKS
+            # spawn: forking a server process with live threads is unsafe
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                for start in range(0, len(pending), window):
+                    tasks = [(f['path'], os.path.join(output_dir, f['path']), f['mtime'], f['size'])
+                             for f in pending[start:start + window]]
+                    for result in executor.map(_extract, tasks, chunksize=CHUNK_SIZE):
+                        done += 1
+                        if result is None:
+                            failed += 1
+                        else:
+                            batch.append(result)
+
+                        if len(batch) >= batch_size:
+                            database.save_metadata_batch(batch)
+                            batch = []
+                            _update_status(done=done, failed=failed)
+
+        database.save_metadata_batch(batch)
+        _update_status(state='complete', done=done, failed=failed, finished_at=time.time())
+        print(f"INFO: Metadata backfill complete - {done - failed} indexed, {failed} failed")
+    except Exception as e:
+        _update_status(state='error', error=str(e), finished_at=time.time())
+        print(f"Error during metadata backfill: {e}")
+    finally:
+        _run_lock.release()
+
+    return get_status()
+
+
+def start_backfill(output_dir: str, workers: Optional[int] = None) -> bool:
+    """Run the backfill in a background thread; False if one is already running"""
+    if not _run_lock.acquire(blocking=False):
+        return False
+
+    thread = threading.Thread(target=_run_and_release, args=(output_dir, workers, BATCH_SIZE), daemon=True)
+    thread.start()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-build the gallery metadata index')
+    parser.add_argument('--output-dir', default=os.environ.get('COMFYUI_OUTPUT_DIR', '/ComfyUI/output'))
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--no-sync', action='store_true', help='skip the file sync before indexing')
+    args = parser.parse_args()
+
+    database.set_database_path(args.output_dir)
+    database.initialize_database()
+
+    if not args.no_sync:
+        files = [record.to_dict() for record in scanner.walk_files(args.output_dir, scanner.IMAGE_EXTENSIONS)]
+        added, updated, deleted = database.sync_files_to_database(files)
+        print(f"INFO: Database sync complete - Added: {added}, Updated: {updated}, Deleted: {deleted}")
+
+    status = run_backfill(args.output_dir, args.workers, args.batch_size)
+    if status['state'] == 'complete':
+        elapsed = status['finished_at'] - status['started_at']
+        print(f"INFO: {status['done']} files in {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
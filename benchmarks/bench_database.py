@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Database connection benchmark
+Measures per-request latency of the hot browse and favorite-toggle queries
+with a fresh connection per call (the original behaviour) versus the pooled
+connections in database.py.
+
+Usage: python benchmarks/bench_database.py [--files 50000] [--folders 100] [--requests 2000]
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+
+@contextmanager
+def legacy_connection():
+    """get_db_connection before pooling: connect and set PRAGMAs on every call"""
+    conn = sqlite3.connect(database.DATABASE_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL;')
+    conn.execute('PRAGMA synchronous=NORMAL;')
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def populate(files, folders):
+    records = []
+    for i in range(files):
+        folder = f"2024-01-{i % folders:03d}"
+        records.append({
+            'path': f"{folder}/ComfyUI_{i:06d}_.png",
+            'name': f"ComfyUI_{i:06d}_.png",
+            'size': 1000 + i % 5000,
+            'modified': 1700000000 + i,
+        })
+    database.sync_files_to_database(records)
+    return [r['path'] for r in records]
+
+
+def browse_request(folder):
+    """The queries one paginated /api/browse request runs"""
+    database.get_folder_listed_mtime(folder)
+    database.get_files_page('mtime', True, None, 200, parent=folder)
+    database.count_files(folder)
+
+
+def run(label, requests, threads, func, args):
+    start = time.perf_counter()
+    if threads == 1:
+        for i in range(requests):
+            func(args[i % len(args)])
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(func, (args[i % len(args)] for i in range(requests))))
+    elapsed = time.perf_counter() - start
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--folders', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_database_')
+    pooled_connection = database.get_db_connection
+    try:
+        database.set_database_path(tmp)
+        database.initialize_database()
+        print(f"Indexing {args.files} files in {args.folders} folders...")
+        paths = populate(args.files, args.folders)
+        folders = sorted({database.parent_of(p) for p in paths})
+
+        cases = [
+            ('browse page', browse_request, folders),
+            ('toggle favorite', database.toggle_favorite, paths),
+        ]
+
+        print(f"{'request':<20}{'per-call (us)':>15}{'pooled (us)':>15}{'speedup':>10}")
+        for label, func, func_args in cases:
+            database.get_db_connection = legacy_connection
+            legacy = run(label, args.requests, args.threads, func, func_args)
+            database.get_db_connection = pooled_connection
+            pooled = run(label, args.requests, args.threads, func, func_args)
+            print(f"{label:<20}{legacy:>15.0f}{pooled:>15.0f}{legacy / pooled:>9.1f}x")
+    finally:
+        database.get_db_connection = pooled_connection
+        database.close_connections()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
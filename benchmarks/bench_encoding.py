@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Listing encoding benchmark
+Builds a /api/browse payload for one folder (20k images by default) and
+compares response size, encode time and decode time for row and columnar
+JSON, MessagePack (if installed) and gzip/brotli (if installed).
+
+Usage: python benchmarks/bench_encoding.py [--images 20000] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import compression
+import scanner
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def make_listing(count):
+    images = []
+    for i in range(count):
+        name = f"ComfyUI_{i:05d}_.png"
+        mtime = 1704067200.0 + i * 37.25
+        images.append({
+            'path': f"2024-06-15/{name}",
+            'name': name,
+            'size': 1400000 + i * 7 % 300000,
+            'modified': mtime,
+            'is_favorite': i % 50 == 0,
+            'modified_str': scanner.format_mtime(mtime),
+        })
+    return {'current_path': '2024-06-15', 'folders': [], 'images': images}
+
+
+def to_columns(records):
+    """As app.to_columns, without importing the Flask app"""
+    fields = dict.fromkeys(field for record in records for field in record)
+    return {field: [record.get(field) for record in records] for field in fields}
+
+
+def timed(runs, func):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--images', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_listing(args.images)
+    columns = dict(rows, images=to_columns(rows['images']))
+
+    # Flask's compact JSON provider settings outside debug mode
+    encoders = [
+        ('json rows', lambda: json.dumps(rows, separators=(',', ':')).encode(), json.loads),
+        ('json columns', lambda: json.dumps(columns, separators=(',', ':')).encode(), json.loads),
+    ]
+    if msgpack is not None:
+        encoders += [
+            ('msgpack rows', lambda: msgpack.packb(rows), msgpack.unpackb),
+            ('msgpack columns', lambda: msgpack.packb(columns), msgpack.unpackb),
+        ]
+    else:
+        print("msgpack not installed; skipping MessagePack")
+    if compression.brotli is None:
+        print("brotli not installed; skipping br")
+
+    print(f"{'encoding':<18}{'coding':<10}{'bytes':>12}{'encode (ms)':>14}{'decode (ms)':>14}")
+    for label, encode, decode in encoders:
+        encode_ms, body = timed(args.runs, encode)
+        decode_ms, _ = timed(args.runs, lambda: decode(body))
+        print(f"{label:<18}{'identity':<10}{len(body):>12}{encode_ms:>14.1f}{decode_ms:>14.1f}")
+        for coding in compression.supported_encodings():
+            compress_ms, compressed = timed(args.runs, lambda: compression.compress(body, coding))
+            print(f"{'':<18}{coding:<10}{len(compressed):>12}{encode_ms + compress_ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
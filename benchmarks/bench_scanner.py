@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Directory scanner benchmark
+Compares the original os.walk/os.listdir + per-entry stat listing code with
+scanner.py on a synthetic output tree (100k+ files by default).
+
+Usage: python benchmarks/bench_scanner.py [--dirs 500] [--files 220] [--workers 16]
+       python benchmarks/bench_scanner.py --root /mnt/nfs/output   # existing tree
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import scanner
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+
+
+def legacy_get_images(directory):
+    """get_images before the scanner module"""
+    images = []
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if Path(file).suffix.lower() in IMAGE_EXTENSIONS:
+                full_path = os.path.join(root, file)
+                rel_path = os.path.relpath(full_path, directory)
+                stat = os.stat(full_path)
+                images.append({
+                    'path': rel_path,
+                    'name': file,
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime,
+                    'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+                })
+    images.sort(key=lambda x: x['modified'], reverse=True)
+    return images
+
+
+def legacy_get_items(directory, current_path=''):
+    """get_items before the scanner module"""
+    items = {'folders': [], 'images': []}
+    full_path = os.path.join(directory, current_path) if current_path else directory
+    for entry in os.listdir(full_path):
+        entry_path = os.path.join(full_path, entry)
+        rel_path = os.path.join(current_path, entry) if current_path else entry
+        if os.path.isdir(entry_path):
+            stat = os.stat(entry_path)
+            items['folders'].append({
+                'path': rel_path,
+                'name': entry,
+                'modified': stat.st_mtime,
+                'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            })
+        elif os.path.isfile(entry_path) and Path(entry).suffix.lower() in IMAGE_EXTENSIONS:
+            stat = os.stat(entry_path)
+            items['images'].append({
+                'path': rel_path,
+                'name': entry,
+                'size': stat.st_size,
+                'modified': stat.st_mtime,
+                'modified_str': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+            })
+    items['folders'].sort(key=lambda x: x['name'].lower())
+    items['images'].sort(key=lambda x: x['modified'], reverse=True)
+    return items
+
+
+def legacy_build_tree(directory, current_path=''):
+    """build_directory_tree before the scanner module"""
+    full_path = os.path.join(directory, current_path) if current_path else directory
+    folders = []
+    for entry in os.listdir(full_path):
+        if os.path.isdir(os.path.join(full_path, entry)):
+            rel_path = os.path.join(current_path, entry) if current_path else entry
+            folders.append({'name': entry, 'path': rel_path, 'type': 'folder',
+                            'children': legacy_build_tree(directory, rel_path)})
+    folders.sort(key=lambda x: x['name'].lower())
+    return folders
+
+
+def scanner_get_items(directory):
+    listing = scanner.scan_directory(directory, '', IMAGE_EXTENSIONS, dir_mtimes=True)
+    return {'folders': [d.to_dict() for d in listing.dirs], 'images': [f.to_dict() for f in listing.files]}
+
+
+def make_tree(root, dirs, files_per_dir):
+    """Date folders with a few nested subfolders, like a long-running ComfyUI output dir"""
+    for d in range(dirs):
+        directory = os.path.join(root, f"2024-{d // 28 + 1:02d}-{d % 28 + 1:02d}")
+        if d % 5 == 4:
+            directory = os.path.join(directory, 'upscaled')
+        os.makedirs(directory, exist_ok=True)
+        for f in range(files_per_dir):
+            ext = '.png' if f % 10 else '.json'
+            with open(os.path.join(directory, f"ComfyUI_{f:05d}_{ext}"), 'wb') as fh:
+                fh.write(b'x' * (f % 7))
+    # A flat root folder with many images too
+    for f in range(files_per_dir * 5):
+        open(os.path.join(root, f"root_{f:05d}.png"), 'wb').close()
+
+
+def timed(func, *args, runs=3):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--root', help='benchmark an existing directory instead of a synthetic tree')
+    parser.add_argument('--dirs', type=int, default=500)
+    parser.add_argument('--files', type=int, default=220, help='files per directory')
+    parser.add_argument('--workers', type=int, default=scanner.SCAN_WORKERS)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = None
+    root = args.root
+    if root is None:
+        tmp = tempfile.mkdtemp(prefix='bench_scanner_')
+        root = tmp
+        print(f"Creating {args.dirs} directories x {args.files} files in {root}...")
+        make_tree(root, args.dirs, args.files)
+
+    try:
+        cases = [
+            ('get_images', lambda: legacy_get_images(root),
+             lambda: [f.to_dict() for f in scanner.walk_files(root, IMAGE_EXTENSIONS, args.workers)]),
+            ('get_items (root)', lambda: legacy_get_items(root),
+             lambda: scanner_get_items(root)),
+            ('directory tree', lambda: legacy_build_tree(root),
+             lambda: scanner.walk_dirs(root, '', args.workers)),
+        ]
+
+        print(f"{'listing':<20}{'legacy (ms)':>14}{'scanner (ms)':>14}{'speedup':>10}{'items':>10}")
+        for label, legacy, current in cases:
+            legacy_time, legacy_result = timed(legacy, runs=args.runs)
+            current_time, current_result = timed(current, runs=args.runs)
+            count = len(legacy_result) if isinstance(legacy_result, list) else len(legacy_result['images'])
+            print(f"{label:<20}{legacy_time * 1000:>14.1f}{current_time * 1000:>14.1f}"
+                  f"{legacy_time / current_time:>9.1f}x{count:>10}")
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
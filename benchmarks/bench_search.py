@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Prompt search benchmark
+Builds a synthetic index of ComfyUI-style prompts (500k images by default)
+and times /api/search queries against database.search_files.
+
+Usage: python benchmarks/bench_search.py [--files 500000] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+SUBJECTS = ['portrait of a woman', 'old man', 'cat', 'dragon', 'robot', 'castle', 'city street',
+            'forest', 'spaceship', 'knight', 'mountain lake', 'alley', 'market', 'lighthouse']
+STYLES = ['oil painting', 'photorealistic', 'anime', 'watercolor', 'cyberpunk', 'baroque',
+          'isometric', 'studio lighting', 'volumetric fog', 'golden hour', 'film grain']
+QUALITY = ['masterpiece', 'best quality', 'highly detailed', '8k', 'sharp focus']
+NEGATIVE = ['blurry', 'lowres', 'bad anatomy', 'watermark', 'jpeg artifacts', 'extra fingers']
+MODELS = ['juggernautXL_v9.safetensors', 'sd_xl_base_1.0.safetensors', 'dreamshaper_8.safetensors',
+          'flux1-dev-fp8.safetensors', 'realisticVision_v51.safetensors']
+TITLES = 'KSampler\nCheckpointLoaderSimple\nCLIPTextEncode\nVAEDecode\nSaveImage'
+
+
+def populate(count, seed=1):
+    rng = random.Random(seed)
+    files = []
+    documents = []
+    for i in range(count):
+        path = f"2024-{i // 50000 + 1:02d}-{i // 2000 % 25 + 1:02d}/ComfyUI_{i:07d}_.png"
+        files.append({'path': path, 'name': os.path.basename(path), 'size': 1000000,
+                      'modified': 1704067200.0 + i * 60})
+        words = rng.sample(SUBJECTS, 2) + rng.sample(STYLES, 3) + rng.sample(QUALITY, 2)
+        if i % 5000 == 0:
+            words.append('neon alley')  # rare phrase
+        documents.append((path, {
+            'positive': ', '.join(words),
+            'negative': ', '.join(rng.sample(NEGATIVE, 3)),
+            'titles': TITLES,
+            'models': rng.choice(MODELS),
+        }))
+
+    database.sync_files_to_database(files)
+    with database.get_db_connection() as conn:
+        for start in range(0, count, 10000):
+            database._index_search(conn, documents[start:start + 10000])
+        conn.commit()
+        conn.execute("INSERT INTO search(search) VALUES ('optimize')")
+        conn.commit()
+
+
+def timed(runs, func):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=500000)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_search_')
+    try:
+        database.set_database_path(tmp)
+        database.initialize_database()
+        print(f"Indexing {args.files} prompts...")
+        start = time.perf_counter()
+        populate(args.files)
+        print(f"Indexed in {time.perf_counter() - start:.1f}s")
+
+        _, first_page = database.search_files('dragon')
+        cases = [
+            ('rare phrase', lambda: database.search_files('neon alley')),
+            ('prefix', lambda: database.search_files('lighth')),
+            ('model name', lambda: database.search_files('flux1', field='models')),
+            ('2 common words', lambda: database.search_files('dragon anime')),
+            ('common + folder', lambda: database.search_files('dragon', folder='2024-03-07')),
+            ('common + dates', lambda: database.search_files('dragon', since=1704067200.0 + 86400 * 30,
+                                                             until=1704067200.0 + 86400 * 31)),
+            ('common, page 2', lambda: database.search_files('dragon', after=first_page)),
+            ('very common word', lambda: database.search_files('masterpiece')),
+        ]
+
+        print(f"{'query':<20}{'median (ms)':>14}{'results':>10}")
+        for label, func in cases:
+            median, (files, _) = timed(args.runs, func)
+            print(f"{label:<20}{median:>14.1f}{len(files):>10}")
+    finally:
+        database.close_connections()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
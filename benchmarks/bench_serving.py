@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Serving load test
+Starts the gallery under the development server (app.py) and the production
+server (serve.py) against the same generated output folder, then drives each
+with concurrent keep-alive clients fetching originals, thumbnails and folder
+listings, and reports throughput and latency.
+
+Usage: python benchmarks/bench_serving.py [--images 200] [--clients 16] [--duration 10]
+       [--workers 4] [--threads 8] [--mix image,thumbnail,browse]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+IMAGE_SIZE = (1024, 1024)  # Noise, so PNGs stay around 3 MB like real renders
+READY_TIMEOUT = 300
+
+
+def make_output(directory, count):
+    rng = random.Random(1)
+    os.makedirs(os.path.join(directory, 'batch'), exist_ok=True)
+    noise = Image.frombytes('RGB', IMAGE_SIZE, rng.randbytes(IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3))
+    paths = []
+    for i in range(count):
+        path = f"batch/ComfyUI_{i:05d}_.png"
+        # A different tint per file so thumbnails and hashes differ
+        Image.blend(noise, Image.new('RGB', IMAGE_SIZE, (i % 256, 80, 160)), 0.3).save(
+            os.path.join(directory, path), compress_level=1)
+        paths.append(path)
+    return paths
+
+
+def start_server(command, port, output_dir, thumbnail_dir, env_extra):
+    env = dict(os.environ, COMFYUI_OUTPUT_DIR=output_dir, GALLERY_THUMBNAIL_DIR=thumbnail_dir,
+               GALLERY_PORT=str(port), **env_extra)
+    return subprocess.Popen([sys.executable] + command, cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(port):
+    deadline = time.time() + READY_TIMEOUT
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/health/ready')
+            response = conn.getresponse()
+            body = json.loads(response.read())
+            conn.close()
+            if response.status == 200 and body['metadata']['state'] != 'running':
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server on port {port} did not become ready")
+
+
+def warm(port, paths):
+    """Generate every thumbnail first so both servers are measured on cached files"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    for path in paths:
+        conn.request('GET', f"/thumbnail/{path}?size=medium")
+        conn.getresponse().read()
+    conn.close()
+
+
+def client(args):
+    """One client process: request URLs round-robin until the deadline"""
+    port, urls, deadline, seed = args
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies = []
+    received = 0
+    errors = 0
+    while time.time() < deadline:
+        url = rng.choice(urls)
+        start = time.perf_counter()
+        try:
+            conn.request('GET', url, headers={'Accept-Encoding': 'gzip'})
+            response = conn.getresponse()
+            received += len(response.read())
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    return latencies, received, errors
+
+
+def run_load(port, urls, clients, duration):
+    deadline = time.time() + duration
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.map(client, [(port, urls, deadline, seed) for seed in range(clients)])
+    latencies = sorted(latency for result in results for latency in result[0])
+    received = sum(result[1] for result in results)
+    errors = sum(result[2] for result in results)
+    return latencies, received, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mix', default='image,thumbnail,browse')
+    parser.add_argument('--port', type=int, default=3190)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='gallery-bench-')
+    output_dir = os.path.join(workdir, 'output')
+    thumbnail_dir = os.path.join(workdir, 'thumbnails')
+    try:
+        print(f"Generating {args.images} images in {output_dir}...")
+        paths = make_output(output_dir, args.images)
+
+        urls = []
+        mix = set(args.mix.split(','))
+        if 'image' in mix:
+            urls += [f"/image/{path}" for path in paths]
+        if 'thumbnail' in mix:
+            urls += [f"/thumbnail/{path}?size=medium" for path in paths]
+        if 'browse' in mix:
+            urls += ['/api/browse/batch?format=columns'] * max(1, len(paths) // 10)
+
+        servers = [
+            ('development (app.py)', ['app.py'], {}),
+            (f"production (serve.py, {args.workers}x{args.threads})", ['serve.py'],
+             {'GALLERY_WORKERS': str(args.workers), 'GALLERY_THREADS': str(args.threads)}),
+        ]
+        print(f"{'server':<34}{'req/s':>10}{'MB/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+        for label, command, env in servers:
+            process = start_server(command, args.port, output_dir, thumbnail_dir, env)
+            try:
+                wait_ready(args.port)
+                warm(args.port, paths)
+                latencies, received, errors = run_load(args.port, urls, args.clients, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+            if not latencies:
+                print(f"{label:<34}{'no successful requests':>48}")
+                continue
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{label:<34}{len(latencies) / args.duration:>10.0f}"
+                  f"{received / args.duration / 1e6:>10.1f}{statistics.median(latencies):>10.1f}"
+                  f"{p99:>10.1f}{errors:>8}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate search benchmark
+Builds a similarity.HashIndex over random 64-bit hashes (1M by default)
+with planted near-duplicates, then times Hamming-radius queries against
+the index and against a linear scan.
+
+Usage: python benchmarks/bench_similarity.py [--hashes 1000000] [--queries 50]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import similarity
+
+
+def flip(rng, value, bits):
+    for position in rng.sample(range(similarity.HASH_BITS), bits):
+        value ^= 1 << position
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--hashes', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(similarity.HASH_BITS) for _ in range(args.hashes)]
+    # Each query hash gets a few variants, as a seed sweep would produce
+    queries = rng.sample(range(args.hashes), args.queries)
+    planted = []
+    for i in queries:
+        for bits in (1, 3, 6, 10):
+            planted.append(flip(rng, hashes[i], bits))
+    hashes += planted
+
+    start = time.perf_counter()
+    index = similarity.HashIndex()
+    index.update((f"img{i:07d}.png", value) for i, value in enumerate(hashes))
+    print(f"Indexed {len(index)} hashes in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'radius':<8}{'index median (ms)':>20}{'index max (ms)':>16}{'matches':>10}")
+    for radius in (0, 4, 6, 10, similarity.MAX_RADIUS):
+        times = []
+        matches = 0
+        for i in queries:
+            start = time.perf_counter()
+            matches += len(index.query(hashes[i], radius))
+            times.append((time.perf_counter() - start) * 1000)
+        print(f"{radius:<8}{statistics.median(times):>20.2f}{max(times):>16.2f}{matches / len(queries):>10.1f}")
+
+    value = hashes[queries[0]]
+    start = time.perf_counter()
+    linear = sum(1 for other in hashes if similarity.distance(value, other) <= 10)
+    print(f"linear scan, radius 10: {(time.perf_counter() - start) * 1000:.0f} ms ({linear} matches)")
+
+
+if __name__ == '__main__':
+    main()
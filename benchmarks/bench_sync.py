@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Startup sync benchmark
+Compares the original row-by-row sync_files_to_database with the staged,
+set-based sync on a synthetic library (1M files by default): a first sync,
+an unchanged re-sync, and a re-sync with edits, additions and deletions.
+
+Usage: python benchmarks/bench_sync.py [--files 1000000] [--skip-legacy]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import database
+
+
+def legacy_sync(files):
+    """sync_files_to_database before bulk staging: one statement per file"""
+    with database.get_db_connection() as conn:
+        existing_files = {}
+        for row in conn.execute('SELECT id, path, mtime FROM files'):
+            existing_files[row['path']] = {'id': row['id'], 'mtime': row['mtime']}
+
+        added = 0
+        updated = 0
+        for file in files:
+            file_path = file['path']
+            file_id = database.generate_file_id(file_path)
+            if file_path not in existing_files:
+                conn.execute('''
+                    INSERT INTO files (id, path, parent, name, mtime, size, type, last_synced)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (file_id, file_path, database.parent_of(file_path), file['name'], file['modified'],
+                      file.get('size', 0), database.get_file_type(file['name']), time.time()))
+                added += 1
+            elif existing_files[file_path]['mtime'] != file['modified']:
+                conn.execute('''
+                    UPDATE files SET name = ?, mtime = ?, size = ?, type = ?, last_synced = ?
+                    WHERE id = ?
+                ''', (file['name'], file['modified'], file.get('size', 0),
+                      database.get_file_type(file['name']), time.time(), file_id))
+                updated += 1
+            existing_files.pop(file_path, None)
+
+        deleted = 0
+        if existing_files:
+            file_ids_to_delete = [f['id'] for f in existing_files.values()]
+            placeholders = ','.join('?' * len(file_ids_to_delete))
+            conn.execute(f'DELETE FROM files WHERE id IN ({placeholders})', file_ids_to_delete)
+            deleted = len(file_ids_to_delete)
+
+        conn.commit()
+    return (added, updated, deleted)
+
+
+def make_files(count, start=0, mtime_offset=0):
+    return [{
+        'path': f"2024-{i // 100000:02d}-{i // 1000 % 100:02d}/ComfyUI_{i:07d}_.png",
+        'name': f"ComfyUI_{i:07d}_.png",
+        'size': 100000 + i % 50000,
+        'modified': 1700000000.0 + i + mtime_offset,
+    } for i in range(start, start + count)]
+
+
+def run_scenarios(label, sync, count):
+    tmp = tempfile.mkdtemp(prefix='bench_sync_')
+    try:
+        database.set_database_path(tmp)
+        database.initialize_database()
+
+        first = make_files(count)
+        # 5% edited, 5% deleted, 5% new
+        step = max(1, count // 20)
+        changed = [dict(file) for file in first[step:]]
+        for file in changed[:step]:
+            file['modified'] += 1
+        changed += make_files(step, start=count)
+
+        for scenario, files in (('first sync', first), ('unchanged', first), ('edits/adds/deletes', changed)):
+            start = time.perf_counter()
+            try:
+                result = sync(files)
+            except Exception as e:
+                result = f"failed: {e}"
+            elapsed = time.perf_counter() - start
+            print(f"{label:<10}{scenario:<22}{elapsed:>10.2f}s  {result}")
+    finally:
+        database.close_connections()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--skip-legacy', action='store_true', help='only time the bulk sync')
+    args = parser.parse_args()
+
+    print(f"{'sync':<10}{'scenario':<22}{'time':>11}  (added, updated, deleted)")
+    if not args.skip_legacy:
+        run_scenarios('legacy', legacy_sync, args.files)
+    run_scenarios('bulk', database.sync_files_to_database, args.files)
+
+
+if __name__ == '__main__':
+    main()
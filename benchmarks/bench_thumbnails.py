@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Thumbnail generation benchmark
+Compares the original full-decode thumbnail path with the reduced-resolution
+path in thumbnails.py (which writes every size variant) on large PNG/JPEG/WebP
+inputs. Each measurement runs in its own process so peak RSS is attributable
+to a single image.
+
+Usage: python benchmarks/bench_thumbnails.py [--sizes 4096 8192] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from PIL import Image, ImageDraw
+
+import thumbnails
+
+
+def legacy_thumbnail(image_path, thumbnail_path):
+    """The thumbnail path before the reduced-resolution decode change"""
+    with Image.open(image_path) as img:
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = background
+        img.thumbnail(thumbnails.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
+
+
+def fast_thumbnail(image_path, thumbnail_path):
+    """thumbnails.generate_thumbnail, writing into the benchmark's temp dir"""
+    thumbnails.set_thumbnail_dir(os.path.dirname(thumbnail_path))
+    thumbnails.generate_thumbnail(image_path, 'bench', 'jpg')
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_thumbnail,
+    'fast': fast_thumbnail,
+}
+
+
+def make_sample(path, size, fmt):
+    """Create a synthetic render with gradients, shapes and (for PNG) alpha"""
+    mode = 'RGBA' if fmt == 'PNG' else 'RGB'
+    img = Image.linear_gradient('L').resize((size, size)).convert(mode)
+    draw = ImageDraw.Draw(img)
+    for i in range(0, size, size // 16):
+        draw.ellipse((i, i // 2, i + size // 8, i // 2 + size // 8), fill=(200, 60, 120, 180)[:len(mode)])
+    if fmt == 'PNG':
+        img.save(path, fmt)
+    else:
+        img.save(path, fmt, quality=92)
+
+
+def run_child(implementation, image_path):
+    """Generate one thumbnail and report wall time and peak RSS"""
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        IMPLEMENTATIONS[implementation](image_path, os.path.join(tmp, 'thumb.jpg'))
+        elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'seconds': elapsed, 'peak_mb': peak_kb / 1024}))
+
+
+def measure(implementation, image_path, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, __file__, '--child', implementation, image_path]
+        )
+        results.append(json.loads(output))
+    return (min(r['seconds'] for r in results), max(r['peak_mb'] for r in results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4096, 8192])
+    parser.add_argument('--formats', nargs='+', default=['PNG', 'JPEG', 'WEBP'])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--child', nargs=2, metavar=('IMPL', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--make', nargs=3, metavar=('PATH', 'SIZE', 'FORMAT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+    if args.make:
+        make_sample(args.make[0], int(args.make[1]), args.make[2])
+        return
+
+    print(f"{'input':<16}{'impl':<8}{'time (ms)':>12}{'peak RSS (MB)':>16}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            for fmt in args.formats:
+                path = os.path.join(tmp, f"sample_{size}.{fmt.lower()}")
+                # Built in a child too: Linux carries peak RSS across fork/exec
+                subprocess.check_call([sys.executable, __file__, '--make', path, str(size), fmt])
+                for implementation in IMPLEMENTATIONS:
+                    seconds, peak_mb = measure(implementation, path, args.runs)
+                    label = f"{fmt} {size}px"
+                    print(f"{label:<16}{implementation:<8}{seconds * 1000:>12.1f}{peak_mb:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Response compression for ComfyUI Gallery
+Compresses buffered text responses (JSON, MessagePack, HTML) with brotli
+or gzip, whichever the client accepts; brotli needs the optional `brotli`
+package
+"""
+
+import gzip
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent as they are
+MIN_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/msgpack',
+    'application/javascript',
+    'text/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'image/svg+xml',
+}
+
+
+def set_min_size(size: int):
+    """Set the smallest response body that is compressed; 0 compresses everything"""
+    global MIN_SIZE
+    MIN_SIZE = size
+
+
+def supported_encodings():
+    """Content codings this server can produce, preferred first"""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    """Pick a content coding from a parsed Accept-Encoding header, or None"""
+    return accept_encodings.best_match(supported_encodings())
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a Flask response in place when it is worth it
+    File responses (send_file), streams, empty and partial responses and
+    anything already encoded are left alone. A strong ETag becomes weak,
+    since the bytes now differ from the uncompressed representation.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    if (response.status_code not in (200, 201) or 'Content-Encoding' in response.headers
+            or response.content_length is not None and response.content_length < MIN_SIZE):
+        return response
+
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -5,48 +5,150 @@ Handles SQLite database operations for image metadata and favorites
 
 import sqlite3
 import os
+import json
+import queue
 import time
 from contextlib import contextmanager
 from typing import List, Dict, Optional, Tuple
 
+from image_metadata import extract_generation_params, extract_search_text
+
 # Database configuration
-DB_SCHEMA_VERSION = 1
+DB_SCHEMA_VERSION = 7
 DATABASE_FOLDER_NAME = '.gallery_cache'
 DATABASE_FILENAME = 'gallery.db'
 
+# Connection pool: idle connections are kept and reused across requests. One
+# pool is shared by all threads rather than one connection per thread, so a
+# gthread worker holds at most POOL_SIZE idle connections however many
+# threads it runs
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 256
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
 # Will be set by initialize_database()
 DATABASE_DIR = None
 DATABASE_FILE = None
 
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)  # (database file, connection)
+
+# Full-text search columns and their bm25 weights; False when SQLite lacks FTS5
+SEARCH_COLUMNS = {'positive': 10.0, 'negative': 2.0, 'titles': 1.0, 'models': 5.0}
+SEARCH_ENABLED = False
+
+# Generation-parameter filters: query argument -> (facet, condition on generation g, value type)
+# _min/_max bounds are inclusive, _gt/_lt exclusive (cfg_gt=6 is "CFG > 6")
+GENERATION_FILTERS = {
+    'checkpoint': ('checkpoint', 'g.checkpoint = ?', str),
+    'lora': ('lora', 'EXISTS (SELECT 1 FROM generation_loras l WHERE l.path = g.path AND l.lora = ?)', str),
+    'sampler': ('sampler', 'g.sampler = ?', str),
+    'scheduler': ('scheduler', 'g.scheduler = ?', str),
+    'steps': ('steps', 'g.steps = ?', int),
+    'steps_min': ('steps', 'g.steps >= ?', int),
+    'steps_max': ('steps', 'g.steps <= ?', int),
+    'steps_gt': ('steps', 'g.steps > ?', int),
+    'steps_lt': ('steps', 'g.steps < ?', int),
+    'cfg': ('cfg', 'g.cfg = ?', float),
+    'cfg_min': ('cfg', 'g.cfg >= ?', float),
+    'cfg_max': ('cfg', 'g.cfg <= ?', float),
+    'cfg_gt': ('cfg', 'g.cfg > ?', float),
+    'cfg_lt': ('cfg', 'g.cfg < ?', float),
+    'seed': ('seed', 'g.seed = ?', str),
+    'width': ('size', 'g.width = ?', int),
+    'height': ('size', 'g.height = ?', int),
+}
+
+# Facets counted by /api/facets: name -> (value expression, GROUP BY columns)
+FACETS = {
+    'checkpoint': ('g.checkpoint', 'g.checkpoint'),
+    'sampler': ('g.sampler', 'g.sampler'),
+    'scheduler': ('g.scheduler', 'g.scheduler'),
+    'steps': ('g.steps', 'g.steps'),
+    'cfg': ('g.cfg', 'g.cfg'),
+    'size': ("g.width || 'x' || g.height", 'g.width, g.height'),
+}
+FACET_LIMIT = 50
+
 
 def set_database_path(base_path: str):
     """Set the database path based on the output directory"""
     global DATABASE_DIR, DATABASE_FILE
+    close_connections()
     DATABASE_DIR = os.path.join(base_path, DATABASE_FOLDER_NAME)
     DATABASE_FILE = os.path.join(DATABASE_DIR, DATABASE_FILENAME)
     os.makedirs(DATABASE_DIR, exist_ok=True)
 
 
+def _connect() -> sqlite3.Connection:
+    """Open a connection and apply the per-connection PRAGMAs once"""
+    conn = sqlite3.connect(DATABASE_FILE, timeout=30, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.row_factory = sqlite3.Row
+
+    # Enable WAL mode for better concurrent access
+    conn.execute('PRAGMA journal_mode=WAL;')
+    conn.execute('PRAGMA synchronous=NORMAL;')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE};')
+    conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB};')
+    conn.execute('PRAGMA temp_store=MEMORY;')
+
+    # Lets set-based statements derive columns exactly as Python does
+    conn.create_function('file_id', 1, generate_file_id, deterministic=True)
+    conn.create_function('parent_of', 1, parent_of, deterministic=True)
+    conn.create_function('file_type', 1, get_file_type, deterministic=True)
+    return conn
+
+
 @contextmanager
 def get_db_connection():
     """
     Context manager for database connections
-    Uses WAL mode for better concurrency
+    Connections come from a pool shared by all threads; each is used by
+    one thread at a time and returned when the block exits.
     """
     if DATABASE_FILE is None:
         raise RuntimeError("Database not initialized. Call set_database_path() first.")
 
-    conn = sqlite3.connect(DATABASE_FILE, timeout=30)
-    conn.row_factory = sqlite3.Row
-
-    # Enable WAL mode for better concurrent access
-    conn.execute('PRAGMA journal_mode=WAL;')
-    conn.execute('PRAGMA synchronous=NORMAL;')
+    path, conn = DATABASE_FILE, None
+    while conn is None:
+        try:
+            pooled_path, pooled = _pool.get_nowait()
+        except queue.Empty:
+            conn = _connect()
+            break
+        if pooled_path == path:
+            conn = pooled
+        else:
+            pooled.close()
 
     try:
         yield conn
     finally:
-        conn.close()
+        # Never hand the next caller a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        # Borrowed before set_database_path() switched files: don't keep it
+        if path != DATABASE_FILE:
+            conn.close()
+        else:
+            try:
+                _pool.put_nowait((path, conn))
+            except queue.Full:
+                conn.close()
+
+
+def close_connections():
+    """
+    Close all idle pooled connections
+    Connections checked out at the time are closed when they are returned
+    if the database path has changed in the meantime.
+    """
+    while True:
+        try:
+            _pool.get_nowait()[1].close()
+        except queue.Empty:
+            break
 
 
 def initialize_database():
@@ -54,6 +156,7 @@ def initialize_database():
     Initialize the database schema
     Creates tables if they don't exist
     """
+    global SEARCH_ENABLED
     print(f"INFO: Initializing database at {DATABASE_FILE}")
 
     with get_db_connection() as conn:
@@ -75,6 +178,9 @@ def initialize_database():
         else:
             print(f"INFO: Database schema up to date (version {stored_version})")
 
+        SEARCH_ENABLED = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search'").fetchone() is not None
+
 
 def create_schema(conn):
     """Create initial database schema"""
@@ -84,6 +190,7 @@ def create_schema(conn):
         CREATE TABLE IF NOT EXISTS files (
             id TEXT PRIMARY KEY,
             path TEXT NOT NULL UNIQUE,
+            parent TEXT NOT NULL DEFAULT '',
             name TEXT NOT NULL,
             mtime REAL NOT NULL,
             size INTEGER DEFAULT 0,
@@ -99,10 +206,249 @@ def create_schema(conn):
     conn.execute('CREATE INDEX IF NOT EXISTS idx_path ON files(path)')
     conn.execute('CREATE INDEX IF NOT EXISTS idx_mtime ON files(mtime DESC)')
 
+    create_metadata_table(conn)
+    create_listing_indexes(conn)
+    create_folder_tables(conn)
+    create_search_index(conn)
+    create_generation_tables(conn)
+    create_folder_versions(conn)
+
     conn.commit()
     print("INFO: Database schema created successfully")
 
 
+def create_metadata_table(conn):
+    """
+    Create the parsed-metadata index (schema version 2)
+    Rows are keyed by path and only valid while mtime/size match the file.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metadata (
+            path TEXT PRIMARY KEY,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            format TEXT,
+            mode TEXT,
+            width INTEGER DEFAULT 0,
+            height INTEGER DEFAULT 0,
+            prompt TEXT,
+            workflow TEXT,
+            workflow_summary TEXT,
+            parameters TEXT,
+            exif TEXT,
+            indexed_at REAL DEFAULT 0
+        )
+    ''')
+
+    # Metadata goes away with its file
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_metadata
+        AFTER DELETE ON files
+        BEGIN
+            DELETE FROM metadata WHERE path = old.path;
+        END
+    ''')
+
+
+def create_listing_indexes(conn):
+    """
+    Create the sorted-listing indexes (schema version 3)
+    Each ends with path so keyset pagination never needs a sort step.
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_mtime_path ON files(mtime, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_name_path ON files(name COLLATE NOCASE, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_size_path ON files(size, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_favorite_path ON files(is_favorite, mtime, path)')
+
+
+def create_folder_tables(conn):
+    """
+    Create the folder index (schema version 4)
+    files.parent holds each file's directory so a folder is one index range;
+    folders caches directory listings, valid while the directory's
+    st_mtime_ns still equals listed_mtime.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS folders (
+            path TEXT PRIMARY KEY,
+            parent TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mtime REAL DEFAULT 0,
+            listed_mtime INTEGER,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_folders_parent ON folders(parent, name COLLATE NOCASE)')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_parent_mtime ON files(parent, mtime, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_parent_name ON files(parent, name COLLATE NOCASE, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_parent_size ON files(parent, size, path)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_files_parent_favorite ON files(parent, is_favorite, mtime, path)')
+
+
+def create_folder_versions(conn):
+    """
+    Create the folder version triggers (schema version 7)
+    folders.version is bumped whenever a folder's listing could change: its
+    files are added, removed or edited (favorites included), or a subfolder
+    comes, goes or changes. The parent is bumped too, since it shows the
+    folder's image count. Listings use it as a cheap HTTP validator.
+    """
+    bump = '''
+        UPDATE folders SET version = version + 1
+        WHERE path IN ({0}, (SELECT parent FROM folders WHERE path = {0}))
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_files_insert_version
+        AFTER INSERT ON files
+        BEGIN
+            {bump.format('new.parent')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_files_delete_version
+        AFTER DELETE ON files
+        BEGIN
+            {bump.format('old.parent')};
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_files_update_version
+        AFTER UPDATE OF name, mtime, size, is_favorite, parent ON files
+        BEGIN
+            {bump.format('old.parent')};
+            {bump.format('new.parent')};
+        END
+    ''')
+
+    # A folder's own row is also updated when it is listed; only its
+    # parent's listing shows it
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_folders_insert_version
+        AFTER INSERT ON folders
+        BEGIN
+            UPDATE folders SET version = version + 1 WHERE path = new.parent AND path != new.path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_folders_delete_version
+        AFTER DELETE ON folders
+        BEGIN
+            UPDATE folders SET version = version + 1 WHERE path = old.parent AND path != old.path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_folders_update_version
+        AFTER UPDATE OF name, mtime ON folders
+        BEGIN
+            UPDATE folders SET version = version + 1 WHERE path = new.parent AND path != new.path;
+        END
+    ''')
+
+
+def create_search_index(conn):
+    """
+    Create the full-text prompt search index (schema version 5)
+    search_docs gives every indexed path a stable integer id that serves as
+    the FTS5 rowid; documents follow their metadata row on delete and move.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    try:
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+                {', '.join(SEARCH_COLUMNS)},
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"WARNING: Prompt search disabled, SQLite was built without FTS5: {e}")
+        return
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_metadata_delete_search
+        AFTER DELETE ON metadata
+        BEGIN
+            DELETE FROM search WHERE rowid = (SELECT id FROM search_docs WHERE path = old.path);
+            DELETE FROM search_docs WHERE path = old.path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_metadata_move_search
+        AFTER UPDATE OF path ON metadata
+        WHEN old.path != new.path
+        BEGIN
+            DELETE FROM search WHERE rowid = (SELECT id FROM search_docs WHERE path = new.path);
+            DELETE FROM search_docs WHERE path = new.path;
+            UPDATE search_docs SET path = new.path WHERE path = old.path;
+        END
+    ''')
+
+
+def create_generation_tables(conn):
+    """
+    Create the generation-parameter facet index (schema version 6)
+    One row per image with metadata and one per LoRA it uses; rows follow
+    their metadata row on delete and move.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generation (
+            path TEXT PRIMARY KEY,
+            checkpoint TEXT,
+            sampler TEXT,
+            scheduler TEXT,
+            steps INTEGER,
+            cfg REAL,
+            seed TEXT,
+            width INTEGER,
+            height INTEGER
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generation_loras (
+            path TEXT NOT NULL,
+            lora TEXT NOT NULL,
+            strength_model REAL,
+            strength_clip REAL,
+            PRIMARY KEY (path, lora)
+        ) WITHOUT ROWID
+    ''')
+
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_checkpoint ON generation(checkpoint, cfg)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_sampler ON generation(sampler, scheduler)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_scheduler ON generation(scheduler)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_steps ON generation(steps)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_cfg ON generation(cfg)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_seed ON generation(seed)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_size ON generation(width, height)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_generation_loras_lora ON generation_loras(lora, strength_model)')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_metadata_delete_generation
+        AFTER DELETE ON metadata
+        BEGIN
+            DELETE FROM generation WHERE path = old.path;
+            DELETE FROM generation_loras WHERE path = old.path;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_metadata_move_generation
+        AFTER UPDATE OF path ON metadata
+        WHEN old.path != new.path
+        BEGIN
+            DELETE FROM generation WHERE path = new.path;
+            DELETE FROM generation_loras WHERE path = new.path;
+            UPDATE generation SET path = new.path WHERE path = old.path;
+            UPDATE generation_loras SET path = new.path WHERE path = old.path;
+        END
+    ''')
+
+
 def migrate_schema(conn, from_version: int):
     """
     Migrate database schema to current version
@@ -111,6 +457,34 @@ def migrate_schema(conn, from_version: int):
     cursor = conn.execute("PRAGMA table_info(files)")
     columns = [row[1] for row in cursor.fetchall()]
 
+    if from_version < 2:
+        create_metadata_table(conn)
+
+    if from_version < 3:
+        create_listing_indexes(conn)
+
+    if from_version < 4:
+        if 'parent' not in columns:
+            conn.execute("ALTER TABLE files ADD COLUMN parent TEXT NOT NULL DEFAULT ''")
+        rows = conn.execute('SELECT path FROM files').fetchall()
+        conn.executemany('UPDATE files SET parent = ? WHERE path = ?',
+                         [(parent_of(row['path']), row['path']) for row in rows])
+        create_folder_tables(conn)
+
+    if from_version < 5:
+        # Filled from the stored metadata by index_search_backlog()
+        create_search_index(conn)
+
+    if from_version < 6:
+        # Filled from the stored metadata by index_generation_backlog()
+        create_generation_tables(conn)
+
+    if from_version < 7:
+        folder_columns = [row[1] for row in conn.execute("PRAGMA table_info(folders)")]
+        if 'version' not in folder_columns:
+            conn.execute("ALTER TABLE folders ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        create_folder_versions(conn)
+
     # Future migrations can be added here
     # Example:
     # if 'new_column' not in columns:
@@ -122,79 +496,148 @@ def migrate_schema(conn, from_version: int):
 def sync_files_to_database(files: List[Dict]) -> Tuple[int, int, int]:
     """
     Sync file list to database
+    The scan is staged into a temp table in one transaction and diffed
+    against the index with set-based SQL; only new and modified files
+    are written. Favorites are preserved.
     Returns: (added_count, updated_count, deleted_count)
     """
     with get_db_connection() as conn:
-        # Get existing files from database
-        existing_files = {}
-        for row in conn.execute('SELECT id, path, mtime FROM files'):
-            existing_files[row['path']] = {'id': row['id'], 'mtime': row['mtime']}
-
-        # Track changes
-        added = 0
-        updated = 0
-
-        # Process each file from disk
-        for file in files:
-            file_path = file['path']
-            file_id = generate_file_id(file_path)
-            file_mtime = file['modified']
-
-            if file_path not in existing_files:
-                # New file - insert
-                insert_file(conn, file, file_id)
-                added += 1
-            elif existing_files[file_path]['mtime'] != file_mtime:
-                # Modified file - update
-                update_file(conn, file, file_id)
-                updated += 1
-
-            # Remove from tracking dict (remaining files are deleted)
-            existing_files.pop(file_path, None)
-
-        # Delete files that no longer exist on disk
+        conn.execute('DROP TABLE IF EXISTS temp.sync_stage')
+        conn.execute('''
+            CREATE TEMP TABLE sync_stage (
+                path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER
+            )
+        ''')
+        conn.executemany('INSERT INTO temp.sync_stage (path, name, mtime, size) VALUES (?, ?, ?, ?)',
+                         ((f['path'], f['name'], f['modified'], f.get('size', 0)) for f in files))
+        staged = conn.execute('SELECT COUNT(*) FROM temp.sync_stage').fetchone()[0]
+        before = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+        # Insert new files and update those whose mtime changed
+        written = conn.execute('''
+            INSERT INTO files (id, path, parent, name, mtime, size, type, last_synced)
+            SELECT file_id(s.path), s.path, parent_of(s.path), s.name, s.mtime, s.size, file_type(s.name), ?
+            FROM temp.sync_stage s
+            LEFT JOIN files f ON f.path = s.path
+            WHERE f.path IS NULL OR f.mtime != s.mtime
+            ORDER BY s.path
+            ON CONFLICT(id) DO UPDATE SET
+                name = excluded.name, mtime = excluded.mtime, size = excluded.size,
+                type = excluded.type, last_synced = excluded.last_synced
+        ''', (time.time(),)).rowcount
+        after = conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        added = after - before
+
+        # Every staged file is now indexed, so any extra rows are files that
+        # no longer exist on disk
         deleted = 0
-        if existing_files:
-            file_ids_to_delete = [f['id'] for f in existing_files.values()]
-            placeholders = ','.join('?' * len(file_ids_to_delete))
-            conn.execute(f'DELETE FROM files WHERE id IN ({placeholders})', file_ids_to_delete)
-            deleted = len(file_ids_to_delete)
+        if after != staged:
+            # Indexing after the bulk load is cheaper than maintaining it per row
+            conn.execute('CREATE INDEX temp.idx_sync_stage_path ON sync_stage(path)')
+            deleted = conn.execute('''
+                DELETE FROM files
+                WHERE NOT EXISTS (SELECT 1 FROM temp.sync_stage s WHERE s.path = files.path)
+            ''').rowcount
 
         conn.commit()
+        conn.execute('DROP TABLE temp.sync_stage')
 
-    return (added, updated, deleted)
+    return (added, written - added, deleted)
 
 
-def insert_file(conn, file: Dict, file_id: str):
-    """Insert a new file record"""
-    conn.execute('''
-        INSERT INTO files (id, path, name, mtime, size, type, last_synced)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        file_id,
-        file['path'],
-        file['name'],
-        file['modified'],
-        file.get('size', 0),
-        get_file_type(file['name']),
-        time.time()
-    ))
-
-
-def update_file(conn, file: Dict, file_id: str):
-    """Update an existing file record"""
-    conn.execute('''
-        UPDATE files
-        SET name = ?, mtime = ?, size = ?, type = ?, last_synced = ?
-        WHERE id = ?
-    ''', (
-        file['name'],
-        file['modified'],
-        file.get('size', 0),
-        get_file_type(file['name']),
-        time.time(),
-        file_id
-    ))
+def upsert_files(files: List[Dict]) -> int:
+    """
+    Insert or update individual files without a full sync
+    Favorites are preserved. Returns the number of rows written.
+    """
+    if not files:
+        return 0
+
+    with get_db_connection() as conn:
+        _upsert_files(conn, files)
+        conn.commit()
+    return len(files)
+
+
+def _upsert_files(conn, files: List[Dict]):
+    now = time.time()
+    conn.executemany('''
+        INSERT INTO files (id, path, parent, name, mtime, size, type, last_synced)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name, mtime = excluded.mtime, size = excluded.size,
+            type = excluded.type, last_synced = excluded.last_synced
+    ''', [(generate_file_id(f['path']), f['path'], parent_of(f['path']), f['name'], f['modified'],
+           f.get('size', 0), get_file_type(f['name']), now) for f in files])
+
+
+def delete_files(file_paths: List[str]) -> int:
+    """Delete files by path; returns the number of rows removed"""
+    if not file_paths:
+        return 0
+
+    with get_db_connection() as conn:
+        cursor = conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in file_paths])
+        conn.commit()
+        return cursor.rowcount
+
+
+def delete_directory(dir_path: str) -> List[str]:
+    """Delete every file and folder below a directory; returns the removed file paths"""
+    with get_db_connection() as conn:
+        removed = _delete_directory(conn, dir_path)
+        conn.commit()
+    return removed
+
+
+def _delete_directory(conn, dir_path: str) -> List[str]:
+    prefix = dir_path.rstrip('/\\') + os.sep
+    rows = conn.execute('SELECT path FROM files WHERE substr(path, 1, ?) = ?',
+                        (len(prefix), prefix)).fetchall()
+    removed = [row['path'] for row in rows]
+    conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in removed])
+    conn.execute('DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?',
+                 (dir_path, len(prefix), prefix))
+    return removed
+
+
+def move_path(old_path: str, new_path: str) -> List[Tuple[str, str]]:
+    """
+    Rename a file, or every file below a directory, keeping favorites and
+    indexed metadata. Returns the (old, new) path of each file moved.
+    """
+    old_prefix = old_path.rstrip('/\\') + os.sep
+    new_prefix = new_path.rstrip('/\\') + os.sep
+
+    with get_db_connection() as conn:
+        rows = conn.execute('''
+            SELECT path FROM files WHERE path = ? OR substr(path, 1, ?) = ?
+        ''', (old_path, len(old_prefix), old_prefix)).fetchall()
+
+        renames = []
+        for row in rows:
+            path = row['path']
+            moved = new_path if path == old_path else new_prefix + path[len(old_prefix):]
+            renames.append((path, moved))
+
+        # Anything already at the destination is being replaced
+        conn.executemany('DELETE FROM files WHERE path = ?', [(new,) for _, new in renames])
+        conn.executemany('''
+            UPDATE files SET id = ?, path = ?, parent = ?, name = ?, last_synced = ? WHERE path = ?
+        ''', [(generate_file_id(new), new, parent_of(new), os.path.basename(new), time.time(), old)
+              for old, new in renames])
+        conn.executemany('UPDATE OR REPLACE metadata SET path = ? WHERE path = ?',
+                         [(new, old) for old, new in renames])
+
+        # Moved folders are re-listed the next time they're browsed
+        conn.execute('DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?',
+                     (old_path, len(old_prefix), old_prefix))
+        conn.commit()
+
+    return renames
 
 
 def get_file_type(filename: str) -> str:
@@ -207,40 +650,193 @@ def get_file_type(filename: str) -> str:
     return 'unknown'
 
 
+def parent_of(file_path: str) -> str:
+    """Directory of a relative path, '' for the output root"""
+    return os.path.dirname(file_path)
+
+
 def generate_file_id(file_path: str) -> str:
     """Generate a unique file ID from path"""
     # Use path as ID (can be enhanced with hashing if needed)
     return file_path.replace('\\', '/').replace('/', '_').replace('.', '_')
 
 
-def get_files_with_favorites(files: List[Dict]) -> List[Dict]:
+# Sort name -> ORDER BY columns; path is always the final tie-breaker
+SORT_COLUMNS = {
+    'mtime': ['mtime'],
+    'name': ['name COLLATE NOCASE'],
+    'size': ['size'],
+    'favorite': ['is_favorite', 'mtime'],
+}
+
+
+def get_files_page(sort: str = 'mtime', descending: bool = True, after: Optional[List] = None,
+                   limit: int = 200, parent: Optional[str] = None) -> Tuple[List[Dict], Optional[List]]:
     """
-    Enhance file list with favorite status from database
+    Get one page of files using keyset pagination
+    after: sort values of the last row of the previous page, then its path.
+    parent: only files directly in this folder ('' for the root).
+    Returns: (files, cursor values for the next page or None)
     """
-    if not files:
-        return files
+    columns = SORT_COLUMNS[sort] + ['path']
+    direction = 'DESC' if descending else 'ASC'
+    order_by = ', '.join(f'{column} {direction}' for column in columns)
+
+    conditions = []
+    params = []
+    if parent is not None:
+        conditions.append('parent = ?')
+        params.append(parent)
+    if after is not None:
+        if len(after) != len(columns):
+            raise ValueError('Cursor does not match sort')
+        comparison = '<' if descending else '>'
+        # The bound on the leading column lets SQLite seek even when the
+        # row-value comparison carries a collation
+        conditions.append(f"{columns[0]} {comparison}= ?")
+        conditions.append(f"({', '.join(columns)}) {comparison} ({', '.join('?' * len(columns))})")
+        params.append(after[0])
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
 
     with get_db_connection() as conn:
-        # Get all file paths
-        file_paths = [f['path'] for f in files]
-        placeholders = ','.join('?' * len(file_paths))
-
-        # Query favorites
-        cursor = conn.execute(
-            f'SELECT path, is_favorite FROM files WHERE path IN ({placeholders})',
-            file_paths
-        )
+        rows = conn.execute(f'''
+            SELECT path, name, mtime, size, is_favorite FROM files
+            {where}
+            ORDER BY {order_by}
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+
+    files = [_file_from_row(row) for row in rows[:limit]]
+
+    cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        cursor = [last[column.split()[0]] for column in SORT_COLUMNS[sort]] + [last['path']]
+    return files, cursor
+
+
+def _file_from_row(row) -> Dict:
+    return {
+        'path': row['path'],
+        'name': row['name'],
+        'size': row['size'],
+        'modified': row['mtime'],
+        'is_favorite': bool(row['is_favorite'])
+    }
+
+
+def get_folder_listed_mtime(folder_path: str) -> Optional[int]:
+    """The directory mtime (ns) at which a folder was last listed, or None"""
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT listed_mtime FROM folders WHERE path = ?', (folder_path,)).fetchone()
+    return row['listed_mtime'] if row else None
 
-        # Create lookup dict
-        favorites_map = {row['path']: bool(row['is_favorite']) for row in cursor}
 
-    # Add is_favorite to each file
-    for file in files:
-        file['is_favorite'] = favorites_map.get(file['path'], False)
+def get_folder_version(folder_path: str) -> Optional[Tuple[int, int]]:
+    """The (listed_mtime, version) pair of an indexed folder listing, or None"""
+    with get_db_connection() as conn:
+        row = conn.execute('SELECT listed_mtime, version FROM folders WHERE path = ?', (folder_path,)).fetchone()
+    return (row['listed_mtime'], row['version']) if row and row['listed_mtime'] is not None else None
 
+
+def save_folder_listing(folder_path: str, listed_mtime: int, folders: List[Dict], files: List[Dict]):
+    """
+    Bring the indexed contents of one folder in line with a fresh directory listing
+    folders: subfolders as {'path', 'name', 'modified'}; files as for
+    sync_files_to_database. Only rows that were added, removed or changed
+    are written (the watcher has usually applied them already), so the
+    version triggers fire only for real changes. Favorites of files still
+    present are kept; subfolders that are gone are removed along with
+    everything below them.
+    """
+    with get_db_connection() as conn:
+        indexed = {row['path']: (row['mtime'], row['size']) for row in conn.execute(
+            'SELECT path, mtime, size FROM files WHERE parent = ?', (folder_path,))}
+        _upsert_files(conn, [f for f in files
+                             if indexed.get(f['path']) != (f['modified'], f.get('size', 0))])
+
+        present = {f['path'] for f in files}
+        conn.executemany('DELETE FROM files WHERE path = ?', [(p,) for p in indexed if p not in present])
+
+        indexed = {row['path']: row['mtime'] for row in conn.execute(
+            'SELECT path, mtime FROM folders WHERE parent = ? AND path != ?', (folder_path, folder_path))}
+        present = {f['path'] for f in folders}
+        for path in indexed:
+            if path not in present:
+                _delete_directory(conn, path)
+
+        conn.executemany('''
+            INSERT INTO folders (path, parent, name, mtime) VALUES (?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime
+        ''', [(f['path'], folder_path, f['name'], f['modified']) for f in folders
+              if f['path'] not in indexed or indexed[f['path']] != f['modified']])
+
+        conn.execute('''
+            INSERT INTO folders (path, parent, name, mtime, listed_mtime) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, listed_mtime = excluded.listed_mtime
+        ''', (folder_path, parent_of(folder_path), os.path.basename(folder_path),
+              listed_mtime / 1e9, listed_mtime))
+        conn.commit()
+
+
+def get_folder_contents(folder_path: str) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Get a folder's subfolders (with direct image counts) and images, newest first
+    Returns: (folders, files)
+    """
+    with get_db_connection() as conn:
+        folders = [{
+            'path': row['path'],
+            'name': row['name'],
+            'modified': row['mtime'],
+            'image_count': row['image_count']
+        } for row in conn.execute('''
+            SELECT path, name, mtime,
+                   (SELECT COUNT(*) FROM files WHERE files.parent = folders.path) AS image_count
+            FROM folders
+            WHERE parent = ? AND path != ?
+            ORDER BY name COLLATE NOCASE
+        ''', (folder_path, folder_path))]
+
+        files = [_file_from_row(row) for row in conn.execute('''
+            SELECT path, name, mtime, size, is_favorite FROM files
+            WHERE parent = ?
+            ORDER BY mtime DESC, path DESC
+        ''', (folder_path,))]
+
+    return folders, files
+
+
+def count_files(parent: Optional[str] = None) -> int:
+    """Count indexed files, optionally only those directly in one folder"""
+    with get_db_connection() as conn:
+        if parent is None:
+            return conn.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM files WHERE parent = ?', (parent,)).fetchone()[0]
+
+
+def get_files(file_paths: List[str]) -> Dict[str, Dict]:
+    """Get file records for a list of paths, keyed by path; unknown paths are left out"""
+    files = {}
+    with get_db_connection() as conn:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(file_paths), 500):
+            chunk = file_paths[start:start + 500]
+            for row in conn.execute(f'''
+                SELECT path, name, mtime, size, is_favorite FROM files
+                WHERE path IN ({','.join('?' * len(chunk))})
+            ''', chunk):
+                files[row['path']] = _file_from_row(row)
     return files
 
 
+def get_folder_paths(folder_path: str) -> List[str]:
+    """Paths of the indexed files directly in one folder"""
+    with get_db_connection() as conn:
+        return [row[0] for row in conn.execute('SELECT path FROM files WHERE parent = ?', (folder_path,))]
+
+
 def toggle_favorite(file_path: str) -> bool:
     """
     Toggle favorite status for a file
@@ -275,11 +871,9 @@ def set_favorite_batch(file_paths: List[str], is_favorite: bool) -> int:
     file_ids = [generate_file_id(path) for path in file_paths]
 
     with get_db_connection() as conn:
-        placeholders = ','.join('?' * len(file_ids))
-        cursor = conn.execute(
-            f'UPDATE files SET is_favorite = ? WHERE id IN ({placeholders})',
-            [1 if is_favorite else 0] + file_ids
-        )
+        value = 1 if is_favorite else 0
+        cursor = conn.executemany('UPDATE files SET is_favorite = ? WHERE id = ?',
+                                  [(value, file_id) for file_id in file_ids])
         conn.commit()
         return cursor.rowcount
 
@@ -319,6 +913,439 @@ def get_favorite_count() -> int:
         return row['count'] if row else 0
 
 
+# JSON columns of the metadata table and the default for missing values
+METADATA_JSON_FIELDS = {
+    'prompt': None,
+    'workflow': None,
+    'workflow_summary': None,
+    'parameters': {},
+    'exif': {},
+}
+
+
+# Fields of the /api/metadata response and the index columns they are read from
+METADATA_FIELDS = {
+    'format': ['format'],
+    'size': ['width', 'height'],
+    'mode': ['mode'],
+    'file_size': [],
+    **{field: [field] for field in METADATA_JSON_FIELDS},
+}
+
+# Large JSON fields; the 'available' field lists which are present without their content
+METADATA_LARGE_FIELDS = ('prompt', 'workflow', 'exif')
+
+
+def parse_metadata_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated field selection; None selects every field except 'available'"""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in METADATA_FIELDS and field != 'available']
+    if unknown:
+        raise ValueError(f"Unknown metadata field: {unknown[0]}")
+    return fields
+
+
+def select_metadata_fields(metadata: Dict, fields: Optional[List[str]]) -> Dict:
+    """Project freshly parsed metadata onto a field selection, as the index query would"""
+    if fields is None:
+        return metadata
+    selected = {field: metadata.get(field, METADATA_JSON_FIELDS.get(field))
+                for field in fields if field in METADATA_FIELDS}
+    if 'available' in fields:
+        selected['available'] = [field for field in METADATA_LARGE_FIELDS if metadata.get(field)]
+    if 'error' in metadata:
+        selected['error'] = metadata['error']
+    return selected
+
+
+def _metadata_from_row(row, fields: Optional[List[str]] = None) -> Dict:
+    """Rebuild the /api/metadata response shape, or a selection of it, from an index row"""
+    metadata = {}
+    for field in fields or METADATA_FIELDS:
+        if field == 'size':
+            metadata['size'] = {'width': row['width'], 'height': row['height']}
+        elif field == 'file_size':
+            metadata['file_size'] = row['size']
+        elif field == 'available':
+            metadata['available'] = [name for name in METADATA_LARGE_FIELDS if row[f'has_{name}']]
+        elif field in METADATA_JSON_FIELDS:
+            metadata[field] = json.loads(row[field]) if row[field] is not None else METADATA_JSON_FIELDS[field]
+        else:
+            metadata[field] = row[field]
+    return metadata
+
+
+def get_metadata(file_path: str, mtime: float, size: int, fields: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Get indexed metadata for a file
+    Returns None when the file is not indexed or has changed since.
+    """
+    return get_metadata_batch([(file_path, mtime, size)], fields).get(file_path)
+
+
+def get_metadata_batch(entries: List[Tuple[str, float, int]],
+                       fields: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """
+    Get indexed metadata for many files, reading only the selected columns
+    entries: (path, mtime, size) of each file as it is on disk.
+    Returns metadata by path; files not indexed or changed since are left out.
+    """
+    columns = ['path', 'mtime', 'size']
+    for field in fields or METADATA_FIELDS:
+        columns.extend(column for column in METADATA_FIELDS.get(field, []) if column not in columns)
+    if fields and 'available' in fields:
+        # Missing values are stored as 'null', '{}' or '[]'
+        columns.extend(f"length({name}) > 4 AS has_{name}" for name in METADATA_LARGE_FIELDS)
+
+    current = {path: (mtime, size) for path, mtime, size in entries}
+    paths = list(current)
+    metadata = {}
+    with get_db_connection() as conn:
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            for row in conn.execute(f'''
+                SELECT {', '.join(columns)} FROM metadata
+                WHERE path IN ({','.join('?' * len(chunk))})
+            ''', chunk):
+                if current[row['path']] == (row['mtime'], row['size']):
+                    metadata[row['path']] = _metadata_from_row(row, fields)
+    return metadata
+
+
+def save_metadata(file_path: str, mtime: float, size: int, metadata: Dict):
+    """Store parsed metadata for a single file"""
+    save_metadata_batch([(file_path, mtime, size, metadata)])
+
+
+def save_metadata_batch(entries: List[Tuple[str, float, int, Dict]]):
+    """
+    Store parsed metadata for many files in one transaction
+    entries: (path, mtime, size, metadata) tuples
+    """
+    if not entries:
+        return
+
+    now = time.time()
+    rows = []
+    dimensions = []
+    for file_path, mtime, size, metadata in entries:
+        width = metadata.get('size', {}).get('width', 0)
+        height = metadata.get('size', {}).get('height', 0)
+        rows.append((
+            file_path,
+            mtime,
+            size,
+            metadata.get('format'),
+            metadata.get('mode'),
+            width,
+            height,
+            *(json.dumps(metadata.get(field, default), default=str)
+              for field, default in METADATA_JSON_FIELDS.items()),
+            now
+        ))
+        dimensions.append((f"{width}x{height}", file_path))
+
+    with get_db_connection() as conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO metadata
+                (path, mtime, size, format, mode, width, height,
+                 prompt, workflow, workflow_summary, parameters, exif, indexed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.executemany('UPDATE files SET dimensions = ? WHERE path = ?', dimensions)
+        _index_search(conn, [(file_path, extract_search_text(metadata))
+                             for file_path, _, _, metadata in entries])
+        _index_generation(conn, [(file_path, extract_generation_params(metadata))
+                                 for file_path, _, _, metadata in entries])
+        conn.commit()
+
+
+def _index_search(conn, entries: List[Tuple[str, Dict[str, str]]]):
+    """Replace the search documents of (path, search text) entries"""
+    if not SEARCH_ENABLED or not entries:
+        return
+
+    paths = [(file_path,) for file_path, _ in entries]
+    conn.executemany('INSERT OR IGNORE INTO search_docs (path) VALUES (?)', paths)
+    conn.executemany('DELETE FROM search WHERE rowid = (SELECT id FROM search_docs WHERE path = ?)', paths)
+    conn.executemany(f'''
+        INSERT INTO search (rowid, {', '.join(SEARCH_COLUMNS)})
+        SELECT id, {', '.join('?' * len(SEARCH_COLUMNS))} FROM search_docs WHERE path = ?
+    ''', [(*(text[column] for column in SEARCH_COLUMNS), file_path) for file_path, text in entries])
+
+
+def _index_backlog(table: str, index, label: str, batch_size: int) -> int:
+    """
+    Run index(conn, [(path, metadata)]) for stored metadata rows that have
+    no row in table yet. Works from the stored JSON, so no image is re-read.
+    """
+    indexed = 0
+    with get_db_connection() as conn:
+        while True:
+            rows = conn.execute(f'''
+                SELECT m.path, m.prompt, m.workflow, m.parameters, m.width, m.height
+                FROM metadata m
+                LEFT JOIN {table} t ON t.path = m.path
+                WHERE t.path IS NULL
+                LIMIT ?
+            ''', (batch_size,)).fetchall()
+            if not rows:
+                break
+
+            index(conn, [(row['path'], {
+                **{field: json.loads(row[field]) if row[field] is not None else None
+                   for field in ('prompt', 'workflow', 'parameters')},
+                'size': {'width': row['width'], 'height': row['height']}
+            }) for row in rows])
+            conn.commit()
+            indexed += len(rows)
+
+    if indexed:
+        print(f"INFO: Indexed {label} for {indexed} files")
+    return indexed
+
+
+def index_search_backlog(batch_size: int = 500) -> int:
+    """
+    Add search documents for metadata indexed before prompt search existed
+    Returns the number of files indexed.
+    """
+    if not SEARCH_ENABLED:
+        return 0
+    return _index_backlog('search_docs', lambda conn, entries: _index_search(
+        conn, [(path, extract_search_text(metadata)) for path, metadata in entries]
+    ), 'prompt search text', batch_size)
+
+
+def index_generation_backlog(batch_size: int = 500) -> int:
+    """
+    Add generation parameters for metadata indexed before facets existed
+    Returns the number of files indexed.
+    """
+    return _index_backlog('generation', lambda conn, entries: _index_generation(
+        conn, [(path, extract_generation_params(metadata)) for path, metadata in entries]
+    ), 'generation parameters', batch_size)
+
+
+def fts_query(text: str, field: Optional[str] = None) -> str:
+    """
+    Turn free text into an FTS5 query
+    Every word must match, the last one as a prefix so results follow typing.
+    field restricts the match to one of SEARCH_COLUMNS.
+    """
+    words = [word for word in text.split() if any(c.isalnum() for c in word)]
+    if not words:
+        raise ValueError('Search query is empty')
+    if field is not None and field not in SEARCH_COLUMNS:
+        raise ValueError(f"Unknown search field '{field}', expected one of: {', '.join(SEARCH_COLUMNS)}")
+
+    phrases = ['"' + word.replace('"', '""') + '"' for word in words]
+    phrases[-1] += '*'
+    query = ' '.join(phrases)
+    return f'{field} : ({query})' if field else query
+
+
+def search_files(text: str, field: Optional[str] = None, folder: Optional[str] = None,
+                 since: Optional[float] = None, until: Optional[float] = None,
+                 after: Optional[List] = None, limit: int = 50) -> Tuple[List[Dict], Optional[List]]:
+    """
+    Full-text search over prompts, node titles and model names, best match first
+    folder: only files in this folder or below. since/until: mtime range,
+    until exclusive. after: [score, path] of the last row of the previous page.
+    Returns: (files with their 'score', cursor values for the next page or None)
+    """
+    if not SEARCH_ENABLED:
+        raise RuntimeError('Prompt search is not available: SQLite was built without FTS5')
+
+    conditions = []
+    params = [fts_query(text, field)]
+    if folder:
+        # Everything under folder/ sorts between 'folder/' and 'folder0'
+        prefix = folder.rstrip('/\\') + os.sep
+        conditions.append('f.path > ? AND f.path < ?')
+        params.extend([prefix, prefix[:-1] + chr(ord(os.sep) + 1)])
+    if since is not None:
+        conditions.append('f.mtime >= ?')
+        params.append(since)
+    if until is not None:
+        conditions.append('f.mtime < ?')
+        params.append(until)
+    if after is not None:
+        if len(after) != 2:
+            raise ValueError('Cursor does not match search')
+        conditions.append('(h.score, f.path) > (?, ?)')
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    weights = ', '.join(str(weight) for weight in SEARCH_COLUMNS.values())
+
+    with get_db_connection() as conn:
+        rows = conn.execute(f'''
+            WITH hits AS (
+                SELECT d.path, bm25(search, {weights}) AS score
+                FROM search
+                JOIN search_docs d ON d.id = search.rowid
+                WHERE search MATCH ?
+            )
+            SELECT f.path, f.name, f.mtime, f.size, f.is_favorite, h.score
+            FROM hits h
+            JOIN files f ON f.path = h.path
+            {where}
+            ORDER BY h.score, f.path
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+
+    files = []
+    for row in rows[:limit]:
+        file = _file_from_row(row)
+        file['score'] = row['score']
+        files.append(file)
+
+    cursor = None
+    if len(rows) > limit:
+        cursor = [rows[limit - 1]['score'], rows[limit - 1]['path']]
+    return files, cursor
+
+
+def get_files_missing_metadata() -> List[Dict]:
+    """Get files whose metadata is not indexed or out of date"""
+    with get_db_connection() as conn:
+        cursor = conn.execute('''
+            SELECT f.path, f.mtime, f.size
+            FROM files f
+            LEFT JOIN metadata m ON m.path = f.path
+            WHERE m.path IS NULL OR m.mtime != f.mtime OR m.size != f.size
+            ORDER BY f.mtime DESC
+        ''')
+        return [{'path': row['path'], 'mtime': row['mtime'], 'size': row['size']} for row in cursor]
+
+
+def _index_generation(conn, entries: List[Tuple[str, Dict]]):
+    """Replace the generation parameters and LoRAs of (path, params) entries"""
+    if not entries:
+        return
+
+    conn.executemany('DELETE FROM generation_loras WHERE path = ?', [(path,) for path, _ in entries])
+    conn.executemany('''
+        INSERT OR REPLACE INTO generation (path, checkpoint, sampler, scheduler, steps, cfg, seed, width, height)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(path, params['checkpoint'], params['sampler'], params['scheduler'], params['steps'],
+           params['cfg'], params['seed'], params['width'], params['height']) for path, params in entries])
+    conn.executemany('''
+        INSERT OR IGNORE INTO generation_loras (path, lora, strength_model, strength_clip)
+        VALUES (?, ?, ?, ?)
+    ''', [(path, *lora) for path, params in entries for lora in params['loras']])
+
+
+def _generation_conditions(filters: List[Tuple[str, str]], skip_facet: Optional[str] = None) -> Tuple[List[str], List]:
+    """
+    SQL conditions on generation g for (query argument, value) filters
+    Filters on skip_facet are left out, so a facet's counts show the
+    alternatives to its current selection.
+    """
+    conditions = []
+    params = []
+    for name, value in filters:
+        if name not in GENERATION_FILTERS:
+            raise ValueError(f"Unknown filter '{name}', expected one of: {', '.join(GENERATION_FILTERS)}")
+        facet, condition, value_type = GENERATION_FILTERS[name]
+        if facet == skip_facet:
+            continue
+        try:
+            params.append(value_type(value))
+        except ValueError:
+            raise ValueError(f"Invalid value for {name}: '{value}'")
+        conditions.append(condition)
+    return conditions, params
+
+
+def get_facets(filters: List[Tuple[str, str]], limit: int = FACET_LIMIT) -> Dict:
+    """
+    Count images per generation-parameter value, most common first
+    filters: (query argument, value) pairs from GENERATION_FILTERS; each
+    facet is counted with the filters on the other facets applied.
+    Returns: {'total': matching images, 'facets': {name: [{'value', 'count'}]}}
+    """
+    def where(conditions):
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    facets = {}
+    with get_db_connection() as conn:
+        conditions, params = _generation_conditions(filters)
+        total = conn.execute(f'SELECT COUNT(*) FROM generation g {where(conditions)}', params).fetchone()[0]
+
+        for name, (value, group_by) in FACETS.items():
+            conditions, params = _generation_conditions(filters, skip_facet=name)
+            conditions = [f'{value} IS NOT NULL'] + conditions
+            facets[name] = [{'value': row['value'], 'count': row['count']} for row in conn.execute(f'''
+                SELECT {value} AS value, COUNT(*) AS count FROM generation g
+                {where(conditions)}
+                GROUP BY {group_by}
+                ORDER BY count DESC, value
+                LIMIT ?
+            ''', params + [limit])]
+
+        conditions, params = _generation_conditions(filters, skip_facet='lora')
+        join = 'JOIN generation g ON g.path = l.path' if conditions else ''
+        facets['lora'] = [{'value': row['value'], 'count': row['count']} for row in conn.execute(f'''
+            SELECT l.lora AS value, COUNT(*) AS count FROM generation_loras l
+            {join}
+            {where(conditions)}
+            GROUP BY l.lora
+            ORDER BY count DESC, value
+            LIMIT ?
+        ''', params + [limit])]
+
+    return {'total': total, 'facets': facets}
+
+
+def get_generation_page(filters: List[Tuple[str, str]], after: Optional[List] = None,
+                        limit: int = 200) -> Tuple[List[Dict], Optional[List]]:
+    """
+    Get one page of images matching generation-parameter filters, newest first
+    after: [mtime, path] of the last row of the previous page.
+    Each file carries its parameters under 'generation'.
+    Returns: (files, cursor values for the next page or None)
+    """
+    conditions, params = _generation_conditions(filters)
+    if after is not None:
+        if len(after) != 2:
+            raise ValueError('Cursor does not match sort')
+        conditions.append('f.mtime <= ?')
+        conditions.append('(f.mtime, f.path) < (?, ?)')
+        params.extend([after[0], *after])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    with get_db_connection() as conn:
+        rows = conn.execute(f'''
+            SELECT f.path, f.name, f.mtime, f.size, f.is_favorite,
+                   g.checkpoint, g.sampler, g.scheduler, g.steps, g.cfg, g.seed, g.width, g.height,
+                   (SELECT json_group_array(json_object('name', lora, 'strength_model', strength_model,
+                                                        'strength_clip', strength_clip))
+                    FROM generation_loras l WHERE l.path = g.path) AS loras
+            FROM generation g
+            JOIN files f ON f.path = g.path
+            {where}
+            ORDER BY f.mtime DESC, f.path DESC
+            LIMIT ?
+        ''', params + [limit + 1]).fetchall()
+
+    files = []
+    for row in rows[:limit]:
+        file = _file_from_row(row)
+        file['generation'] = {field: row[field] for field in
+                              ('checkpoint', 'sampler', 'scheduler', 'steps', 'cfg', 'seed', 'width', 'height')}
+        file['generation']['loras'] = json.loads(row['loras'])
+        files.append(file)
+
+    cursor = None
+    if len(rows) > limit:
+        cursor = [rows[limit - 1]['mtime'], rows[limit - 1]['path']]
+    return files, cursor
+
+
 def cleanup_database():
     """
     Cleanup database - remove orphaned records
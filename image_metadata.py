@@ -0,0 +1,509 @@
+"""
+Image metadata module for ComfyUI Gallery
+Reads ComfyUI prompt/workflow metadata without decoding pixel data
+"""
+
+import json
+import os
+import re
+import struct
+import zlib
+from typing import Dict, Optional
+
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_TEXT_CHUNKS = {b'tEXt', b'zTXt', b'iTXt'}
+
+# PIL mode for PNG (bit depth, color type) pairs, see the PNG spec's IHDR table
+PNG_MODES = {
+    (1, 0): '1',
+    (16, 0): 'I;16',
+}
+PNG_COLOR_TYPE_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+
+
+def read_png_chunks(file_path: str) -> Optional[Dict]:
+    """
+    Read IHDR and the text chunks of a PNG, seeking past everything else
+    Image data (IDAT) is never read, so the cost is a handful of small reads
+    regardless of image size. Returns None if the file is not a PNG.
+    """
+    info = {'width': 0, 'height': 0, 'mode': None, 'text': {}, 'has_exif': False}
+
+    # Unbuffered: every chunk header is a single small read, and seeks over
+    # IDAT don't drag the following bytes into a read-ahead buffer
+    with open(file_path, 'rb', buffering=0) as f:
+        if f.read(8) != PNG_SIGNATURE:
+            return None
+
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            length, chunk_type = struct.unpack('>I4s', header)
+
+            if chunk_type == b'IHDR':
+                data = f.read(length)
+                width, height, bit_depth, color_type = struct.unpack('>IIBB', data[:10])
+                info['width'] = width
+                info['height'] = height
+                info['mode'] = PNG_MODES.get((bit_depth, color_type), PNG_COLOR_TYPE_MODES.get(color_type))
+            elif chunk_type in PNG_TEXT_CHUNKS:
+                parsed = _parse_text_chunk(chunk_type, f.read(length))
+                if parsed:
+                    info['text'][parsed[0]] = parsed[1]
+            elif chunk_type == b'IEND':
+                break
+            else:
+                if chunk_type == b'eXIf':
+                    info['has_exif'] = True
+                f.seek(length, os.SEEK_CUR)
+
+            # Skip the CRC
+            f.seek(4, os.SEEK_CUR)
+
+    return info
+
+
+def _parse_text_chunk(chunk_type: bytes, data: bytes):
+    """Decode a tEXt/zTXt/iTXt chunk into (keyword, text), or None if malformed"""
+    try:
+        keyword, _, rest = data.partition(b'\0')
+        keyword = keyword.decode('latin-1')
+
+        if chunk_type == b'tEXt':
+            return keyword, rest.decode('latin-1')
+
+        if chunk_type == b'zTXt':
+            # Compression method byte, then a zlib stream
+            return keyword, zlib.decompress(rest[1:]).decode('latin-1')
+
+        # iTXt: compression flag, compression method, language\0, translated keyword\0, text
+        compressed = rest[0]
+        _, _, rest = rest[2:].partition(b'\0')
+        _, _, text = rest.partition(b'\0')
+        if compressed:
+            text = zlib.decompress(text)
+        return keyword, text.decode('utf-8')
+    except (IndexError, UnicodeDecodeError, zlib.error):
+        return None
+
+
+def loads_tolerant(text: str):
+    """
+    Parse JSON that may contain bare NaN/Infinity/-Infinity tokens
+    ComfyUI writes these for some widget values. They become None (null)
+    only where they appear as values; strings containing those words are
+    left untouched.
+    """
+    return json.loads(text, parse_constant=lambda _: None)
+
+
+def parse_workflow_summary(workflow):
+    """Parse ComfyUI workflow and extract ALL nodes with their information."""
+    summary = {
+        'nodes': []  # List of all nodes with their details
+    }
+
+    if not workflow or not isinstance(workflow, dict):
+        return summary
+
+    try:
+        # Detect format: API format (prompt) vs UI format (workflow)
+        # API format: top-level keys are node IDs, each has class_type
+        # UI format: has 'nodes' key with list of nodes
+
+        if 'nodes' in workflow and isinstance(workflow['nodes'], list):
+            # UI format - has 'nodes' array
+            for node in workflow['nodes']:
+                if isinstance(node, dict):
+                    node_type = node.get('type', 'Unknown')
+                    node_id = node.get('id', 'N/A')
+                    widgets_values = node.get('widgets_values', [])
+
+                    # Skip Note nodes
+                    if node_type in ['Note', 'NoteNode', 'MarkdownNote', 'PrimitiveNode']:
+                        continue
+
+                    # Create node entry
+                    node_entry = {
+                        'id': node_id,
+                        'type': node_type,
+                        'title': node.get('title', node_type),
+                        'params': {}
+                    }
+
+                    # Add widget values as parameters
+                    if widgets_values:
+                        for i, value in enumerate(widgets_values):
+                            node_entry['params'][f'param_{i}'] = value
+
+                    summary['nodes'].append(node_entry)
+        else:
+            # API format (prompt) - top-level dict where each key is a node ID
+            for node_id, node_data in workflow.items():
+                if isinstance(node_data, dict) and 'class_type' in node_data:
+                    node_type = node_data.get('class_type', 'Unknown')
+                    inputs = node_data.get('inputs', {})
+
+                    # Create node entry
+                    node_entry = {
+                        'id': node_id,
+                        'type': node_type,
+                        'title': node_type,
+                        'params': {}
+                    }
+
+                    # Add all inputs as parameters
+                    for key, value in inputs.items():
+                        # Skip connection arrays (they link to other nodes)
+                        if isinstance(value, list) and len(value) == 2:
+                            continue
+                        node_entry['params'][key] = value
+
+                    summary['nodes'].append(node_entry)
+
+    except Exception as e:
+        print(f"Error parsing workflow summary: {e}")
+
+    return summary
+
+
+# Node inputs that carry prompt text, and the conditioning inputs followed to reach them
+TEXT_INPUTS = ('text', 'text_g', 'text_l', 'prompt', 'string', 'value')
+MODEL_EXTENSIONS = ('.safetensors', '.ckpt', '.pt', '.pth', '.bin', '.gguf', '.sft', '.onnx')
+MODEL_INPUT_PREFIXES = ('ckpt', 'lora', 'unet', 'vae', 'clip', 'control_net', 'model', 'upscale',
+                        'style_model', 'gligen', 'ipadapter')
+NOTE_NODES = {'Note', 'NoteNode', 'MarkdownNote'}
+
+
+def _is_link(value) -> bool:
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[1], int)
+
+
+def _linked_text(prompt: Dict, value, seen: set) -> list:
+    """Prompt strings reachable from an input value, following node links"""
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if not _is_link(value):
+        return []
+
+    node_id = str(value[0])
+    node = prompt.get(node_id)
+    if node_id in seen or not isinstance(node, dict):
+        return []
+    seen.add(node_id)
+
+    inputs = node.get('inputs') or {}
+    texts = []
+    for key, item in inputs.items():
+        if key in TEXT_INPUTS or key.startswith('conditioning'):
+            texts.extend(_linked_text(prompt, item, seen))
+    return texts
+
+
+def _model_name(key: str, value) -> Optional[str]:
+    if not isinstance(value, str):
+        return None
+    if (key.startswith(MODEL_INPUT_PREFIXES) and '_name' in key) or value.lower().endswith(MODEL_EXTENSIONS):
+        return value
+    return None
+
+
+def extract_search_text(metadata: Dict) -> Dict[str, str]:
+    """
+    Searchable text of an image: positive and negative prompts, node titles
+    and model names, taken from the ComfyUI prompt (API format) or, failing
+    that, the UI workflow or A1111-style parameters
+    """
+    positive, negative, titles, models = [], [], [], []
+    prompt = metadata.get('prompt')
+    workflow = metadata.get('workflow')
+
+    if isinstance(prompt, dict):
+        used = set()
+        nodes = {node_id: node for node_id, node in prompt.items() if isinstance(node, dict)}
+        for node in nodes.values():
+            inputs = node.get('inputs') or {}
+            if 'positive' in inputs or 'negative' in inputs:
+                positive.extend(_linked_text(prompt, inputs.get('positive'), used))
+                negative.extend(_linked_text(prompt, inputs.get('negative'), used))
+
+        for node_id, node in nodes.items():
+            inputs = node.get('inputs') or {}
+            meta = node.get('_meta') or {}
+            titles.extend(t for t in (node.get('class_type'), meta.get('title')) if isinstance(t, str))
+            for key, value in inputs.items():
+                name = _model_name(key, value)
+                if name:
+                    models.append(name)
+                # Text encoders no sampler links to, e.g. behind custom guiders
+                elif node_id not in used and key in ('text', 'text_g', 'text_l') and isinstance(value, str):
+                    positive.append(value)
+
+    if isinstance(workflow, dict) and isinstance(workflow.get('nodes'), list):
+        for node in workflow['nodes']:
+            if not isinstance(node, dict) or node.get('type') in NOTE_NODES:
+                continue
+            titles.extend(t for t in (node.get('type'), node.get('title')) if isinstance(t, str))
+            widgets = node.get('widgets_values')
+            if not isinstance(widgets, list):
+                continue
+            for value in widgets:
+                name = _model_name('', value)
+                if name:
+                    models.append(name)
+                elif not isinstance(prompt, dict) and 'TextEncode' in str(node.get('type')) and isinstance(value, str):
+                    positive.append(value)
+
+    # A1111-style: "<positive>\nNegative prompt: <negative>\nSteps: ..., Model: ..."
+    parameters = (metadata.get('parameters') or {}).get('parameters')
+    if isinstance(parameters, str) and not positive:
+        text, _, settings = parameters.rpartition('\nSteps: ')
+        if not text:
+            text, settings = parameters, ''
+        text, _, negative_text = text.partition('\nNegative prompt: ')
+        positive.append(text)
+        negative.append(negative_text)
+        for setting in settings.split(', '):
+            if setting.startswith('Model: '):
+                models.append(setting[len('Model: '):])
+
+    def join(values):
+        return '\n'.join(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+
+    return {'positive': join(positive), 'negative': join(negative),
+            'titles': join(titles), 'models': join(models)}
+
+
+# Generation parameters: field -> node input names that carry it, in order of preference
+GENERATION_INPUTS = {
+    'checkpoint': ('ckpt_name', 'unet_name'),
+    'sampler': ('sampler_name',),
+    'scheduler': ('scheduler',),
+    'steps': ('steps',),
+    'cfg': ('cfg',),
+    'seed': ('seed', 'noise_seed'),
+    'width': ('width',),
+    'height': ('height',),
+}
+GENERATION_TYPES = {'steps': int, 'cfg': float, 'width': int, 'height': int}
+A1111_SETTINGS = {'Steps': 'steps', 'Sampler': 'sampler', 'Schedule type': 'scheduler', 'CFG scale': 'cfg',
+                  'Seed': 'seed', 'Model': 'checkpoint'}
+LORA_TAG = re.compile(r'<lora:([^:>]+):([-\d.]+)>')
+LATENT_NODES = ('EmptyLatentImage', 'EmptySD3LatentImage', 'EmptyHunyuanLatentVideo', 'EmptyMochiLatentVideo')
+
+# Positional widgets of common UI-format nodes, for workflows saved without a prompt
+UI_WIDGETS = {
+    'KSampler': ('seed', None, 'steps', 'cfg', 'sampler', 'scheduler'),
+    'KSamplerAdvanced': (None, 'seed', None, 'steps', 'cfg', 'sampler', 'scheduler'),
+    'CheckpointLoaderSimple': ('checkpoint',),
+    'UNETLoader': ('checkpoint',),
+    'EmptyLatentImage': ('width', 'height'),
+    'EmptySD3LatentImage': ('width', 'height'),
+}
+
+
+def _node_order(item):
+    """Sort (id, node) pairs by numeric id, so the first sampler is the base pass"""
+    node_id = str(item[0])
+    return (0, int(node_id), '') if node_id.isdigit() else (1, 0, node_id)
+
+
+def _resolve_input(prompt: Dict, value, depth: int = 0):
+    """Follow a link to a primitive/seed node and return its scalar value"""
+    if not _is_link(value):
+        return value
+    node = prompt.get(str(value[0]))
+    if depth > 4 or not isinstance(node, dict):
+        return None
+    scalars = [v for v in (node.get('inputs') or {}).values() if not _is_link(v) and not isinstance(v, (dict, list))]
+    linked = [v for v in (node.get('inputs') or {}).values() if _is_link(v)]
+    if len(scalars) == 1:
+        return scalars[0]
+    if not scalars and len(linked) == 1:
+        return _resolve_input(prompt, linked[0], depth + 1)
+    return None
+
+
+def _coerce_generation(field: str, value):
+    """Normalize a parameter value; None when it isn't usable"""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    try:
+        if field == 'seed':
+            return str(int(value))
+        if field in GENERATION_TYPES:
+            return GENERATION_TYPES[field](value)
+    except (TypeError, ValueError):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _parse_a1111_parameters(text: str, params: Dict):
+    """Fill params from 'Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: 1, Size: 512x768, ...' and <lora:name:weight> tags"""
+    prompt_text, _, settings = text.rpartition('\nSteps: ')
+    if not prompt_text:
+        return
+    settings = dict(item.split(': ', 1) for item in ('Steps: ' + settings).split(', ') if ': ' in item)
+    width, _, height = settings.get('Size', '').partition('x')
+    values = {field: settings.get(key) for key, field in A1111_SETTINGS.items()}
+    values.update(width=width or None, height=height or None)
+    for field, value in values.items():
+        if params.get(field) is None:
+            params[field] = _coerce_generation(field, value)
+
+    for match in LORA_TAG.finditer(prompt_text.partition('\nNegative prompt: ')[0]):
+        strength = _coerce_generation('cfg', match.group(2))
+        params['loras'].append((match.group(1), strength, strength))
+
+
+def extract_generation_params(metadata: Dict) -> Dict:
+    """
+    Normalized generation parameters of an image: checkpoint, sampler,
+    scheduler, steps, cfg, seed, latent width/height and LoRAs as
+    (name, strength_model, strength_clip). Missing values are None.
+    Reads the ComfyUI prompt (API format) first, then the UI workflow,
+    then A1111-style parameters.
+    """
+    params = {'loras': []}
+    prompt = metadata.get('prompt')
+    workflow = metadata.get('workflow')
+
+    if isinstance(prompt, dict):
+        nodes = sorted(((k, v) for k, v in prompt.items() if isinstance(v, dict)), key=_node_order)
+        # Latent size first: 'width'/'height' inputs on other nodes are often upscales
+        nodes.sort(key=lambda item: item[1].get('class_type') not in LATENT_NODES)
+        for _, node in nodes:
+            inputs = node.get('inputs') or {}
+            for field, names in GENERATION_INPUTS.items():
+                if params.get(field) is None:
+                    for name in names:
+                        if name in inputs:
+                            value = _coerce_generation(field, _resolve_input(prompt, inputs[name]))
+                            if value is not None:
+                                params[field] = value
+                                break
+
+            if isinstance(inputs.get('lora_name'), str):
+                params['loras'].append((inputs['lora_name'],
+                                        _coerce_generation('cfg', _resolve_input(prompt, inputs.get('strength_model'))),
+                                        _coerce_generation('cfg', _resolve_input(prompt, inputs.get('strength_clip')))))
+            # Multi-LoRA loaders: lora_1 = {'on': true, 'lora': name, 'strength': 1.0}
+            for value in inputs.values():
+                if isinstance(value, dict) and isinstance(value.get('lora'), str) and value.get('on', True):
+                    if value['lora'].lower() != 'none':
+                        strength = _coerce_generation('cfg', value.get('strength'))
+                        params['loras'].append((value['lora'], strength,
+                                                _coerce_generation('cfg', value.get('strengthTwo', strength))))
+
+    elif isinstance(workflow, dict) and isinstance(workflow.get('nodes'), list):
+        # Same numeric id order as API-format prompts, so both pick the same nodes
+        for node in sorted((n for n in workflow['nodes'] if isinstance(n, dict)),
+                           key=lambda n: _node_order((n.get('id'), n))):
+            widgets = node.get('widgets_values')
+            if not isinstance(widgets, list):
+                continue
+            node_type = node.get('type')
+            for field, value in zip(UI_WIDGETS.get(node_type, ()), widgets):
+                if field and params.get(field) is None:
+                    params[field] = _coerce_generation(field, value)
+            if node_type in ('LoraLoader', 'LoraLoaderModelOnly') and widgets and isinstance(widgets[0], str):
+                strengths = [_coerce_generation('cfg', v) for v in widgets[1:3]] + [None, None]
+                params['loras'].append((widgets[0], strengths[0], strengths[1]))
+
+    parameters = (metadata.get('parameters') or {}).get('parameters')
+    if isinstance(parameters, str) and not isinstance(prompt, dict):
+        _parse_a1111_parameters(parameters, params)
+
+    for field in GENERATION_INPUTS:
+        params.setdefault(field, None)
+    # Img2img and upscales have no latent node: fall back to the image size
+    size = metadata.get('size') or {}
+    if params['width'] is None and params['height'] is None and size.get('width'):
+        params['width'], params['height'] = size['width'], size['height']
+
+    # One row per LoRA: the first occurrence wins
+    params['loras'] = list({lora[0]: lora for lora in reversed(params['loras'])}.values())[::-1]
+    return params
+
+
+def get_image_metadata(file_path):
+    """Extract metadata from an image file."""
+    metadata = {
+        'format': None,
+        'size': {'width': 0, 'height': 0},
+        'mode': None,
+        'file_size': 0,
+        'exif': {},
+        'prompt': None,
+        'workflow': None,
+        'workflow_summary': None,
+        'parameters': {}
+    }
+
+    try:
+        if not os.path.exists(file_path):
+            return metadata
+
+        # Get file size
+        metadata['file_size'] = os.path.getsize(file_path)
+
+        # PNG (ComfyUI stores workflow here): read the chunks directly
+        png_info = read_png_chunks(file_path)
+        if png_info is not None:
+            metadata['format'] = 'PNG'
+            metadata['size'] = {'width': png_info['width'], 'height': png_info['height']}
+            metadata['mode'] = png_info['mode']
+            apply_png_text(metadata, png_info['text'])
+
+            if png_info['has_exif']:
+                with Image.open(file_path) as img:
+                    metadata['exif'] = read_exif(img)
+            return metadata
+
+        # Other formats: Image.open only parses the header, pixels stay undecoded
+        with Image.open(file_path) as img:
+            metadata['format'] = img.format
+            metadata['size'] = {'width': img.width, 'height': img.height}
+            metadata['mode'] = img.mode
+            metadata['exif'] = read_exif(img)
+
+    except Exception as e:
+        metadata['error'] = str(e)
+
+    return metadata
+
+
+def apply_png_text(metadata: Dict, text_chunks: Dict[str, str]):
+    """Fill prompt, workflow, summary and parameters from PNG text chunks"""
+    for key in ('prompt', 'workflow'):
+        if key in text_chunks:
+            try:
+                metadata[key] = loads_tolerant(text_chunks[key])
+            except ValueError:
+                metadata[key] = text_chunks[key]
+
+    # Parse workflow summary from either prompt (API format) or workflow (UI format)
+    # Try prompt first (API format - has more detailed structure)
+    if metadata.get('prompt'):
+        metadata['workflow_summary'] = parse_workflow_summary(metadata['prompt'])
+    # If no summary from prompt, try workflow
+    if not metadata.get('workflow_summary') and metadata.get('workflow'):
+        metadata['workflow_summary'] = parse_workflow_summary(metadata['workflow'])
+
+    # Store all other PNG text chunks
+    for key, value in text_chunks.items():
+        if key not in ['prompt', 'workflow']:
+            metadata['parameters'][key] = value
+
+
+def read_exif(img) -> Dict[str, str]:
+    """Get EXIF tags of an open image as strings"""
+    if hasattr(img, '_getexif'):
+        exif_data = img._getexif()
+        if exif_data:
+            return {str(k): str(v) for k, v in exif_data.items()}
+    return {}
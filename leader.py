@@ -0,0 +1,127 @@
+"""
+Background-service leadership for ComfyUI Gallery
+Under a multi-process server every worker imports the app, but only one may
+run the initial sync, the filesystem watcher and the metadata backfill.
+Workers race for an exclusive flock on a lock file next to the database; the
+winner keeps it for its lifetime (the kernel releases it if the process dies)
+and the others serve requests from the shared index. The leader publishes its
+sync and backfill status to files the other workers read for the health
+endpoints, and picks up backfill requests they leave for it.
+
+Without fcntl (Windows) there is a single process, which always leads.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+LEADER_LOCK_FILENAME = 'leader.lock'
+MIGRATION_LOCK_FILENAME = 'migration.lock'
+STATUS_FILENAME = 'sync_status.json'
+BACKFILL_STATUS_FILENAME = 'backfill_status.json'
+BACKFILL_REQUEST_FILENAME = 'backfill.request'
+
+STATE_DIR = None
+_leader_fd = None
+
+
+def set_state_dir(path: str):
+    """Set the directory holding the lock and status files"""
+    global STATE_DIR
+    STATE_DIR = path
+    os.makedirs(path, exist_ok=True)
+
+
+def _open_lock(filename: str) -> int:
+    return os.open(os.path.join(STATE_DIR, filename), os.O_RDWR | os.O_CREAT, 0o644)
+
+
+@contextmanager
+def migration_lock():
+    """Serialize startup work (schema migrations) across worker processes"""
+    if fcntl is None:
+        yield
+        return
+
+    fd = _open_lock(MIGRATION_LOCK_FILENAME)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def try_acquire() -> bool:
+    """
+    Try to become the leader without blocking
+    Returns: True if this process holds (or already held) the leader lock
+    """
+    global _leader_fd
+    if fcntl is None or _leader_fd is not None:
+        return True
+
+    fd = _open_lock(LEADER_LOCK_FILENAME)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+
+    os.set_inheritable(fd, False)
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _leader_fd = fd
+    return True
+
+
+def is_leader() -> bool:
+    return fcntl is None or _leader_fd is not None
+
+
+def publish_status(status: Dict, filename: str = STATUS_FILENAME):
+    """Write the leader's status for the other workers (atomically)"""
+    if STATE_DIR is None:
+        return
+    path = os.path.join(STATE_DIR, filename)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"WARNING: Could not publish {filename}: {e}")
+
+
+def read_status(filename: str = STATUS_FILENAME) -> Optional[Dict]:
+    """The status last published by the leader, or None"""
+    if STATE_DIR is None:
+        return None
+    try:
+        with open(os.path.join(STATE_DIR, filename)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def request_backfill():
+    """Ask the leader to start a metadata backfill"""
+    try:
+        with open(os.path.join(STATE_DIR, BACKFILL_REQUEST_FILENAME), 'w') as f:
+            f.write(str(os.getpid()))
+    except OSError as e:
+        print(f"WARNING: Could not request a backfill: {e}")
+
+
+def take_backfill_request() -> bool:
+    """Leader: consume a pending backfill request, if there is one"""
+    try:
+        os.remove(os.path.join(STATE_DIR, BACKFILL_REQUEST_FILENAME))
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,171 @@
+"""
+Directory scanner for ComfyUI Gallery
+Lists the output directory with os.scandir, reusing DirEntry type and stat
+data, and scans independent subtrees concurrently
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Scanning is I/O bound (one round trip per directory on network volumes),
+# so use more threads than cores
+SCAN_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Supported image formats
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'}
+
+
+class FileRecord(NamedTuple):
+    path: str
+    name: str
+    size: int
+    mtime: float
+
+    def to_dict(self) -> Dict:
+        return {
+            'path': self.path,
+            'name': self.name,
+            'size': self.size,
+            'modified': self.mtime,
+            'modified_str': format_mtime(self.mtime)
+        }
+
+
+class DirRecord(NamedTuple):
+    path: str
+    name: str
+    mtime: Optional[float]
+    is_link: bool = False
+
+    def to_dict(self) -> Dict:
+        return {
+            'path': self.path,
+            'name': self.name,
+            'modified': self.mtime,
+            'modified_str': format_mtime(self.mtime) if self.mtime is not None else ''
+        }
+
+
+class Listing(NamedTuple):
+    """One directory's subdirectories and image files"""
+    path: str
+    dirs: List[DirRecord]
+    files: List[FileRecord]
+
+
+def format_mtime(mtime: float) -> str:
+    return time.strftime(DATE_FORMAT, time.localtime(mtime))
+
+
+def scan_directory(root: str, rel_dir: str = '', extensions: Optional[Set[str]] = None,
+                   dir_mtimes: bool = False) -> Listing:
+    """
+    List one directory below root
+    Files are only collected (and stat'ed) when extensions is given;
+    directory mtimes cost an extra stat each and are only read on request.
+    """
+    dirs = []
+    files = []
+    full_dir = os.path.join(root, rel_dir) if rel_dir else root
+    prefix = os.path.join(rel_dir, '') if rel_dir else ''
+
+    try:
+        with os.scandir(full_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        mtime = entry.stat().st_mtime if dir_mtimes else None
+                        dirs.append(DirRecord(prefix + entry.name, entry.name, mtime, entry.is_symlink()))
+                    elif extensions is not None and entry.is_file():
+                        dot = entry.name.rfind('.')
+                        if dot > 0 and entry.name[dot:].lower() in extensions:
+                            stat = entry.stat()
+                            files.append(FileRecord(prefix + entry.name, entry.name,
+                                                    stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue  # Removed while listing
+    except OSError as e:
+        print(f"Error reading directory: {e}")
+
+    return Listing(rel_dir, dirs, files)
+
+
+def summarize_directory(root: str, rel_dir: str = '', extensions: Set[str] = frozenset()) -> Tuple[List[str], int]:
+    """
+    Subfolder names and image count of one directory
+    Uses DirEntry types only, so no file is stat'ed.
+    """
+    dirs = []
+    images = 0
+    full_dir = os.path.join(root, rel_dir) if rel_dir else root
+
+    with os.scandir(full_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    images += 1
+            except OSError:
+                continue
+
+    dirs.sort(key=str.lower)
+    return dirs, images
+
+
+def scan_tree(root: str, rel_dir: str = '', extensions: Optional[Set[str]] = None,
+              workers: int = SCAN_WORKERS,
+              progress: Optional[Callable[[int], None]] = None) -> Dict[str, Listing]:
+    """
+    List every directory below root/rel_dir, scanning subtrees in parallel
+    Returns listings keyed by relative directory path. Symlinked directories
+    are listed but not descended into, like os.walk.
+    progress, if given, is called with the running file count per directory.
+    """
+    listings = {}
+    file_count = 0
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scan') as pool:
+        pending = {pool.submit(scan_directory, root, rel_dir, extensions)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                listing = future.result()
+                listings[listing.path] = listing
+                for directory in listing.dirs:
+                    if not directory.is_link:
+                        pending.add(pool.submit(scan_directory, root, directory.path, extensions))
+                if progress and listing.files:
+                    file_count += len(listing.files)
+                    progress(file_count)
+
+    return listings
+
+
+def walk_files(root: str, extensions: Set[str], workers: int = SCAN_WORKERS,
+               progress: Optional[Callable[[int], None]] = None) -> List[FileRecord]:
+    """All image files below root, newest first"""
+    files = []
+    for listing in scan_tree(root, '', extensions, workers, progress).values():
+        files.extend(listing.files)
+    files.sort(key=lambda f: f.mtime, reverse=True)
+    return files
+
+
+def walk_dirs(root: str, rel_dir: str = '', workers: int = SCAN_WORKERS) -> List[Dict]:
+    """Nested folder tree below root/rel_dir, sorted by name at each level"""
+    listings = scan_tree(root, rel_dir, None, workers)
+
+    def build(path):
+        listing = listings.get(path)
+        if listing is None:
+            return []
+        nodes = [{'name': d.name, 'path': d.path, 'type': 'folder', 'children': build(d.path)}
+                 for d in listing.dirs]
+        nodes.sort(key=lambda node: node['name'].lower())
+        return nodes
+
+    return build(rel_dir)
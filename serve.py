@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Production server for ComfyUI Gallery
+Runs the Flask app under gunicorn with several worker processes, each with a
+pool of threads. Originals and thumbnails are sent with sendfile(2) through
+gunicorn's wsgi.file_wrapper, or by nginx when GALLERY_ACCEL_OUTPUT /
+GALLERY_ACCEL_THUMBNAILS map them to X-Accel-Redirect locations. One worker
+holds the leader lock and runs the initial sync, watcher and metadata
+backfill (see leader.py).
+
+Falls back to the development server when gunicorn is not installed.
+
+Usage: python serve.py [--workers N] [--threads N] [--port PORT]
+"""
+
+import argparse
+import os
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+GALLERY_PORT = int(os.environ.get('GALLERY_PORT', 3002))
+WORKERS = int(os.environ.get('GALLERY_WORKERS', min(4, os.cpu_count() or 1)))
+THREADS = int(os.environ.get('GALLERY_THREADS', 8))
+# gthread workers keep heartbeating while threads stream ZIPs and events, so
+# this only catches a wedged worker
+WORKER_TIMEOUT = 120
+KEEPALIVE = 5
+
+
+def load_app():
+    """Import the app in the worker process and start its services"""
+    import app as gallery
+    gallery.start_services()
+    return gallery.app
+
+
+if BaseApplication is not None:
+    class GalleryServer(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Not preloaded: each worker imports the app after the fork, so no
+            # threads or database connections are shared across processes
+            return load_app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--threads', type=int, default=THREADS)
+    parser.add_argument('--port', type=int, default=GALLERY_PORT)
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        print("WARNING: gunicorn is not installed; falling back to the development server")
+        import app as gallery
+        gallery.start_services()
+        print(f"Starting ComfyUI Gallery on port {args.port}")
+        print(f"Serving images from: {gallery.OUTPUT_DIR}")
+        gallery.app.run(host='0.0.0.0', port=args.port, debug=False, threaded=True)
+        return
+
+    print(f"Starting ComfyUI Gallery on port {args.port} "
+          f"({args.workers} workers x {args.threads} threads)")
+    GalleryServer({
+        'bind': f"0.0.0.0:{args.port}",
+        'workers': max(1, args.workers),
+        'threads': max(1, args.threads),
+        'worker_class': 'gthread',
+        'timeout': WORKER_TIMEOUT,
+        'keepalive': KEEPALIVE,
+        'sendfile': True,
+        'accesslog': None,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
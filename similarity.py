@@ -0,0 +1,172 @@
+"""
+Perceptual hashing for ComfyUI Gallery
+64-bit difference hashes (dHash) and an in-memory multi-index hash table
+for Hamming-radius queries, used to find near-duplicate images
+"""
+
+import itertools
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+# Probes per query grow steeply with radius; beyond 12 bits (of 64) images
+# are rarely near-duplicates anyway
+MAX_RADIUS = 12
+
+# int.bit_count is Python 3.10+
+_popcount = getattr(int, 'bit_count', None) or (lambda value: bin(value).count('1'))
+
+
+def dhash(img: Image.Image) -> int:
+    """
+    Difference hash of an image
+    The image is reduced to 9x8 grayscale and each bit records whether a
+    pixel is brighter than its right-hand neighbour. Meant to be fed an
+    already downscaled thumbnail.
+    """
+    small = img.convert('L').resize((9, 8), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            value = (value << 1) | (pixels[col] > pixels[col + 1])
+    return value
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned 64-bit hash onto SQLite's signed INTEGER range"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def distance(a: int, b: int) -> int:
+    """Hamming distance between two hashes"""
+    return _popcount(a ^ b)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits: int) -> Tuple[int, ...]:
+    """Every chunk mask with at most `bits` bits set"""
+    masks = [0]
+    for count in range(1, bits + 1):
+        for positions in itertools.combinations(range(CHUNK_BITS), count):
+            masks.append(sum(1 << p for p in positions))
+    return tuple(masks)
+
+
+def _chunks(value: int) -> List[int]:
+    return [(value >> (i * CHUNK_BITS)) & CHUNK_MASK for i in range(CHUNKS)]
+
+
+class HashIndex:
+    """
+    Multi-index hash table over 64-bit hashes
+    Each hash is split into four 16-bit chunks with one table per chunk.
+    Two hashes within Hamming distance r must agree to within r // 4 bits
+    on at least one chunk, so a query only probes chunk values within that
+    many bits of its own and verifies those candidates.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[str, int] = {}
+        self._tables: List[Dict[int, set]] = [{} for _ in range(CHUNKS)]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def get(self, key: str) -> Optional[int]:
+        return self._hashes.get(key)
+
+    def add(self, key: str, value: int):
+        with self._lock:
+            self._add(key, value)
+
+    def update(self, items: Iterable[Tuple[str, int]]):
+        with self._lock:
+            for key, value in items:
+                self._add(key, value)
+
+    def _add(self, key: str, value: int):
+        if key in self._hashes:
+            self._remove(key)
+        self._hashes[key] = value
+        for table, chunk in zip(self._tables, _chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is None:
+                table[chunk] = {key}
+            else:
+                bucket.add(key)
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        value = self._hashes.pop(key, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, _chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[chunk]
+
+    def query(self, value: int, radius: int) -> List[Tuple[str, int]]:
+        """Keys whose hash is within radius of value, as (key, distance), closest first"""
+        radius = max(0, min(radius, MAX_RADIUS))
+        masks = _flip_masks(radius // CHUNKS)
+        candidates = set()
+
+        with self._lock:
+            for table, chunk in zip(self._tables, _chunks(value)):
+                get = table.get
+                for mask in masks:
+                    bucket = get(chunk ^ mask)
+                    if bucket:
+                        candidates.update(bucket)
+            hashes = self._hashes
+            matches = [(key, d) for key in candidates
+                       for d in (_popcount(hashes[key] ^ value),) if d <= radius]
+
+        matches.sort(key=lambda item: (item[1], item[0]))
+        return matches
+
+    def clusters(self, keys: Iterable[str], radius: int) -> List[List[str]]:
+        """
+        Group keys into clusters of near-duplicates (single linkage)
+        Only keys with a hash take part; clusters of one are left out.
+        """
+        # Snapshot the hashes, since keys may be removed while clustering
+        with self._lock:
+            members = {key: self._hashes[key] for key in keys if key in self._hashes}
+        parent = {key: key for key in members}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for key, value in members.items():
+            for other, _ in self.query(value, radius):
+                if other in members:
+                    root, other_root = find(key), find(other)
+                    if root != other_root:
+                        parent[other_root] = root
+
+        groups: Dict[str, List[str]] = {}
+        for key in members:
+            groups.setdefault(find(key), []).append(key)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1),
+                      key=lambda group: (-len(group), group[0]))
@@ -3,10 +3,20 @@
 # Default values
 export COMFYUI_OUTPUT_DIR="${COMFYUI_OUTPUT_DIR:-/ComfyUI/output}"
 export GALLERY_PORT="${GALLERY_PORT:-3002}"
+# Production server (gunicorn) processes and threads per process; set
+# GALLERY_SERVER=development to run Flask's development server instead
+export GALLERY_SERVER="${GALLERY_SERVER:-production}"
+export GALLERY_WORKERS="${GALLERY_WORKERS:-4}"
+export GALLERY_THREADS="${GALLERY_THREADS:-8}"
 
 echo "Starting ComfyUI Gallery..."
 echo "Output directory: $COMFYUI_OUTPUT_DIR"
 echo "Port: $GALLERY_PORT"
 
 cd /comfyui-gallery
-python3 app.py
+if [ "$GALLERY_SERVER" = "development" ]; then
+    python3 app.py
+else
+    echo "Workers: $GALLERY_WORKERS x $GALLERY_THREADS threads"
+    python3 serve.py
+fi
@@ -1,9 +1,12 @@
 // Gallery Core Logic, API Calls, Event Handlers, and Initialization
 
 // API Functions
-async function loadDirectoryTree() {
+async function loadDirectoryTree(path = '') {
     try {
-        const response = await fetch('/api/tree');
+        const response = await fetch(path ? `/api/tree/${path}` : '/api/tree');
+        if (!response.ok) {
+            return [];
+        }
         return await response.json();
     } catch (error) {
         console.error('Error loading tree:', error);
@@ -20,6 +23,7 @@ async function buildTree() {
     rootItem.dataset.path = '';
     rootItem.onclick = () => navigateToFolder('');
     rootItem.innerHTML = `
+        <span class="tree-item-toggle"></span>
         <span class="tree-item-icon">
             <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
                 <path d="M3 9l9-7 9 7v11a2 2 0 0 1-2 2H5a2 2 0 0 1-2-2z"></path>
@@ -34,6 +38,74 @@ async function buildTree() {
     treeView.innerHTML = '';
     treeView.appendChild(rootItem);
     buildTreeLevel(treeView, folders, 0);
+
+    // Re-open what was expanded (parents sort before children), then the current folder
+    for (const path of [...expandedFolders].sort()) {
+        await expandTreeFolder(path);
+    }
+    await revealInTree(currentPath);
+}
+
+function findTreeNode(path) {
+    return document.querySelector(`#treeView .tree-node[data-path="${CSS.escape(path)}"]`);
+}
+
+// Children are fetched the first time a folder is expanded
+async function expandTreeFolder(path) {
+    const node = findTreeNode(path);
+    if (!node) {
+        expandedFolders.delete(path);
+        return;
+    }
+
+    const children = node.querySelector(':scope > .tree-children');
+    if (!children.dataset.loaded) {
+        const folders = await loadDirectoryTree(path);
+        buildTreeLevel(children, folders, Number(node.dataset.level) + 1);
+        children.dataset.loaded = 'true';
+    }
+
+    node.classList.add('expanded');
+    expandedFolders.add(path);
+}
+
+function collapseTreeFolder(path) {
+    const node = findTreeNode(path);
+    if (node) {
+        node.classList.remove('expanded');
+    }
+    expandedFolders.delete(path);
+}
+
+async function toggleTreeFolder(path) {
+    const node = findTreeNode(path);
+    if (node && node.classList.contains('expanded')) {
+        collapseTreeFolder(path);
+    } else {
+        await expandTreeFolder(path);
+    }
+}
+
+// Expand a folder and its ancestors and mark it active
+async function revealInTree(path) {
+    const parts = path ? path.split(/[\\/]/).filter(p => p) : [];
+    for (let i = 1; i <= parts.length; i++) {
+        await expandTreeFolder(parts.slice(0, i).join('/'));
+    }
+    updateTreeSelection();
+}
+
+function updateTreeSelection() {
+    document.querySelectorAll('#treeView .tree-item').forEach(item => {
+        item.classList.toggle('active', item.dataset.path === currentPath);
+    });
+}
+
+// Images per listing page; later pages load while scrolling towards them
+const IMAGES_PAGE_SIZE = 1000;
+
+function listingUrl() {
+    return currentPath ? `/api/browse/${currentPath}` : '/api/browse';
 }
 
 async function loadImages() {
@@ -44,15 +116,22 @@ async function loadImages() {
         stats.textContent = 'Loading...';
         showLoadingIndicator();
 
-        const url = currentPath ? `/api/browse/${currentPath}` : '/api/browse';
-        const response = await fetch(url);
+        const generation = ++listingGeneration;
+        imagesRequest = null;
+        const response = await fetch(`${listingUrl()}?format=columns&limit=${IMAGES_PAGE_SIZE}`);
         const data = await response.json();
+        if (generation !== listingGeneration) return;
 
-        folders = data.folders || [];
-        images = data.images || [];
+        folders = fromColumns(data.folders);
+        images = fromColumns(data.images);
+        totalImages = data.total_images ?? images.length;
+        imagesCursor = data.next || null;
+        imagesPageCursors = [null];
+        currentImageIndex = -1;
+        stopThumbnailEvents();
 
         updateBreadcrumb(currentPath);
-        stats.textContent = `${folders.length} folder${folders.length !== 1 ? 's' : ''}, ${images.length} image${images.length !== 1 ? 's' : ''}`;
+        stats.textContent = `${folders.length} folder${folders.length !== 1 ? 's' : ''}, ${totalImages} image${totalImages !== 1 ? 's' : ''}`;
 
         // Render based on current view mode
         if (currentViewMode === 'grid') {
@@ -63,7 +142,7 @@ async function loadImages() {
 
         // Pre-generate thumbnails in background
         if (images.length > 0) {
-            preGenerateThumbnails();
+            preGenerateThumbnails(0);
             if (currentViewMode === 'detail') {
                 openDetailView(0);
             }
@@ -81,19 +160,134 @@ async function loadImages() {
     }
 }
 
+async function fetchImagesPage() {
+    const generation = listingGeneration;
+    try {
+        const response = await fetch(`${listingUrl()}?format=columns&limit=${IMAGES_PAGE_SIZE}&after=${encodeURIComponent(imagesCursor)}`);
+        const data = await response.json();
+        if (generation !== listingGeneration) return;
+        if (!response.ok) throw new Error(data.message || response.statusText);
+
+        for (const image of fromColumns(data.images)) {
+            images.push(image);
+        }
+        imagesPageCursors.push(imagesCursor);
+        imagesCursor = data.next || null;
+        // Files added or removed since the first page shift the total
+        if (!imagesCursor || images.length > totalImages) {
+            totalImages = images.length;
+        }
+        refreshImageViews();
+    } finally {
+        if (generation === listingGeneration) imagesRequest = null;
+    }
+}
+
+async function ensureImagesLoaded(index) {
+    // Fetch pages in order until images[index] is loaded; false if it can't be
+    const generation = listingGeneration;
+    try {
+        while (index >= images.length && imagesCursor && generation === listingGeneration) {
+            if (!imagesRequest) imagesRequest = fetchImagesPage();
+            await imagesRequest;
+        }
+    } catch (error) {
+        console.error('Error loading images:', error);
+    }
+    return generation === listingGeneration && index < images.length;
+}
+
 async function navigateToFolder(path) {
     currentPath = path;
-    await buildTree();
+    pendingThumbnails.clear();
+    await revealInTree(path);
     await loadImages();
 }
 
-async function loadMetadata(imagePath) {
+// Fields the detail panel shows up front; prompt and workflow JSON load when expanded
+const DETAIL_METADATA_FIELDS = ['format', 'size', 'mode', 'file_size', 'workflow_summary', 'parameters', 'available'];
+const METADATA_CACHE_LIMIT = 200;
+
+function cacheMetadata(image, metadata) {
+    metadataCache.delete(image.path);
+    metadataCache.set(image.path, { modified: image.modified, metadata });
+    if (metadataCache.size > METADATA_CACHE_LIMIT) {
+        metadataCache.delete(metadataCache.keys().next().value);
+    }
+}
+
+function cachedMetadata(image) {
+    const entry = metadataCache.get(image.path);
+    return entry && entry.modified === image.modified ? entry.metadata : null;
+}
+
+async function fetchMetadata(image) {
+    const cached = cachedMetadata(image);
+    if (cached) return cached;
+
+    const response = await fetch(`/api/metadata/${image.path}?fields=${DETAIL_METADATA_FIELDS.join(',')}`);
+    const metadata = await response.json();
+    if (!metadata.error) cacheMetadata(image, metadata);
+    return metadata;
+}
+
+async function prefetchMetadata(index) {
+    // Fetch the neighbours navigateDetail moves to in one request
+    const neighbours = [index - 1, index + 1]
+        .map(i => images[(i + totalImages) % totalImages])
+        .filter((image, i, list) => image && image !== images[index] && list.indexOf(image) === i && !cachedMetadata(image));
+    if (neighbours.length === 0) return;
+
+    try {
+        const response = await fetch('/api/metadata/batch', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ paths: neighbours.map(image => image.path), fields: DETAIL_METADATA_FIELDS })
+        });
+        const data = await response.json();
+        neighbours.forEach(image => {
+            const metadata = data.metadata && data.metadata[image.path];
+            if (metadata && !metadata.error) cacheMetadata(image, metadata);
+        });
+    } catch (error) {
+        console.error('Failed to prefetch metadata:', error);
+    }
+}
+
+async function loadLargeMetadata(image) {
+    // Prompt and workflow JSON are only fetched once their section is expanded
+    const fields = ['prompt', 'workflow'].filter(field => {
+        const target = document.getElementById(`${field}-json`);
+        const content = document.getElementById(`${field}-content`);
+        return target && !target.dataset.loaded && content && !content.classList.contains('collapsed');
+    });
+    if (fields.length === 0) return;
+
+    const targets = fields.map(field => document.getElementById(`${field}-json`));
+    targets.forEach(target => target.dataset.loaded = 'loading');
+    try {
+        const response = await fetch(`/api/metadata/${image.path}?fields=${fields.join(',')}`);
+        const metadata = await response.json();
+        fields.forEach((field, i) => {
+            targets[i].textContent = JSON.stringify(metadata[field], null, 2);
+            targets[i].dataset.loaded = 'true';
+        });
+    } catch (error) {
+        targets.forEach(target => {
+            target.textContent = `Error loading metadata: ${error.message}`;
+            delete target.dataset.loaded;
+        });
+    }
+}
+
+async function loadMetadata(image) {
+    const imagePath = image.path;
     const metadataContent = document.getElementById('metadataContent');
     metadataContent.innerHTML = '<div class="metadata-empty">Loading...</div>';
 
     try {
-        const response = await fetch(`/api/metadata/${imagePath}`);
-        const metadata = await response.json();
+        const metadata = await fetchMetadata(image);
+        if (selectedImage !== image) return;  // Navigated on meanwhile
 
         if (metadata.error) {
             metadataContent.innerHTML = `<div class="metadata-empty">Error: ${metadata.error}</div>`;
@@ -156,7 +350,7 @@ async function loadMetadata(imagePath) {
         }
 
         // Prompt
-        if (metadata.prompt) {
+        if (metadata.available.includes('prompt')) {
             const promptCollapsed = getMetadataSectionState('prompt');
             html += '<div class="metadata-section">';
             html += `<div class="metadata-section-title" onclick="toggleMetadataSection('prompt')">
@@ -164,12 +358,12 @@ async function loadMetadata(imagePath) {
                 <span>ComfyUI Prompt</span>
             </div>`;
             html += `<div class="metadata-section-content ${promptCollapsed ? 'collapsed' : ''}" id="prompt-content">`;
-            html += `<div class="metadata-json">${JSON.stringify(metadata.prompt, null, 2)}</div>`;
+            html += '<div class="metadata-json" id="prompt-json">Loading...</div>';
             html += '</div></div>';
         }
 
         // Workflow
-        if (metadata.workflow) {
+        if (metadata.available.includes('workflow')) {
             const workflowCollapsed = getMetadataSectionState('workflow');
             html += '<div class="metadata-section">';
             html += `<div class="metadata-section-title" onclick="toggleMetadataSection('workflow')">
@@ -177,7 +371,7 @@ async function loadMetadata(imagePath) {
                 <span>ComfyUI Workflow</span>
             </div>`;
             html += `<div class="metadata-section-content ${workflowCollapsed ? 'collapsed' : ''}" id="workflow-content">`;
-            html += `<div class="metadata-json">${JSON.stringify(metadata.workflow, null, 2)}</div>`;
+            html += '<div class="metadata-json" id="workflow-json">Loading...</div>';
             html += '</div></div>';
         }
 
@@ -200,80 +394,95 @@ async function loadMetadata(imagePath) {
         }
 
         metadataContent.innerHTML = html;
+        loadLargeMetadata(image);
     } catch (error) {
         metadataContent.innerHTML = `<div class="metadata-empty">Error loading metadata: ${error.message}</div>`;
     }
 }
 
-async function preGenerateThumbnails() {
-    // Pre-generate thumbnails for all images in the current folder
-    if (images.length === 0) return;
+function preGenerateThumbnails(page) {
+    // Pre-generate thumbnails for one listing page and listen for readiness.
+    // Only the page on screen gets a stream: each one holds a server thread
+    // and a browser connection, and pages fetched just to reach an index
+    // (e.g. wrapping to the last image) are never shown.
+    if (thumbnailEvents && thumbnailEvents.page === page) return;
+    stopThumbnailEvents();
+    if (page >= imagesPageCursors.length || images.length <= page * IMAGES_PAGE_SIZE) return;
+
+    const params = new URLSearchParams({ limit: IMAGES_PAGE_SIZE });
+    const after = imagesPageCursors[page];
+    if (after) params.set('after', after);
+    const url = currentPath ? `/api/thumbnails/events/${currentPath}` : '/api/thumbnails/events';
+    const source = new EventSource(`${url}?${params}`);
+    thumbnailEvents = { source, page };
+
+    // Keep the page recorded so scrolling within it doesn't queue it again
+    const stop = () => {
+        source.close();
+        if (thumbnailEvents && thumbnailEvents.source === source) thumbnailEvents.source = null;
+    };
 
-    try {
-        const imagePaths = images.map(img => img.path);
+    source.addEventListener('progress', (e) => {
+        const data = JSON.parse(e.data);
+        console.log(`Thumbnails ready: ${data.done}/${data.total}`);
+    });
 
-        console.log(`Starting thumbnail generation for ${imagePaths.length} images...`);
+    source.addEventListener('ready', (e) => {
+        const data = JSON.parse(e.data);
+        swapPendingThumbnail(data.path);
+    });
 
-        // Send request to generate thumbnails in background
-        fetch('/api/generate-thumbnails', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({ images: imagePaths })
-        }).then(response => response.json())
-          .then(data => {
-              console.log(`Thumbnail generation ${data.status}: ${data.total} images queued`);
-
-              // Start polling to retry failed thumbnails
-              startThumbnailRetry();
-          })
-          .catch(error => {
-              console.error('Error pre-generating thumbnails:', error);
-          });
-    } catch (error) {
-        console.error('Error in preGenerateThumbnails:', error);
-    }
-}
+    source.addEventListener('failed', (e) => {
+        const data = JSON.parse(e.data);
+        console.log(`Thumbnail generation failed: ${data.path}`);
+    });
 
-function startThumbnailRetry() {
-    // Clear any existing interval
-    if (thumbnailRetryInterval) {
-        clearInterval(thumbnailRetryInterval);
-    }
+    source.addEventListener('complete', (e) => {
+        const data = JSON.parse(e.data);
+        console.log(`Thumbnail generation completed: ${data.done}/${data.total}`);
+        stop();
+    });
 
-    let retryCount = 0;
-    const maxRetries = 15; // Retry for up to 45 seconds (15 * 3s)
+    // Don't let EventSource reconnect and queue the page again
+    source.onerror = stop;
+}
 
-    thumbnailRetryInterval = setInterval(() => {
-        retryCount++;
+function stopThumbnailEvents() {
+    if (thumbnailEvents && thumbnailEvents.source) thumbnailEvents.source.close();
+    thumbnailEvents = null;
+}
 
-        // Find all images that failed to load (opacity 0.3)
-        const allImages = document.querySelectorAll('#thumbnailsScroll img');
-        const failedImages = Array.from(allImages).filter(img => {
-            const opacity = parseFloat(window.getComputedStyle(img).opacity);
-            return opacity < 0.5 && img.src.includes('/thumbnail/');
-        });
+function forgetPendingThumbnails(node) {
+    // Drop 'ready' bookkeeping for an item that scrolled out of the DOM
+    const pending = pendingThumbnails.get(node.dataset.path);
+    if (!pending) return;
 
-        if (failedImages.length === 0 || retryCount >= maxRetries) {
-            clearInterval(thumbnailRetryInterval);
-            thumbnailRetryInterval = null;
-            if (failedImages.length === 0) {
-                console.log('All thumbnails loaded successfully!');
-            } else {
-                console.log(`Stopped retrying. ${failedImages.length} thumbnails still pending.`);
-            }
-            return;
-        }
+    const connected = pending.filter(({ img }) => img.isConnected);
+    if (connected.length > 0) {
+        pendingThumbnails.set(node.dataset.path, connected);
+    } else {
+        pendingThumbnails.delete(node.dataset.path);
+    }
+}
 
-        // Retry loading failed images
-        failedImages.forEach(img => {
-            const originalSrc = img.src.split('?')[0]; // Remove any existing cache buster
-            img.src = originalSrc + `?retry=${retryCount}`;
-        });
+function markThumbnailPending(img, image) {
+    // Remember thumbnails that failed to load so a 'ready' event can swap them in
+    const pending = pendingThumbnails.get(image.path) || [];
+    pending.push({ img, image });
+    pendingThumbnails.set(image.path, pending);
+}
+
+function swapPendingThumbnail(imagePath) {
+    const pending = pendingThumbnails.get(imagePath);
+    if (!pending) return;
 
-        console.log(`Retrying ${failedImages.length} thumbnails... (attempt ${retryCount}/${maxRetries})`);
-    }, 3000); // Retry every 3 seconds
+    pendingThumbnails.delete(imagePath);
+    pending.forEach(({ img, image }) => {
+        if (img.isConnected) {
+            img.srcset = thumbnailSrcset(image, 'ready=1');
+            img.src = thumbnailUrl(image, 'medium', 'ready=1');
+        }
+    });
 }
 
 // Detail View with Zoom/Pan
@@ -284,7 +493,8 @@ function openDetailView(index) {
     const currentImage = images[index];
 
     selectedImage = currentImage;
-    loadMetadata(currentImage.path);
+    loadMetadata(currentImage);
+    prefetchMetadata(index);
 
     const detailEmpty = document.getElementById('detailEmpty');
     const imageWrapper = document.getElementById('imageWrapper');
@@ -293,7 +503,7 @@ function openDetailView(index) {
     detailEmpty.style.display = 'none';
     imageWrapper.style.display = 'block';
 
-    detailImage.src = `/image/${currentImage.path}`;
+    detailImage.src = imageUrl(currentImage);
     detailImage.onload = () => {
         fitToScreen();
     };
@@ -307,14 +517,16 @@ function openDetailView(index) {
     updateActiveThumbnail();
 }
 
-function navigateDetail(direction) {
-    if (images.length === 0) return;
+async function navigateDetail(direction) {
+    if (totalImages === 0) return;
 
-    currentImageIndex += direction;
-    if (currentImageIndex < 0) currentImageIndex = images.length - 1;
-    if (currentImageIndex >= images.length) currentImageIndex = 0;
+    let index = currentImageIndex + direction;
+    if (index < 0) index = totalImages - 1;
+    if (index >= totalImages) index = 0;
 
-    openDetailView(currentImageIndex);
+    if (await ensureImagesLoaded(index)) {
+        openDetailView(index);
+    }
 }
 
 // Zoom and Pan Functions
@@ -496,6 +708,7 @@ function toggleViewMode() {
 }
 
 function refreshGallery() {
+    buildTree();
     loadImages();
 }
 
@@ -572,20 +785,15 @@ async function toggleFavorite(imagePath) {
         const result = await response.json();
 
         if (result.status === 'success') {
-            // Update the image in the current images array
+            // Update the image in the current images array and its overlay
             const imageIndex = images.findIndex(img => img.path === imagePath);
             if (imageIndex >= 0) {
                 images[imageIndex].is_favorite = result.is_favorite;
+                updateImageItem(imageIndex);
             }
 
-            // Update UI based on current view
-            if (currentViewMode === 'grid') {
-                renderGridView();
-            } else {
-                // Update detail view favorite button
+            if (currentViewMode === 'detail') {
                 updateFavoriteButton();
-                // Update thumbnail overlay
-                renderThumbnails();
             }
 
             showNotification(result.is_favorite ? 'Added to favorites' : 'Removed from favorites');
@@ -617,21 +825,15 @@ async function setFavoritesBatch(filePaths, isFavorite) {
         const result = await response.json();
 
         if (result.status === 'success') {
-            // Update images in current array
-            filePaths.forEach(path => {
-                const imageIndex = images.findIndex(img => img.path === path);
-                if (imageIndex >= 0) {
-                    images[imageIndex].is_favorite = isFavorite;
+            // Update images in current array and the items on screen
+            const paths = new Set(filePaths);
+            images.forEach((image, imageIndex) => {
+                if (paths.has(image.path)) {
+                    image.is_favorite = isFavorite;
+                    updateImageItem(imageIndex);
                 }
             });
 
-            // Refresh view
-            if (currentViewMode === 'grid') {
-                renderGridView();
-            } else {
-                renderThumbnails();
-            }
-
             showNotification(`Updated favorites for ${result.updated} file(s)`);
             return true;
         } else {
@@ -674,8 +876,15 @@ async function loadFavorites() {
         const response = await fetch('/api/favorites');
         const data = await response.json();
 
+        listingGeneration++;
+        imagesRequest = null;
         folders = []; // No folders in favorites view
         images = data.images || [];
+        totalImages = images.length;
+        imagesCursor = null;
+        imagesPageCursors = [];
+        currentImageIndex = -1;
+        stopThumbnailEvents();
 
         // Update breadcrumb to show "Favorites"
         const breadcrumb = document.getElementById('breadcrumb');
@@ -688,7 +897,7 @@ async function loadFavorites() {
             </span>
         `;
 
-        stats.textContent = `${images.length} favorite image${images.length !== 1 ? 's' : ''}`;
+        stats.textContent = `${totalImages} favorite image${totalImages !== 1 ? 's' : ''}`;
 
         // Render based on current view mode
         if (currentViewMode === 'grid') {
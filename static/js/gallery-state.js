@@ -1,8 +1,13 @@
 // Gallery State Management
 // Global state variables
 
-let images = [];
+let images = []; // the listing pages loaded so far, in order
 let folders = [];
+let totalImages = 0; // images in the whole listing
+let imagesCursor = null; // cursor for the next page; null once every page is loaded
+let imagesPageCursors = []; // cursor each loaded page was fetched after (null for the first)
+let imagesRequest = null; // in-flight page request
+let listingGeneration = 0; // bumped when a new listing replaces the current one
 let currentImageIndex = -1;
 let currentPath = '';
 let selectedImage = null;
@@ -25,8 +30,15 @@ let currentViewMode = 'detail'; // 'detail' or 'grid'
 let selectedImages = new Set();
 let lastSelectedIndex = -1;
 
-// Thumbnail retry state
-let thumbnailRetryInterval = null;
+// Folder tree state
+let expandedFolders = new Set(); // folder paths expanded in the sidebar
+
+// Thumbnail readiness state
+let thumbnailEvents = null; // {source, page} for the listing page on screen; source is null once it's done
+let pendingThumbnails = new Map(); // image path -> {img, image} entries waiting for a 'ready' event
+
+// Detail-panel metadata by image path, as {modified, metadata}; oldest evicted first
+let metadataCache = new Map();
 
 // Current workflow summary
 let currentWorkflowSummary = null;
@@ -77,164 +77,237 @@ async function handleContextMenuAction(action) {
     hideContextMenu();
 }
 
-function renderThumbnails() {
-    const thumbnailsScroll = document.getElementById('thumbnailsScroll');
-    thumbnailsScroll.innerHTML = '';
-
-    // Folders
-    folders.forEach((folder) => {
-        const thumb = document.createElement('div');
-        thumb.className = 'thumbnail-item folder-thumbnail';
-        thumb.onclick = () => navigateToFolder(folder.path);
-        thumb.oncontextmenu = (e) => showContextMenu(e, folder, 'folder');
-
-        thumb.innerHTML = `
-            <div class="folder-icon-small">
-                <svg width="32" height="32" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
-                    <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"></path>
-                </svg>
-            </div>
-            <div class="folder-name-small">${folder.name}</div>
-        `;
-        thumbnailsScroll.appendChild(thumb);
-    });
-
-    // Images - load directly, no lazy loading complexity
-    images.forEach((image, index) => {
-        const thumb = document.createElement('div');
-        thumb.className = 'thumbnail-item';
-        if (index === currentImageIndex) {
-            thumb.classList.add('active');
-        }
-        thumb.onclick = () => openDetailView(index);
-        thumb.oncontextmenu = (e) => showContextMenu(e, image, 'image');
-
-        // Create img element - load directly
-        const img = document.createElement('img');
-        img.src = `/thumbnail/${image.path}`;
-        img.alt = image.name;
-        img.style.background = '#2d2d2d';
-        img.loading = 'lazy'; // Use browser native lazy loading
-
-        // Add loading state
-        img.style.opacity = '0';
-        img.style.transition = 'opacity 0.3s';
-
-        img.onload = () => {
-            img.style.opacity = '1';
-        };
+// Strip and grid geometry, matching the old flex/grid CSS
+const STRIP_PADDING = 10;
+const STRIP_GAP = 12;
+const GRID_MIN_ITEM_SIZE = 220;
+const GRID_GAP = 16;
+
+let thumbnailList = null;
+let gridList = null;
+
+function getThumbnailList() {
+    if (!thumbnailList) {
+        const thumbnailsScroll = document.getElementById('thumbnailsScroll');
+        thumbnailList = new VirtualList({
+            scroller: document.getElementById('thumbnails'),
+            content: thumbnailsScroll,
+            horizontal: true,
+            overscan: 4,
+            measure: () => ({
+                columns: 1,
+                size: thumbnailsScroll.clientHeight - 2 * STRIP_PADDING,
+                gap: STRIP_GAP,
+                padding: STRIP_PADDING
+            }),
+            renderItem: (index) => index < folders.length
+                ? createFolderThumbnail(folders[index])
+                : createImageThumbnail(index - folders.length),
+            onRemove: forgetPendingThumbnails,
+            onRange: requestVisibleImages
+        });
+    }
+    return thumbnailList;
+}
 
-        img.onerror = () => {
-            img.style.opacity = '0.3';
-            img.alt = 'Loading...';
-        };
+function getGridList() {
+    if (!gridList) {
+        const gridItems = document.getElementById('gridItems');
+        gridList = new VirtualList({
+            scroller: document.getElementById('gridView'),
+            content: gridItems,
+            overscan: 2,
+            measure: () => {
+                const width = gridItems.clientWidth;
+                const columns = Math.max(1, Math.floor((width + GRID_GAP) / (GRID_MIN_ITEM_SIZE + GRID_GAP)));
+                return {
+                    columns,
+                    size: (width - (columns - 1) * GRID_GAP) / columns,
+                    gap: GRID_GAP,
+                    padding: 0
+                };
+            },
+            renderItem: (index) => index < folders.length
+                ? createGridFolder(folders[index])
+                : createGridImage(index - folders.length),
+            onRemove: forgetPendingThumbnails,
+            onRange: requestVisibleImages
+        });
+    }
+    return gridList;
+}
 
-        thumb.appendChild(img);
+function activeList() {
+    return currentViewMode === 'grid' ? getGridList() : getThumbnailList();
+}
 
-        // Add favorite indicator overlay
-        if (image.is_favorite) {
-            const favoriteOverlay = document.createElement('div');
-            favoriteOverlay.className = 'favorite-overlay';
-            favoriteOverlay.innerHTML = `
-                <svg width="16" height="16" viewBox="0 0 24 24" fill="currentColor" stroke="currentColor" stroke-width="2">
-                    <polygon points="12 2 15.09 8.26 22 9.27 17 14.14 18.18 21.02 12 17.77 5.82 21.02 7 14.14 2 9.27 8.91 8.26 12 2"></polygon>
-                </svg>
-            `;
-            thumb.appendChild(favoriteOverlay);
-        }
+function requestVisibleImages(first, last) {
+    // Generate thumbnails for the page on screen and fetch pages ahead of it
+    const firstImage = Math.max(0, first - folders.length);
+    if (firstImage < images.length) {
+        preGenerateThumbnails(Math.floor(firstImage / IMAGES_PAGE_SIZE));
+    }
+    if (last - folders.length >= images.length - IMAGES_PAGE_SIZE / 2) {
+        ensureImagesLoaded(last - folders.length + IMAGES_PAGE_SIZE / 2);
+    }
+}
 
-        thumbnailsScroll.appendChild(thumb);
-    });
+function createFavoriteOverlay(iconSize) {
+    const favoriteOverlay = document.createElement('div');
+    favoriteOverlay.className = 'favorite-overlay';
+    favoriteOverlay.innerHTML = `
+        <svg width="${iconSize}" height="${iconSize}" viewBox="0 0 24 24" fill="currentColor" stroke="currentColor" stroke-width="2">
+            <polygon points="12 2 15.09 8.26 22 9.27 17 14.14 18.18 21.02 12 17.77 5.82 21.02 7 14.14 2 9.27 8.91 8.26 12 2"></polygon>
+        </svg>
+    `;
+    return favoriteOverlay;
+}
 
-    // Scroll active into view
-    const activeThumb = thumbnailsScroll.querySelector('.thumbnail-item.active');
-    if (activeThumb) {
-        activeThumb.scrollIntoView({ behavior: 'smooth', block: 'nearest', inline: 'center' });
+function createThumbnailImage(image, sizes) {
+    const img = document.createElement('img');
+    img.src = thumbnailUrl(image);
+    img.srcset = thumbnailSrcset(image);
+    img.sizes = sizes;
+    img.alt = image.name;
+    img.loading = 'lazy';
+    img.decoding = 'async';
+
+    // Add loading state
+    img.style.opacity = '0';
+    img.style.transition = 'opacity 0.3s';
+
+    img.onload = () => {
+        img.style.opacity = '1';
+    };
+
+    img.onerror = () => {
+        img.style.opacity = '0.3';
+        img.alt = 'Loading...';
+        markThumbnailPending(img, image);
+    };
+
+    if (img.complete && img.naturalWidth) {
+        // Already in the memory cache, e.g. scrolling back: skip the fade-in
+        img.style.opacity = '1';
     }
-}
 
-function renderGridView() {
-    const gridView = document.getElementById('gridView');
-    gridView.innerHTML = '';
-
-    // Folders
-    folders.forEach((folder) => {
-        const gridItem = document.createElement('div');
-        gridItem.className = 'grid-item grid-folder-item';
-        gridItem.onclick = () => navigateToFolder(folder.path);
-        gridItem.oncontextmenu = (e) => showContextMenu(e, folder, 'folder');
-
-        gridItem.innerHTML = `
-            <div class="grid-folder-icon">
-                <svg width="64" height="64" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
-                    <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"></path>
-                </svg>
-            </div>
-            <div class="grid-folder-name">${folder.name}</div>
-        `;
-        gridView.appendChild(gridItem);
-    });
+    return img;
+}
 
-    // Images
-    images.forEach((image, index) => {
-        const gridItem = document.createElement('div');
-        gridItem.className = 'grid-item';
-        gridItem.dataset.index = index;
-        gridItem.dataset.path = image.path;
+function createFolderThumbnail(folder) {
+    const thumb = document.createElement('div');
+    thumb.className = 'thumbnail-item folder-thumbnail';
+    thumb.onclick = () => navigateToFolder(folder.path);
+    thumb.oncontextmenu = (e) => showContextMenu(e, folder, 'folder');
 
-        if (selectedImages.has(image.path)) {
-            gridItem.classList.add('selected');
-        }
+    thumb.innerHTML = `
+        <div class="folder-icon-small">
+            <svg width="32" height="32" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+                <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"></path>
+            </svg>
+        </div>
+        <div class="folder-name-small">${folder.name}</div>
+    `;
+    return thumb;
+}
 
-        // Click handler for selection
-        gridItem.onclick = (e) => handleGridItemClick(e, image, index);
-        gridItem.oncontextmenu = (e) => showContextMenu(e, image, 'image');
+function createImageThumbnail(index) {
+    const image = images[index];
+    const thumb = document.createElement('div');
+    if (!image) {
+        // Its page hasn't arrived yet
+        thumb.className = 'thumbnail-item virtual-placeholder';
+        return thumb;
+    }
 
-        const img = document.createElement('img');
-        img.src = `/thumbnail/${image.path}`;
-        img.alt = image.name;
-        img.loading = 'lazy';
-        img.style.opacity = '0';
-        img.style.transition = 'opacity 0.3s';
+    thumb.className = 'thumbnail-item';
+    thumb.dataset.path = image.path;
+    if (index === currentImageIndex) {
+        thumb.classList.add('active');
+    }
+    thumb.onclick = () => openDetailView(index);
+    thumb.oncontextmenu = (e) => showContextMenu(e, image, 'image');
 
-        img.onload = () => {
-            img.style.opacity = '1';
-        };
+    thumb.appendChild(createThumbnailImage(image, '200px'));
+    if (image.is_favorite) {
+        thumb.appendChild(createFavoriteOverlay(16));
+    }
+    return thumb;
+}
 
-        img.onerror = () => {
-            img.style.opacity = '0.3';
-            img.alt = 'Loading...';
-        };
+function createGridFolder(folder) {
+    const gridItem = document.createElement('div');
+    gridItem.className = 'grid-item grid-folder-item';
+    gridItem.onclick = () => navigateToFolder(folder.path);
+    gridItem.oncontextmenu = (e) => showContextMenu(e, folder, 'folder');
 
-        const checkbox = document.createElement('div');
-        checkbox.className = 'grid-item-checkbox';
-        checkbox.innerHTML = `
-            <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="3">
-                <polyline points="20 6 9 17 4 12"></polyline>
+    gridItem.innerHTML = `
+        <div class="grid-folder-icon">
+            <svg width="64" height="64" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
+                <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"></path>
             </svg>
-        `;
+        </div>
+        <div class="grid-folder-name">${folder.name}</div>
+    `;
+    return gridItem;
+}
+
+function createGridImage(index) {
+    const image = images[index];
+    const gridItem = document.createElement('div');
+    if (!image) {
+        gridItem.className = 'grid-item virtual-placeholder';
+        return gridItem;
+    }
 
-        gridItem.appendChild(img);
-        gridItem.appendChild(checkbox);
+    gridItem.className = 'grid-item';
+    gridItem.dataset.index = index;
+    gridItem.dataset.path = image.path;
 
-        // Add favorite indicator overlay
-        if (image.is_favorite) {
-            const favoriteOverlay = document.createElement('div');
-            favoriteOverlay.className = 'favorite-overlay';
-            favoriteOverlay.innerHTML = `
-                <svg width="20" height="20" viewBox="0 0 24 24" fill="currentColor" stroke="currentColor" stroke-width="2">
-                    <polygon points="12 2 15.09 8.26 22 9.27 17 14.14 18.18 21.02 12 17.77 5.82 21.02 7 14.14 2 9.27 8.91 8.26 12 2"></polygon>
-                </svg>
-            `;
-            gridItem.appendChild(favoriteOverlay);
-        }
+    if (selectedImages.has(image.path)) {
+        gridItem.classList.add('selected');
+    }
 
-        gridView.appendChild(gridItem);
-    });
+    // Click handler for selection
+    gridItem.onclick = (e) => handleGridItemClick(e, image, index);
+    gridItem.oncontextmenu = (e) => showContextMenu(e, image, 'image');
 
+    const checkbox = document.createElement('div');
+    checkbox.className = 'grid-item-checkbox';
+    checkbox.innerHTML = `
+        <svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="3">
+            <polyline points="20 6 9 17 4 12"></polyline>
+        </svg>
+    `;
+
+    gridItem.appendChild(createThumbnailImage(image, '260px'));
+    gridItem.appendChild(checkbox);
+    if (image.is_favorite) {
+        gridItem.appendChild(createFavoriteOverlay(20));
+    }
+    return gridItem;
+}
+
+function renderThumbnails() {
+    getThumbnailList().reset(folders.length + totalImages);
+    updateActiveThumbnail();
+}
+
+function renderGridView() {
+    getGridList().reset(folders.length + totalImages);
     updateSelectionUI();
 }
 
+function refreshImageViews() {
+    // Pages arrived or the total changed: keep the scroll position
+    activeList().setCount(folders.length + totalImages);
+}
+
+function updateImageItem(index) {
+    // Re-render one image (e.g. its favorite star) without touching the rest
+    activeList().update(folders.length + index);
+}
+
 function renderWorkflowSummary(summary) {
     let html = '';
 
@@ -283,19 +356,24 @@ function renderWorkflowSummary(summary) {
 
 function buildTreeLevel(container, folders, level) {
     for (const folder of folders) {
-        const itemContainer = document.createElement('div');
-        itemContainer.style.paddingLeft = `${level * 20}px`;
+        const node = document.createElement('div');
+        node.className = 'tree-node';
+        node.dataset.path = folder.path;
+        node.dataset.level = level;
 
         const item = document.createElement('div');
         item.className = currentPath === folder.path ? 'tree-item active' : 'tree-item';
         item.dataset.path = folder.path;
+        item.style.paddingLeft = `${16 + level * 20}px`;
         item.innerHTML = `
+            <span class="tree-item-toggle">${folder.has_children ? '▶' : ''}</span>
             <span class="tree-item-icon">
                 <svg width="16" height="16" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
                     <path d="M22 19a2 2 0 0 1-2 2H4a2 2 0 0 1-2-2V5a2 2 0 0 1 2-2h5l2 3h9a2 2 0 0 1 2 2z"></path>
                 </svg>
             </span>
             <span class="tree-item-name">${folder.name}</span>
+            ${folder.image_count ? `<span class="tree-item-count">${folder.image_count}</span>` : ''}
         `;
         item.onclick = (e) => {
             e.stopPropagation();
@@ -305,13 +383,19 @@ function buildTreeLevel(container, folders, level) {
             e.stopPropagation();
             showContextMenu(e, folder, 'folder');
         };
+        if (folder.has_children) {
+            item.querySelector('.tree-item-toggle').onclick = (e) => {
+                e.stopPropagation();
+                toggleTreeFolder(folder.path);
+            };
+        }
 
-        itemContainer.appendChild(item);
-        container.appendChild(itemContainer);
+        const children = document.createElement('div');
+        children.className = 'tree-children';
 
-        if (folder.children && folder.children.length > 0) {
-            buildTreeLevel(container, folder.children, level + 1);
-        }
+        node.appendChild(item);
+        node.appendChild(children);
+        container.appendChild(node);
     }
 }
 
@@ -370,20 +454,22 @@ function updateImageInfo(image) {
 }
 
 function updateActiveThumbnail() {
-    // Remove active class from all thumbnails
-    document.querySelectorAll('.thumbnail-item').forEach(thumb => {
-        thumb.classList.remove('active');
-    });
+    if (currentViewMode !== 'detail') return;
 
-    // Add active class to current thumbnail
+    const list = getThumbnailList();
     const thumbnailsScroll = document.getElementById('thumbnailsScroll');
-    const thumbnails = thumbnailsScroll.querySelectorAll('.thumbnail-item');
+    thumbnailsScroll.querySelectorAll('.thumbnail-item.active').forEach(thumb => {
+        thumb.classList.remove('active');
+    });
 
     // Account for folders before images
     const thumbnailIndex = folders.length + currentImageIndex;
-    if (thumbnails[thumbnailIndex]) {
-        thumbnails[thumbnailIndex].classList.add('active');
-        thumbnails[thumbnailIndex].scrollIntoView({ behavior: 'smooth', block: 'nearest', inline: 'center' });
+    const thumb = list.nodeAt(thumbnailIndex);
+    if (thumb) {
+        thumb.classList.add('active');
+    }
+    if (currentImageIndex >= 0) {
+        list.scrollToIndex(thumbnailIndex);
     }
 }
 
@@ -397,6 +483,7 @@ function toggleMetadataSection(sectionId) {
 
         const isCollapsed = content.classList.contains('collapsed');
         localStorage.setItem(`metadata-${sectionId}`, isCollapsed ? 'collapsed' : 'expanded');
+        if (!isCollapsed && selectedImage) loadLargeMetadata(selectedImage);
     }
 }
 
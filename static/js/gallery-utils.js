@@ -76,7 +76,7 @@ async function copyMetadataToClipboard(imagePath) {
 
 async function copyWorkflowToClipboard(imagePath) {
     try {
-        const response = await fetch(`/api/metadata/${imagePath}`);
+        const response = await fetch(`/api/metadata/${imagePath}?fields=workflow`);
         const metadata = await response.json();
         if (metadata.workflow) {
             await navigator.clipboard.writeText(JSON.stringify(metadata.workflow, null, 2));
@@ -89,6 +89,46 @@ async function copyWorkflowToClipboard(imagePath) {
     }
 }
 
+function fromColumns(columns) {
+    // Rebuild records from a ?format=columns listing (one array per field)
+    if (!columns) return [];
+    if (Array.isArray(columns)) return columns;
+    const fields = Object.keys(columns);
+    const count = fields.length ? columns[fields[0]].length : 0;
+    const records = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const record = {};
+        for (const field of fields) record[field] = columns[field][i];
+        records[i] = record;
+    }
+    return records;
+}
+
+// Thumbnail sizes produced by the server (bounding box in pixels)
+const THUMBNAIL_SIZES = { small: 128, medium: 300, large: 600 };
+
+function versionQuery(image) {
+    // URLs carrying the file's mtime are served as immutable and change with the file
+    return image.modified !== undefined ? `v=${image.modified}` : '';
+}
+
+function imageUrl(image) {
+    const version = versionQuery(image);
+    return `/image/${image.path}${version ? '?' + version : ''}`;
+}
+
+function thumbnailUrl(image, size = 'medium', extraQuery = '') {
+    const params = [size === 'medium' ? '' : `size=${size}`, versionQuery(image), extraQuery].filter(Boolean);
+    return `/thumbnail/${image.path}${params.length ? '?' + params.join('&') : ''}`;
+}
+
+function thumbnailSrcset(image, extraQuery = '') {
+    // Let the browser pick a size for the slot width and pixel density
+    return Object.entries(THUMBNAIL_SIZES)
+        .map(([size, width]) => `${thumbnailUrl(image, size, extraQuery)} ${width}w`)
+        .join(', ');
+}
+
 function downloadImage(imagePath) {
     window.location.href = `/api/download/${imagePath}`;
 }
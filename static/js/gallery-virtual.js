@@ -0,0 +1,175 @@
+// Gallery Virtual Lists
+// Windowed rendering for the thumbnail strip and the grid view. Only the items
+// in or near the viewport are in the DOM, absolutely positioned inside a
+// content element sized for the whole listing, so scrolling a folder of 50k
+// images touches the same few dozen nodes as a folder of 50.
+
+class VirtualList {
+    // scroller: the element that scrolls; content: the element items go in
+    // measure(): {columns, size, gap, padding} for the current viewport
+    // renderItem(index): a new element for item index
+    // onRemove(node): called when an item scrolls out of range
+    // onRange(first, last): called after rendering with the rendered range
+    constructor({ scroller, content, horizontal = false, overscan = 2, measure, renderItem, onRemove, onRange }) {
+        this.scroller = scroller;
+        this.content = content;
+        this.horizontal = horizontal;
+        this.overscan = overscan; // lines rendered past each edge of the viewport
+        this.measure = measure;
+        this.renderItem = renderItem;
+        this.onRemove = onRemove;
+        this.onRange = onRange;
+
+        this.count = 0;
+        this.nodes = new Map(); // item index -> element
+        this.layout = null;
+        this.frame = 0;
+
+        scroller.addEventListener('scroll', () => this.schedule(), { passive: true });
+        new ResizeObserver(() => {
+            this.layout = null;
+            this.schedule();
+        }).observe(scroller);
+    }
+
+    schedule() {
+        // At most one render per frame, however many scroll events arrive
+        if (!this.frame) {
+            this.frame = requestAnimationFrame(() => this.render());
+        }
+    }
+
+    reset(count) {
+        // Show a new listing from the start
+        this.count = count;
+        this.layout = null;
+        this.clear();
+        if (this.horizontal) {
+            this.scroller.scrollLeft = 0;
+        } else {
+            this.scroller.scrollTop = 0;
+        }
+        this.render();
+    }
+
+    setCount(count) {
+        // The listing grew or shrank, or pages arrived for placeholder items
+        this.count = count;
+        for (const [index, node] of this.nodes) {
+            if (index >= count || node.classList.contains('virtual-placeholder')) {
+                this.removeNode(index, node);
+            }
+        }
+        if (this.layout) this.updateExtent();
+        this.schedule();
+    }
+
+    update(index) {
+        // Re-render one item in place, if it is on screen
+        const node = this.nodes.get(index);
+        if (node) {
+            this.removeNode(index, node);
+            this.content.appendChild(this.createNode(index));
+        }
+    }
+
+    nodeAt(index) {
+        return this.nodes.get(index) || null;
+    }
+
+    scrollToIndex(index, behavior = 'smooth') {
+        const layout = this.layout;
+        if (!layout || index < 0 || index >= this.count) return;
+
+        const line = Math.floor(index / layout.columns);
+        const viewport = this.viewportSize();
+        const start = layout.offset + layout.padding + line * layout.stride;
+        const current = this.scrollPosition();
+        // Centre the item, as scrollIntoView({inline: 'center'}) did
+        const target = Math.max(0, start - (viewport - layout.size) / 2);
+        if (Math.abs(target - current) > viewport * 3) behavior = 'auto';
+        this.scroller.scrollTo({ [this.horizontal ? 'left' : 'top']: target, behavior });
+    }
+
+    render() {
+        if (this.frame) {
+            cancelAnimationFrame(this.frame);
+            this.frame = 0;
+        }
+        // Hidden views are laid out when the ResizeObserver sees them again
+        if (this.scroller.clientWidth === 0) return;
+
+        if (!this.layout) {
+            this.layout = this.computeLayout();
+            this.clear();
+            this.updateExtent();
+        }
+
+        const { columns, stride, padding, offset } = this.layout;
+        const lines = Math.ceil(this.count / columns);
+        const position = this.scrollPosition() - offset - padding;
+        const firstLine = Math.max(0, Math.floor(position / stride) - this.overscan);
+        const lastLine = Math.min(lines - 1, Math.floor((position + this.viewportSize()) / stride) + this.overscan);
+        const first = firstLine * columns;
+        const last = Math.min(this.count - 1, (lastLine + 1) * columns - 1);
+
+        for (const [index, node] of this.nodes) {
+            if (index < first || index > last) this.removeNode(index, node);
+        }
+
+        const fragment = document.createDocumentFragment();
+        for (let index = first; index <= last; index++) {
+            if (!this.nodes.has(index)) fragment.appendChild(this.createNode(index));
+        }
+        this.content.appendChild(fragment);
+
+        if (this.onRange && last >= first) this.onRange(first, last);
+    }
+
+    computeLayout() {
+        const { columns, size, gap, padding } = this.measure();
+        const offset = this.horizontal ? this.content.offsetLeft : this.content.offsetTop;
+        return { columns: Math.max(1, columns), size, gap, padding, offset, stride: size + gap };
+    }
+
+    updateExtent() {
+        const { columns, stride, gap, padding } = this.layout;
+        const lines = Math.ceil(this.count / columns);
+        const extent = lines > 0 ? 2 * padding + lines * stride - gap : 0;
+        this.content.style[this.horizontal ? 'width' : 'height'] = `${extent}px`;
+    }
+
+    createNode(index) {
+        const { columns, size, stride, padding } = this.layout;
+        const along = padding + Math.floor(index / columns) * stride;
+        const across = padding + (index % columns) * stride;
+
+        const node = this.renderItem(index);
+        node.style.width = `${size}px`;
+        node.style.height = `${size}px`;
+        node.style.left = `${this.horizontal ? along : across}px`;
+        node.style.top = `${this.horizontal ? across : along}px`;
+        this.nodes.set(index, node);
+        return node;
+    }
+
+    removeNode(index, node) {
+        node.remove();
+        this.nodes.delete(index);
+        if (this.onRemove) this.onRemove(node);
+    }
+
+    clear() {
+        for (const [index, node] of this.nodes) {
+            this.removeNode(index, node);
+        }
+    }
+
+    scrollPosition() {
+        return this.horizontal ? this.scroller.scrollLeft : this.scroller.scrollTop;
+    }
+
+    viewportSize() {
+        return this.horizontal ? this.scroller.clientWidth : this.scroller.clientHeight;
+    }
+}
@@ -0,0 +1,582 @@
+"""
+Thumbnail store for ComfyUI Gallery
+Content-addressed, sharded thumbnail cache with an on-disk manifest
+"""
+
+import hashlib
+import itertools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+import similarity
+
+# Store configuration
+MANIFEST_FILENAME = 'manifest.db'
+LEGACY_EXTENSION = 'jpg'
+
+# Named thumbnail sizes (bounding boxes); every size is produced in one pass
+THUMBNAIL_SIZES = {
+    'small': (128, 128),
+    'medium': (300, 300),
+    'large': (600, 600),
+}
+DEFAULT_SIZE = 'medium'
+# Perceptual hashes are taken from the smallest derivative
+HASH_SIZE = 'small'
+THUMBNAIL_SIZE = THUMBNAIL_SIZES[DEFAULT_SIZE]
+
+# Output formats, in order of preference (see set_format_preference())
+THUMBNAIL_FORMATS = {
+    'avif': {'pil_format': 'AVIF', 'mimetype': 'image/avif', 'options': {'quality': 55}},
+    'webp': {'pil_format': 'WEBP', 'mimetype': 'image/webp', 'options': {'quality': 80, 'method': 4}},
+    'jpg': {'pil_format': 'JPEG', 'mimetype': 'image/jpeg', 'options': {'quality': 85, 'optimize': True}},
+}
+FORMAT_PREFERENCE = ['avif', 'webp', 'jpg']
+FALLBACK_FORMAT = 'jpg'
+
+# Images are pre-reduced to at least this multiple of the target size before
+# the final LANCZOS pass, which keeps the result visually identical
+REDUCING_GAP = 2
+
+# Worker pool configuration (see set_worker_limits())
+THUMBNAIL_WORKERS = max(1, min(4, os.cpu_count() or 1))
+THUMBNAIL_QUEUE_DEPTH = 10000
+
+# Lower values are served first
+PRIORITY_ON_DEMAND = 0
+PRIORITY_BACKGROUND = 10
+
+# Will be set by set_thumbnail_dir()
+THUMBNAIL_DIR = None
+MANIFEST_FILE = None
+
+# In-memory copy of the manifest: relative image path -> thumbnail key
+_manifest: Dict[str, str] = {}
+_manifest_lock = threading.Lock()
+_manifest_conn = None
+
+# Perceptual hashes by image path, built from the manifest on first use
+_hash_index: Optional[similarity.HashIndex] = None
+
+# Every write stamps its row with the next seq, so each process can pick up
+# rows written by the others since it last looked (see _sync_manifest())
+_synced_seq = 0
+_data_version = None
+
+
+def set_thumbnail_dir(path: str):
+    """Set the thumbnail directory and manifest location"""
+    global THUMBNAIL_DIR, MANIFEST_FILE
+    THUMBNAIL_DIR = path
+    MANIFEST_FILE = os.path.join(path, MANIFEST_FILENAME)
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+
+def normalize_path(rel_path: str) -> str:
+    """Normalize a relative image path so keys match across platforms"""
+    return rel_path.replace('\\', '/').strip('/')
+
+
+def thumbnail_key(rel_path: str, stat_result: os.stat_result) -> str:
+    """
+    Build a stable key for an image version
+    The key only depends on the relative path, mtime and size, so it is
+    identical across processes and restarts (unlike the built-in hash()).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(normalize_path(rel_path).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(f"{stat_result.st_mtime_ns}:{stat_result.st_size}".encode('ascii'))
+    return digest.hexdigest()
+
+
+def shard_dir(key: str) -> str:
+    """
+    Get the directory holding every variant of a thumbnail key
+    Two levels of 256 shards keep every directory small.
+    """
+    return os.path.join(THUMBNAIL_DIR, key[:2], key[2:4])
+
+
+def shard_path(key: str, size: str = DEFAULT_SIZE, fmt: str = FALLBACK_FORMAT) -> str:
+    """Get the on-disk location for one size/format variant of a thumbnail"""
+    return os.path.join(shard_dir(key), f"{key}-{size}.{fmt}")
+
+
+def _remove_variants(key: str):
+    """Delete every size/format variant of a thumbnail key"""
+    try:
+        entries = list(os.scandir(shard_dir(key)))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.name.startswith(f"{key}-"):
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def supported_formats() -> List[str]:
+    """Formats from FORMAT_PREFERENCE that this Pillow build can encode"""
+    Image.init()
+    return [fmt for fmt in FORMAT_PREFERENCE
+            if THUMBNAIL_FORMATS[fmt]['pil_format'] in Image.SAVE] or [FALLBACK_FORMAT]
+
+
+def set_format_preference(formats: List[str]):
+    """Set the preferred output formats, best first"""
+    global FORMAT_PREFERENCE
+    FORMAT_PREFERENCE = [fmt for fmt in formats if fmt in THUMBNAIL_FORMATS] or [FALLBACK_FORMAT]
+
+
+def preferred_format() -> str:
+    """Format used for background pre-generation"""
+    return supported_formats()[0]
+
+
+def negotiate_format(accepted_mimetypes) -> str:
+    """
+    Pick the best format the client explicitly accepts
+    Wildcards are ignored on purpose: browsers send */* for images too, and
+    only formats they name are known to be decodable. JPEG is always
+    acceptable.
+    """
+    accepted = set(accepted_mimetypes)
+    for fmt in supported_formats():
+        if fmt == FALLBACK_FORMAT or THUMBNAIL_FORMATS[fmt]['mimetype'] in accepted:
+            return fmt
+    return FALLBACK_FORMAT
+
+
+def mimetype_for(fmt: str) -> str:
+    """Get the Content-Type for a thumbnail format"""
+    return THUMBNAIL_FORMATS[fmt]['mimetype']
+
+
+def initialize_manifest():
+    """
+    Open the manifest and load it into memory
+    Also removes thumbnails left behind by the old hash()-based naming,
+    which can never be looked up again.
+    """
+    global _manifest_conn, _hash_index, _synced_seq, _data_version
+
+    if MANIFEST_FILE is None:
+        raise RuntimeError("Thumbnail store not initialized. Call set_thumbnail_dir() first.")
+
+    conn = sqlite3.connect(MANIFEST_FILE, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL;')
+    conn.execute('PRAGMA synchronous=NORMAL;')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS thumbnails (
+            path TEXT PRIMARY KEY,
+            key TEXT NOT NULL,
+            created REAL DEFAULT 0
+        )
+    ''')
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(thumbnails)')]
+    if 'dhash' not in columns:
+        conn.execute('ALTER TABLE thumbnails ADD COLUMN dhash INTEGER')
+    if 'seq' not in columns:
+        conn.execute('ALTER TABLE thumbnails ADD COLUMN seq INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_thumbnails_seq ON thumbnails(seq)')
+    conn.commit()
+
+    with _manifest_lock:
+        _manifest_conn = conn
+        _hash_index = None
+        _manifest.clear()
+        _data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        for path, key in conn.execute('SELECT path, key FROM thumbnails'):
+            _manifest[path] = key
+        _synced_seq = conn.execute('SELECT IFNULL(MAX(seq), 0) FROM thumbnails').fetchone()[0]
+
+    removed = _remove_legacy_thumbnails()
+    print(f"INFO: Thumbnail manifest loaded ({len(_manifest)} entries, {removed} legacy files removed)")
+
+
+def _remove_legacy_thumbnails() -> int:
+    """Delete flat <hash>.jpg files from before the sharded layout"""
+    removed = 0
+    for entry in os.scandir(THUMBNAIL_DIR):
+        if entry.is_file() and entry.name.endswith(f".{LEGACY_EXTENSION}"):
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _sync_manifest():
+    """
+    Apply manifest rows other worker processes wrote since the last sync
+    PRAGMA data_version only changes when another connection commits, so
+    this is a single cheap query while nothing else is writing. Rows other
+    processes delete are not seen; callers already check that the image
+    still exists. The caller must hold _manifest_lock.
+    """
+    global _synced_seq, _data_version
+    if _manifest_conn is None:
+        return
+    version = _manifest_conn.execute('PRAGMA data_version').fetchone()[0]
+    if version == _data_version:
+        return
+    _data_version = version
+
+    rows = _manifest_conn.execute(
+        'SELECT path, key, dhash, seq FROM thumbnails WHERE seq > ? ORDER BY seq', (_synced_seq,)
+    ).fetchall()
+    for path, key, dhash, seq in rows:
+        _manifest[path] = key
+        if _hash_index is not None:
+            if dhash is not None:
+                _hash_index.add(path, similarity.from_signed(dhash))
+            else:
+                _hash_index.remove(path)
+        _synced_seq = seq
+
+
+def lookup(rel_path: str) -> Optional[str]:
+    """Get the key last recorded for an image by any process, if any"""
+    path = normalize_path(rel_path)
+    with _manifest_lock:
+        _sync_manifest()
+        return _manifest.get(path)
+
+
+def record(rel_path: str, key: str, dhash: Optional[int] = None):
+    """
+    Record the current thumbnail key (and perceptual hash) for an image
+    Previous thumbnails for the same image are stale once the key changes,
+    so all of their variants are removed from disk.
+    """
+    path = normalize_path(rel_path)
+
+    with _manifest_lock:
+        _sync_manifest()
+        old_key = _manifest.get(path)
+        if old_key == key and dhash is None:
+            return
+        _manifest[path] = key
+
+        if _manifest_conn is not None:
+            # Another worker may have stored the hash for this same key since
+            # our last sync: keep it unless the key changed
+            stored = _manifest_conn.execute('''
+                INSERT INTO thumbnails (path, key, created, dhash, seq)
+                VALUES (?, ?, ?, ?, (SELECT IFNULL(MAX(seq), 0) + 1 FROM thumbnails))
+                ON CONFLICT(path) DO UPDATE SET
+                    key = excluded.key,
+                    created = CASE WHEN thumbnails.key = excluded.key
+                                   THEN thumbnails.created ELSE excluded.created END,
+                    dhash = COALESCE(excluded.dhash,
+                                     CASE WHEN thumbnails.key = excluded.key THEN thumbnails.dhash END),
+                    seq = excluded.seq
+                RETURNING dhash
+            ''', (path, key, time.time(), None if dhash is None else similarity.to_signed(dhash))).fetchone()[0]
+            _manifest_conn.commit()
+            dhash = None if stored is None else similarity.from_signed(stored)
+
+        if _hash_index is not None:
+            if dhash is not None:
+                _hash_index.add(path, dhash)
+            else:
+                _hash_index.remove(path)
+
+    if old_key and old_key != key:
+        _remove_variants(old_key)
+
+
+def forget(rel_path: str):
+    """Remove an image from the manifest and delete its thumbnails"""
+    path = normalize_path(rel_path)
+
+    with _manifest_lock:
+        key = _manifest.pop(path, None)
+        if key is None:
+            return
+        if _manifest_conn is not None:
+            _manifest_conn.execute('DELETE FROM thumbnails WHERE path = ?', (path,))
+            _manifest_conn.commit()
+        if _hash_index is not None:
+            _hash_index.remove(path)
+
+    _remove_variants(key)
+
+
+def _target_size(width: int, height: int, box=THUMBNAIL_SIZE):
+    """Size of an image scaled to fit inside box, never enlarged"""
+    ratio = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+
+def shrink_image(img: Image.Image, box=THUMBNAIL_SIZE) -> Image.Image:
+    """
+    Downscale an open image to fit inside box as cheaply as possible
+    JPEGs are decoded at a reduced scale (draft mode), then a fast integer
+    box reduction brings any image to within REDUCING_GAP of the target
+    before the final LANCZOS pass.
+    """
+    target = _target_size(img.width, img.height, box)
+
+    # Only affects JPEG: libjpeg decodes directly at 1/2, 1/4 or 1/8 scale
+    img.draft('RGB', (target[0] * REDUCING_GAP, target[1] * REDUCING_GAP))
+
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() else 'RGB')
+
+    factor = int(min(img.width / target[0], img.height / target[1]) / REDUCING_GAP)
+    if factor > 1:
+        img = img.reduce(factor)
+
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    return img
+
+
+def flatten_alpha(img: Image.Image) -> Image.Image:
+    """Composite transparent images onto white so they can be stored as JPEG"""
+    if img.mode not in ('RGBA', 'LA'):
+        return img
+    rgba = img.convert('RGBA')
+    background = Image.new('RGB', rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def _save_atomic(img: Image.Image, path: str, fmt: str):
+    """Save to a temporary file and rename it into place"""
+    spec = THUMBNAIL_FORMATS[fmt]
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        img.save(temp_path, spec['pil_format'], **spec['options'])
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def generate_thumbnail(image_path: str, key: str, fmt: str = FALLBACK_FORMAT) -> Optional[int]:
+    """
+    Generate every thumbnail size for an image in one format
+    The source is decoded once; each smaller size is derived from the next
+    larger one. Alpha is only flattened for JPEG, after shrinking, so the
+    full-size image is never copied. Files are written to a temporary name
+    and renamed into place, so readers never see a partial thumbnail.
+    Returns the perceptual hash of the smallest size, or None on failure.
+    """
+    sizes = sorted(THUMBNAIL_SIZES.items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+    try:
+        os.makedirs(shard_dir(key), exist_ok=True)
+        with Image.open(image_path) as img:
+            thumb = img
+            for size, box in sizes:
+                thumb = shrink_image(thumb, box)
+                output = flatten_alpha(thumb) if fmt == 'jpg' else thumb
+                _save_atomic(output, shard_path(key, size, fmt), fmt)
+                if size == HASH_SIZE:
+                    dhash = similarity.dhash(output)
+        return dhash
+    except Exception as e:
+        print(f"Error generating thumbnail: {e}")
+        return None
+
+
+def hash_thumbnail(key: str) -> Optional[int]:
+    """Perceptual hash of an existing thumbnail, from whichever format is on disk"""
+    for fmt in THUMBNAIL_FORMATS:
+        try:
+            with Image.open(shard_path(key, HASH_SIZE, fmt)) as img:
+                return similarity.dhash(img)
+        except Exception:
+            continue
+    return None
+
+
+class _Job:
+    """A pending thumbnail generation, shared by every caller asking for it"""
+
+    __slots__ = ('rel_path', 'image_path', 'key', 'fmt', 'priority', 'future', 'started')
+
+    def __init__(self, rel_path: str, image_path: str, key: str, fmt: str, priority: int):
+        self.rel_path = rel_path
+        self.image_path = image_path
+        self.key = key
+        self.fmt = fmt
+        self.priority = priority  # best priority it has been queued at
+        self.future = Future()
+        self.started = False
+
+
+class ThumbnailPool:
+    """
+    Fixed-size pool of thumbnail workers
+    Requests for the same thumbnail key and format are coalesced into a
+    single job, and on-demand requests are served before background
+    pre-generation. Threads are enough here because Pillow releases the GIL
+    while decoding and resampling.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.queue_depth = queue_depth
+        self._queue = queue.PriorityQueue()
+        self._jobs: Dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"thumbnail-worker-{i}", daemon=True)
+            thread.start()
+
+    def submit(self, rel_path: str, image_path: str, key: str, fmt: str,
+               priority: int = PRIORITY_BACKGROUND) -> Optional[Future]:
+        """
+        Queue a thumbnail for generation
+        Returns the job's future (resolving to True on success), or None when
+        a background request is rejected because the queue is full.
+        """
+        job_id = f"{key}.{fmt}"
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                if priority >= PRIORITY_BACKGROUND and len(self._jobs) >= self.queue_depth:
+                    return None
+                job = _Job(rel_path, image_path, key, fmt, priority)
+                self._jobs[job_id] = job
+            elif job.started or priority >= job.priority:
+                return job.future
+            else:
+                # Re-queue at the better priority; the worker skips whichever
+                # entry it reaches second
+                job.priority = priority
+
+            self._queue.put((priority, next(self._counter), job_id))
+            return job.future
+
+    def pending(self) -> int:
+        """Number of jobs queued or in progress"""
+        with self._lock:
+            return len(self._jobs)
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self._queue.get()
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job.started:
+                    continue
+                job.started = True
+
+            try:
+                result = _run_job(job)
+            except Exception as e:
+                print(f"Error generating thumbnail for {job.rel_path}: {e}")
+                result = False
+            finally:
+                with self._lock:
+                    self._jobs.pop(job_id, None)
+
+            job.future.set_result(result)
+
+
+def _run_job(job: _Job) -> bool:
+    """Generate one thumbnail set and record it in the manifest"""
+    # Another process may have produced it while the job was queued
+    if os.path.exists(shard_path(job.key, DEFAULT_SIZE, job.fmt)):
+        dhash = lookup_hash(job.rel_path) if lookup(job.rel_path) == job.key else None
+        if dhash is None:
+            dhash = hash_thumbnail(job.key)
+    else:
+        dhash = generate_thumbnail(job.image_path, job.key, job.fmt)
+        if dhash is None:
+            return False
+
+    record(job.rel_path, job.key, dhash)
+    return True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def set_worker_limits(workers: int, queue_depth: int):
+    """Configure the worker pool; must be called before the first submit"""
+    global THUMBNAIL_WORKERS, THUMBNAIL_QUEUE_DEPTH
+    THUMBNAIL_WORKERS = max(1, workers)
+    THUMBNAIL_QUEUE_DEPTH = max(1, queue_depth)
+
+
+def get_pool() -> ThumbnailPool:
+    """Get the shared worker pool, starting it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThumbnailPool(THUMBNAIL_WORKERS, THUMBNAIL_QUEUE_DEPTH)
+    return _pool
+
+
+def submit(rel_path: str, image_path: str, key: str, fmt: Optional[str] = None,
+           priority: int = PRIORITY_BACKGROUND) -> Optional[Future]:
+    """Queue a thumbnail on the shared worker pool (preferred format by default)"""
+    return get_pool().submit(rel_path, image_path, key, fmt or preferred_format(), priority)
+
+
+def get_hash_index() -> similarity.HashIndex:
+    """
+    Get the in-memory perceptual hash index, loading it from the manifest on
+    first use and bringing it up to date with hashes other processes recorded
+    """
+    global _hash_index
+    with _manifest_lock:
+        _sync_manifest()
+        if _hash_index is None:
+            index = similarity.HashIndex()
+            if _manifest_conn is not None:
+                index.update((path, similarity.from_signed(dhash)) for path, dhash in
+                             _manifest_conn.execute('SELECT path, dhash FROM thumbnails WHERE dhash IS NOT NULL'))
+            _hash_index = index
+        return _hash_index
+
+
+def lookup_hash(rel_path: str) -> Optional[int]:
+    """Get the perceptual hash recorded for an image, if any"""
+    return get_hash_index().get(normalize_path(rel_path))
+
+
+def hash_backlog() -> int:
+    """
+    Hash thumbnails generated before perceptual hashes were recorded
+    Reads the small thumbnail already on disk, never the original.
+    Returns the number of images hashed.
+    """
+    with _manifest_lock:
+        if _manifest_conn is None:
+            return 0
+        rows = _manifest_conn.execute('SELECT path, key FROM thumbnails WHERE dhash IS NULL').fetchall()
+
+    hashed = 0
+    for path, key in rows:
+        dhash = hash_thumbnail(key)
+        if dhash is not None and lookup(path) == key:
+            record(path, key, dhash)
+            hashed += 1
+
+    if hashed:
+        print(f"INFO: Computed perceptual hashes for {hashed} existing thumbnails")
+    return hashed
@@ -0,0 +1,396 @@
+"""
+Filesystem change tracking for ComfyUI Gallery
+Watches the output directory with inotify on Linux, or by polling directory
+mtimes elsewhere, and reports batched changes to a handler
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Changes are delivered once the filesystem has been quiet for DEBOUNCE
+# seconds, or at the latest MAX_DELAY seconds after the first change
+DEBOUNCE = 0.25
+MAX_DELAY = 1.0
+POLL_INTERVAL = 2.0
+
+
+class ChangeSet:
+    """
+    Batched filesystem changes, as paths relative to the watched root
+    upserts: files added or modified; deletes: files removed;
+    moves: (old, new) file or directory renames; dirs_added /
+    dirs_removed: directories created or removed; rescan: events were lost
+    and the caller should fall back to a full sync.
+    """
+
+    def __init__(self):
+        self.upserts: Set[str] = set()
+        self.deletes: Set[str] = set()
+        self.moves: List[Tuple[str, str]] = []
+        self.dirs_added: Set[str] = set()
+        self.dirs_removed: Set[str] = set()
+        self.rescan = False
+
+    def __bool__(self):
+        return bool(self.upserts or self.deletes or self.moves or
+                    self.dirs_added or self.dirs_removed or self.rescan)
+
+    def upsert(self, path: str):
+        self.deletes.discard(path)
+        self.upserts.add(path)
+
+    def delete(self, path: str):
+        self.upserts.discard(path)
+        self.deletes.add(path)
+
+
+def _is_ignored(name: str, ignore: Set[str]) -> bool:
+    return name in ignore
+
+
+class _Watcher(ABC):
+    """Base class: debounced delivery of ChangeSets on a daemon thread"""
+
+    def __init__(self, root: str, handler: Callable[[ChangeSet], None],
+                 extensions: Set[str], ignore: Set[str]):
+        self.root = os.path.abspath(root)
+        self.handler = handler
+        self.extensions = extensions
+        self.ignore = ignore
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _relpath(self, full_path: str) -> str:
+        return os.path.relpath(full_path, self.root)
+
+    def _is_image(self, name: str) -> bool:
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def _deliver(self, changes: ChangeSet):
+        try:
+            self.handler(changes)
+        except Exception as e:
+            print(f"Error applying filesystem changes: {e}")
+
+    @abstractmethod
+    def _run(self):
+        """Watch until stopped, delivering batches with _deliver"""
+
+
+class InotifyWatcher(_Watcher):
+    """Recursive inotify watcher (Linux)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._watches: Dict[int, str] = {}
+        try:
+            self._add_tree(self.root)
+        except BaseException:
+            # e.g. the watch limit was hit; the caller falls back to polling
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, directory: str) -> bool:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}")
+        self._watches[wd] = directory
+        return True
+
+    def _add_tree(self, directory: str, changes: Optional[ChangeSet] = None):
+        """
+        Watch a directory and everything below it
+        When changes is given, files already present are reported as
+        upserts: they may have landed before the watch was in place.
+        """
+        for current, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not _is_ignored(d, self.ignore)]
+            self._add_watch(current)
+            if changes is not None:
+                if current != directory:
+                    changes.dirs_added.add(self._relpath(current))
+                for name in files:
+                    if self._is_image(name):
+                        changes.upsert(self._relpath(os.path.join(current, name)))
+
+    def _read_events(self, changes: ChangeSet, moved_from: Dict[int, Tuple[str, bool]]):
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                changes.rescan = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None or not name or _is_ignored(name, self.ignore):
+                continue
+
+            full_path = os.path.join(directory, name)
+            rel_path = self._relpath(full_path)
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_MOVED_FROM:
+                moved_from[cookie] = (rel_path, is_dir)
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                if source is not None:
+                    changes.moves.append((source[0], rel_path))
+                    if is_dir:
+                        self._rename_watches(source[0], rel_path)
+                elif is_dir:
+                    self._add_tree(full_path, changes)
+                    changes.dirs_added.add(rel_path)
+                elif self._is_image(name):
+                    changes.upsert(rel_path)
+            elif is_dir:
+                if mask & IN_CREATE:
+                    self._add_tree(full_path, changes)
+                    changes.dirs_added.add(rel_path)
+                elif mask & IN_DELETE:
+                    changes.dirs_removed.add(rel_path)
+            elif self._is_image(name):
+                if mask & IN_CLOSE_WRITE:
+                    changes.upsert(rel_path)
+                elif mask & IN_DELETE:
+                    changes.delete(rel_path)
+
+    def _rename_watches(self, old_rel: str, new_rel: str):
+        """Keep watch descriptors pointing at a renamed directory tree"""
+        old_prefix = os.path.join(self.root, old_rel)
+        new_prefix = os.path.join(self.root, new_rel)
+        for wd, directory in list(self._watches.items()):
+            if directory == old_prefix or directory.startswith(old_prefix + os.sep):
+                self._watches[wd] = new_prefix + directory[len(old_prefix):]
+
+    def _flush_moves(self, changes: ChangeSet, moved_from: Dict[int, Tuple[str, bool]]):
+        """Moves out of the watched tree are deletions"""
+        for rel_path, is_dir in moved_from.values():
+            if is_dir:
+                changes.dirs_removed.add(rel_path)
+            elif self._is_image(rel_path):
+                changes.delete(rel_path)
+        moved_from.clear()
+
+    def _run(self):
+        changes = ChangeSet()
+        moved_from: Dict[int, Tuple[str, bool]] = {}
+        first_change = None
+
+        while not self._stop.is_set():
+            timeout = DEBOUNCE if first_change is not None else 1.0
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+
+            if readable:
+                try:
+                    self._read_events(changes, moved_from)
+                except OSError as e:
+                    # Typically the inotify watch limit; a full sync recovers
+                    print(f"Error reading filesystem events: {e}")
+                    changes.rescan = True
+                if first_change is None:
+                    first_change = time.monotonic()
+                if time.monotonic() - first_change < MAX_DELAY:
+                    continue
+
+            if first_change is not None:
+                self._flush_moves(changes, moved_from)
+                if changes:
+                    self._deliver(changes)
+                changes = ChangeSet()
+                first_change = None
+
+        os.close(self._fd)
+
+
+class PollingWatcher(_Watcher):
+    """
+    Portable fallback: re-lists directories whose mtime changed
+    Directory mtimes change when entries are added, removed or renamed, so
+    each cycle costs one stat per directory. Files rewritten in place are
+    not detected.
+    """
+
+    def __init__(self, *args, interval: float = POLL_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.interval = interval
+        # directory (relative) -> (mtime_ns, {image name: (mtime_ns, size)}, {subdirectory names})
+        self._snapshot: Dict[str, Tuple[int, Dict[str, Tuple[int, int]], Set[str]]] = {}
+
+    def _list(self, rel_dir: str):
+        images = {}
+        subdirs = set()
+        with os.scandir(os.path.join(self.root, rel_dir)) as entries:
+            for entry in entries:
+                if _is_ignored(entry.name, self.ignore):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.add(entry.name)
+                elif self._is_image(entry.name):
+                    stat = entry.stat()
+                    images[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return images, subdirs
+
+    def _scan_tree(self, rel_dir: str, changes: Optional[ChangeSet],
+                   appeared: Optional[Dict[str, Tuple[int, int]]] = None):
+        """Snapshot a directory tree, reporting its contents as new if asked"""
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            try:
+                mtime = os.stat(os.path.join(self.root, current)).st_mtime_ns
+                images, subdirs = self._list(current)
+            except OSError:
+                continue
+            self._snapshot[current] = (mtime, images, subdirs)
+            if changes is not None:
+                if current != rel_dir:
+                    changes.dirs_added.add(current)
+                for name, version in images.items():
+                    path = os.path.join(current, name) if current else name
+                    changes.upsert(path)
+                    appeared[path] = version
+            pending.extend(os.path.join(current, d) if current else d for d in subdirs)
+
+    def _forget_tree(self, rel_dir: str) -> Dict[str, Tuple[int, int]]:
+        """Drop a directory tree from the snapshot, returning the images it held"""
+        prefix = rel_dir + os.sep
+        vanished = {}
+        for directory in [d for d in self._snapshot if d == rel_dir or d.startswith(prefix)]:
+            for name, version in self._snapshot.pop(directory)[1].items():
+                vanished[os.path.join(directory, name)] = version
+        return vanished
+
+    @staticmethod
+    def _pair_moves(changes: ChangeSet, appeared: Dict[str, Tuple[int, int]],
+                    vanished: Dict[str, Tuple[int, int]]):
+        """
+        Polling cannot see renames: an image that vanished and one that
+        appeared with the same name, mtime and size are treated as a move
+        """
+        sources = {}
+        for path, version in vanished.items():
+            sources.setdefault((os.path.basename(path), version), []).append(path)
+        for path, version in appeared.items():
+            candidates = sources.get((os.path.basename(path), version))
+            if candidates:
+                source = candidates.pop()
+                changes.upserts.discard(path)
+                changes.deletes.discard(source)
+                changes.moves.append((source, path))
+
+    def _poll(self) -> ChangeSet:
+        changes = ChangeSet()
+        appeared: Dict[str, Tuple[int, int]] = {}
+        vanished: Dict[str, Tuple[int, int]] = {}
+        for rel_dir, (old_mtime, old_images, old_subdirs) in list(self._snapshot.items()):
+            if rel_dir not in self._snapshot:
+                continue  # removed earlier in this cycle
+            try:
+                mtime = os.stat(os.path.join(self.root, rel_dir)).st_mtime_ns
+                if mtime == old_mtime:
+                    continue
+                images, subdirs = self._list(rel_dir)
+            except OSError:
+                continue  # the parent reports the removal
+
+            self._snapshot[rel_dir] = (mtime, images, subdirs)
+            join = (lambda name: os.path.join(rel_dir, name)) if rel_dir else (lambda name: name)
+
+            for name, version in images.items():
+                if old_images.get(name) != version:
+                    changes.upsert(join(name))
+                    if name not in old_images:
+                        appeared[join(name)] = version
+            for name in old_images.keys() - images.keys():
+                changes.delete(join(name))
+                vanished[join(name)] = old_images[name]
+            for name in subdirs - old_subdirs:
+                changes.dirs_added.add(join(name))
+                self._scan_tree(join(name), changes, appeared)
+            for name in old_subdirs - subdirs:
+                changes.dirs_removed.add(join(name))
+                for path, version in self._forget_tree(join(name)).items():
+                    changes.delete(path)
+                    vanished[path] = version
+
+        self._pair_moves(changes, appeared, vanished)
+        return changes
+
+    def _run(self):
+        self._scan_tree('', None)
+        while not self._stop.wait(self.interval):
+            changes = self._poll()
+            if changes:
+                self._deliver(changes)
+
+
+def start_watcher(root: str, handler: Callable[[ChangeSet], None], extensions: Set[str],
+                  ignore: Set[str] = frozenset(), mode: str = 'auto',
+                  interval: float = POLL_INTERVAL) -> Optional[_Watcher]:
+    """
+    Start watching root and call handler with each batch of changes
+    mode: 'auto' (inotify when available, else polling), 'inotify', 'poll'
+    or 'off'. Returns the watcher, or None when disabled.
+    """
+    if mode == 'off' or not os.path.isdir(root):
+        return None
+
+    watcher = None
+    if mode in ('auto', 'inotify') and hasattr(select, 'select') and os.name == 'posix':
+        try:
+            watcher = InotifyWatcher(root, handler, extensions, set(ignore))
+            print(f"INFO: Watching {root} for changes (inotify)")
+        except (OSError, AttributeError) as e:
+            print(f"WARNING: inotify unavailable ({e}), falling back to polling")
+
+    if watcher is None:
+        watcher = PollingWatcher(root, handler, extensions, set(ignore), interval=interval)
+        print(f"INFO: Watching {root} for changes (polling every {interval}s)")
+
+    watcher.start()
+    return watcher
@@ -0,0 +1,87 @@
+"""
+Streaming ZIP writer for ComfyUI Gallery
+Produces an archive as a sequence of byte chunks so downloads start at once
+and server memory stays flat regardless of archive size
+"""
+
+import io
+import os
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+
+# Already-compressed formats gain next to nothing from DEFLATE
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.avif'}
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable sink that zipfile writes into
+    zipfile sees an unseekable file and switches to data descriptors, so
+    nothing is ever rewritten; the generator drains what has accumulated.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(name: str) -> int:
+    """Store image formats as-is, deflate everything else"""
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def stream_zip(entries: Iterable[Tuple[str, str]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Generate a ZIP archive from (file path, archive name) pairs
+    Entries that can't be read are skipped. ZIP64 records are used
+    automatically for large files, offsets past 4 GB and >65535 entries.
+    """
+    buffer = _StreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as zf:
+        for file_path, arcname in entries:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname, strict_timestamps=False)
+                source = open(file_path, 'rb')
+            except OSError as e:
+                print(f"Skipping {file_path} in ZIP: {e}")
+                continue
+
+            zinfo.compress_type = compress_type_for(arcname)
+            with source, zf.open(zinfo, 'w') as dest:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    # Central directory
+    yield buffer.drain()